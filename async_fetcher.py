@@ -0,0 +1,164 @@
+"""
+Async Fetch Module for De-PDF
+asyncio Level 2 fetch engine on httpx (HTTP/2 when h2 is installed) with the semantics of URLEnhancer.fetch_with_retry
+"""
+import os
+import asyncio
+import importlib.util
+import logging
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+from url_enhancer import URLEnhancer, BodyReader, RATE_LIMITER, URL_MAX_BODY_BYTES, DOWNLOAD_CHUNK_BYTES
+from domain_rules import DOMAIN_RULES
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 multiplexes concurrent conversions of one site over a single connection; it needs the h2 package
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+# Connections the engine keeps open across all hosts
+ASYNC_MAX_CONNECTIONS = int(os.environ.get('ASYNC_FETCH_MAX_CONNECTIONS', 200))
+
+
+def _accept_encoding() -> str:
+    """Content codings httpx can decode with the packages installed here (br: brotli, zstd: zstandard)"""
+    codings = []
+    if importlib.util.find_spec('zstandard') is not None:
+        codings.append('zstd')
+    if importlib.util.find_spec('brotli') is not None or importlib.util.find_spec('brotlicffi') is not None:
+        codings.append('br')
+    return ', '.join(codings + ['gzip', 'deflate'])
+
+
+ACCEPT_ENCODING = _accept_encoding()
+
+
+class AsyncURLFetcher:
+    """
+    One shared httpx.AsyncClient for every conversion running on an event loop, so a single
+    worker process can hold hundreds of concurrent URL conversions without a thread each.
+    Headers, domain delays, Retry-After handling, backoff, bot-wall detection, the body size cap
+    and sniffing, and the HTTP cache behave as in URLEnhancer; the domain rate limiter is the same
+    process-wide RATE_LIMITER, so sync and async fetches of a site queue together.
+
+        async with AsyncURLFetcher() as fetcher:
+            extracted = await fetcher.fetch_and_extract(url, HTTP_CACHE)
+    """
+
+    def __init__(self, max_connections: int = ASYNC_MAX_CONNECTIONS, http2: bool = HTTP2_AVAILABLE,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        # Like the pooled requests sessions, cookies are never kept between fetches
+        cookies = CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            transport=transport,  # None for the network; tests pass an httpx.MockTransport
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections // 4),
+            cookies=cookies,
+            follow_redirects=True,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self.client.aclose()
+
+    @staticmethod
+    async def _wait_turn(domain: str, interval: float, backoff: float = 0.0):
+        """Reserve the domain's next slot in the shared limiter and yield to the event loop until it is due"""
+        wait = RATE_LIMITER.reserve(domain, interval, backoff=backoff)
+        if wait > 0:
+            print(f"Queued {wait:.1f}s for {domain} (rate limit)...", flush=True)
+            await asyncio.sleep(wait)
+
+    async def _read_body(self, response: httpx.Response, check_document: bool) -> bytes:
+        reader = BodyReader(str(response.url), response.headers, URL_MAX_BODY_BYTES, check_document)
+        async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_BYTES):
+            reader.feed(chunk)
+        return reader.finish()
+
+    async def fetch_with_retry(self, url: str, max_retries: int = 3, timeout: int = 30,
+                               extra_headers: Optional[Dict[str, str]] = None) -> Tuple[httpx.Response, bytes]:
+        """Fetch URL with retry logic and exponential backoff: (response, body); the body is empty for a 304"""
+        headers, delay = URLEnhancer.get_enhanced_headers(url)
+        headers['Accept-Encoding'] = ACCEPT_ENCODING
+        if extra_headers:
+            headers.update(extra_headers)
+        domain = urlparse(url).netloc.lower()
+        backoff = 0.0
+
+        for attempt in range(max_retries):
+            try:
+                await self._wait_turn(domain, delay, backoff)
+
+                print(f"Making async request to {url} (attempt {attempt + 1}/{max_retries})...", flush=True)
+                request = self.client.build_request('GET', url, headers=headers, timeout=timeout)
+                response = await self.client.send(request, stream=True)
+                try:
+                    print(f"Response received: Status {response.status_code} ({response.http_version})", flush=True)
+                    if response.status_code == 304:
+                        return response, b''
+
+                    # Check for rate limiting
+                    if response.status_code == 429:
+                        retry_after = URLEnhancer.retry_after(response.headers)
+
+                        # Some sites (archive.ph) are better rendered with Puppeteer than waited out
+                        if DOMAIN_RULES.rule_for(url).render_on_rate_limit:
+                            raise Exception(f"Rate limited by {domain}. Level 3 integration required.")
+
+                        if attempt < max_retries - 1:
+                            print(f"Rate limited (429). Retrying in {retry_after}s as requested by server...", flush=True)
+                            RATE_LIMITER.block(domain, retry_after)
+                            backoff = 0.0
+                            continue
+                        raise Exception(f"Rate limited by server. Try again in {retry_after} seconds.")
+
+                    body = await self._read_body(response, check_document=response.is_success)
+                    print(f"Downloaded {len(body)} bytes", flush=True)
+                    URLEnhancer.check_bot_detection(response.status_code, response.headers, body)
+                    response.raise_for_status()
+                    return response, body
+                finally:
+                    await response.aclose()
+
+            except httpx.TimeoutException:
+                if attempt < max_retries - 1:
+                    backoff = URLEnhancer.backoff(attempt)  # Longer backoff
+                    print(f"Timeout on attempt {attempt + 1}, retrying in {backoff:.1f}s...")
+                else:
+                    raise
+
+            except httpx.HTTPError as e:
+                # Don't retry on 429, we already handled it above
+                if '429' in str(e):
+                    raise
+
+                if attempt < max_retries - 1:
+                    backoff = URLEnhancer.backoff(attempt)
+                    print(f"Request failed on attempt {attempt + 1}: {str(e)}, retrying in {backoff:.1f}s...")
+                else:
+                    raise
+
+    async def fetch_and_extract(self, url: str, cache=None) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """
+        Async URLEnhancer.fetch_and_extract: (text, title, author), or None when the page needs JavaScript.
+        Cache reads and parsing run in worker threads so they do not stall the other fetches on the loop.
+        """
+        # Cache entries are read from disk, so off the event loop
+        entry = await asyncio.to_thread(URLEnhancer.cached_entry, url, cache)
+        if entry is not None and cache.is_fresh(entry):
+            return URLEnhancer.cached_result(entry)
+        response, body = await self.fetch_with_retry(
+            url, extra_headers=cache.validators(entry) if cache is not None else None
+        )
+        return await asyncio.to_thread(
+            URLEnhancer.extract_response, url, response.status_code, response.headers, body, entry, cache
+        )
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""Benchmark document text extraction against document size
+
+Usage: python benchmark_extraction.py [page counts...]
+"""
+
+import sys
+import os
+import io
+import codecs
+import time
+import zipfile
+import resource
+from concurrent.futures import ProcessPoolExecutor
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pdf_extractor import PDFExtractor
+from docx_extractor import DOCXExtractor
+from html_extractor import HTMLExtractor
+
+SAMPLE_SENTENCE = "The quarterly report covers revenue, operating costs and the outlook for the next fiscal year"
+
+
+def make_sample_pdf(page_count, lines_per_page=45):
+    """Build a text-only PDF in memory (no PDF library required)"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Page tree, filled in once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page in range(page_count):
+        lines = [f"Page {page + 1} line {line + 1}: {SAMPLE_SENTENCE}." for line in range(lines_per_page)]
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({line}) '" for line in lines) + " ET"
+        stream = stream.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, page_count)
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        pdf += b"%010d 00000 n \n" % offset
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(pdf)
+
+
+DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="word/document.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+
+
+def make_sample_docx(page_count, paragraphs_per_page=45, table_rows_per_page=0):
+    """Build a DOCX in memory (no Word library required); tables are added after each page's paragraphs"""
+    body = []
+    for page in range(page_count):
+        for line in range(paragraphs_per_page):
+            body.append(f'<w:p><w:r><w:t>Page {page + 1} paragraph {line + 1}: {SAMPLE_SENTENCE}.</w:t></w:r></w:p>')
+        if table_rows_per_page:
+            rows = "".join(
+                f'<w:tr><w:tc><w:p><w:r><w:t>Item {row + 1}</w:t></w:r></w:p></w:tc>'
+                f'<w:tc><w:p><w:r><w:t>{SAMPLE_SENTENCE}</w:t></w:r></w:p></w:tc></w:tr>'
+                for row in range(table_rows_per_page)
+            )
+            body.append(f'<w:tbl>{rows}</w:tbl>')
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{"".join(body)}</w:body></w:document>'
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr('[Content_Types].xml', DOCX_CONTENT_TYPES)
+        docx.writestr('_rels/.rels', DOCX_RELS)
+        docx.writestr('word/document.xml', document)
+    return buffer.getvalue()
+
+
+def python_docx_text(source):
+    """The extractor DOCXExtractor replaced: python-docx object model, body paragraphs only"""
+    from docx import Document
+    doc = Document(io.BytesIO(source))
+    return "".join(paragraph.text + "\n" for paragraph in doc.paragraphs)
+
+
+def beautifulsoup_html_text(source):
+    """The extractor HTMLExtractor replaced: BeautifulSoup tree, decompose(), get_text()"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(source, 'lxml')
+    # Remove script and style elements
+    for script in soup(["script", "style"]):
+        script.decompose()
+    text = soup.get_text()
+    # Clean up text
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return '\n'.join(chunk for chunk in chunks if chunk)
+
+
+def make_sample_html(size_mb):
+    """A saved-web-page style document: heavy head, navigation, scripts and article markup"""
+    head = (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Sample page</title>'
+        + '<style>' + '.c { margin: 0 auto; padding: 4px; }\n' * 2000 + '</style>'
+        + '<script>' + 'var config = {"key": "value", "list": [1, 2, 3]};\n' * 2000 + '</script></head><body>'
+    )
+    block = (
+        '<nav><ul>' + ''.join(f'<li><a href="/s{i}">Section {i}</a></li>' for i in range(10)) + '</ul></nav>'
+        '<article><h2>Heading</h2><p>' + SAMPLE_SENTENCE + ' &amp; more, with <b>bold</b>  and <i>italic</i> text.</p>'
+        '<p>' + SAMPLE_SENTENCE + '.</p><script>track("view");</script>'
+        '<table><tr><td>Cell</td><td>Value</td></tr></table></article>\n'
+    )
+    body = block * max(1, int(size_mb * 1024 * 1024 / len(block)))
+    return (head + body + '</body></html>').encode('utf-8')
+
+
+def make_deep_html(size_mb, depth=40):
+    """
+    A page with no article/main markup: the story sits `depth` wrapper divs down, and every wrapper
+    level also carries a link-heavy sidebar, so text-density scoring has to find it
+    """
+    story_paragraph = '<p>' + SAMPLE_SENTENCE + ', with figures, quotes and analysis from the desk.</p>'
+    sidebar = '<div class="sidebar"><ul>' + ''.join(
+        f'<li><a href="/t{i}">Related story number {i} about the markets</a></li>' for i in range(8)
+    ) + '</ul></div>'
+    paragraphs = max(1, int(size_mb * 1024 * 1024 * 0.6 / len(story_paragraph)))
+    sidebars = max(1, int(size_mb * 1024 * 1024 * 0.4 / len(sidebar) / depth))
+    opening = ''.join(f'<div class="wrap-{level}">' + sidebar * sidebars for level in range(depth))
+    story = '<div class="story-text">' + story_paragraph * paragraphs + '</div>'
+    closing = '</div>' * depth
+    return ('<html><head><title>Deep page</title></head><body>' + opening + story + closing
+            + '</body></html>').encode('utf-8')
+
+
+def get_text_density_content(soup):
+    """The density fallback find_content_by_density replaced: get_text() on every div and section"""
+    main_content, max_text_length = None, 0
+    for element in soup.find_all(['div', 'section']):
+        text_length = len(element.get_text(strip=True))
+        if text_length > max_text_length:
+            max_text_length = text_length
+            main_content = element
+    return main_content
+
+
+def substring_js_required(html_content):
+    """The substring check JavaScriptDetector replaced: any framework name or 'noscript' anywhere in the page"""
+    indicators = [
+        'please enable javascript',
+        'javascript is required',
+        'this site requires javascript',
+        'noscript',
+        '__NEXT_DATA__',  # Next.js
+        '__NUXT__',       # Nuxt.js
+        'window.React',   # React apps
+        'ng-app',         # Angular
+    ]
+
+    lower_content = html_content.lower()
+    return any(indicator in lower_content for indicator in indicators)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchmark_parallel_pdf(page_counts):
+    workers = max(2, PDFExtractor.WORKERS)
+    print(f"\n=== PDF extraction (pdfplumber): sequential vs {workers} worker processes ===\n")
+    print(f"{'pages':>6} {'sequential':>12} {'parallel':>12} {'speedup':>8}")
+    for page_count in page_counts:
+        pdf = make_sample_pdf(page_count)
+        sequential, seq_time = timed(PDFExtractor.extract_pages, pdf, workers=1, backend='pdfplumber')
+        parallel, par_time = timed(PDFExtractor.extract_pages_parallel, pdf, workers, backend='pdfplumber')
+        assert sequential == parallel, "Parallel extraction changed the output"
+        print(f"{page_count:>6} {seq_time:>11.2f}s {par_time:>11.2f}s {seq_time / par_time:>7.2f}x")
+
+
+def benchmark_backends(page_counts):
+    print("\n=== PDF text backends: pdfplumber vs pdfium (single process) ===\n")
+    print(f"{'pages':>6} {'pdfplumber':>12} {'pdfium':>12} {'speedup':>8} {'same text':>10}")
+    for page_count in page_counts:
+        pdf = make_sample_pdf(page_count)
+        plumber, plumber_time = timed(PDFExtractor.extract_pages, pdf, workers=1, backend='pdfplumber')
+        fast, fast_time = timed(PDFExtractor.extract_pages, pdf, workers=1, backend='pdfium')
+        same = sum(1 for a, b in zip(plumber, fast) if a.split() == b.split())
+        print(f"{page_count:>6} {plumber_time:>11.2f}s {fast_time:>11.2f}s "
+              f"{plumber_time / fast_time:>7.1f}x {same:>5}/{page_count}")
+
+
+def _rss_growth(func, *args):
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    func(*args)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+
+
+def peak_memory_mb(func, *args):
+    """Growth of peak RSS while running func in a fresh process (covers libxml2's C allocations too)"""
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(_rss_growth, func, *args).result() / 1024
+
+
+def count_docx_blocks(source):
+    """Consume the streaming extractor without keeping the text, as the pipeline does"""
+    return sum(1 for _ in DOCXExtractor.iter_blocks(source))
+
+
+def benchmark_html(sizes_mb=(1, 5, 20)):
+    print("\n=== HTML upload extraction: BeautifulSoup vs lxml parser target ===\n")
+    print(f"{'size':>6} {'bs4':>10} {'lxml':>10} {'speedup':>8} {'same text':>10}")
+    for size_mb in sizes_mb:
+        html = make_sample_html(size_mb)
+        old, old_time = timed(beautifulsoup_html_text, html)
+        new, new_time = timed(HTMLExtractor.extract_text, html)
+        print(f"{size_mb:>4}MB {old_time:>9.2f}s {new_time:>9.2f}s {old_time / new_time:>7.1f}x {str(old == new):>10}")
+
+
+def benchmark_content_scoring(sizes_mb=(1, 2, 5), depth=40):
+    from bs4 import BeautifulSoup
+    from url_enhancer import URLEnhancer
+    print(f"\n=== URL main-content fallback, {depth}-deep pages: get_text() per div vs single-pass scoring ===\n")
+    print(f"{'size':>6} {'get_text':>10} {'scoring':>10} {'speedup':>8} {'old pick':>14} {'new pick':>14}")
+    for size_mb in sizes_mb:
+        soup = BeautifulSoup(make_deep_html(size_mb, depth), 'lxml')
+        old, old_time = timed(get_text_density_content, soup)
+        new, new_time = timed(URLEnhancer.find_content_by_density, soup)
+        print(f"{size_mb:>4}MB {old_time:>9.2f}s {new_time:>9.2f}s {old_time / new_time:>7.1f}x "
+              f"{old['class'][0]:>14} {new['class'][0]:>14}")
+
+
+def charset_fixtures(size_mb):
+    """(name, body, Content-Type, text) for the ways a fetched page does or does not declare its encoding"""
+    utf8 = make_sample_html(size_mb).replace(b'<meta charset="utf-8">', b'')
+    utf8 = utf8.replace(b'more, with', 'more, caf\u00e9 na\u00efve \u2014 with'.encode('utf-8'))
+    text = utf8.decode('utf-8')
+    cp1252 = text.encode('cp1252')
+    meta = '<meta charset="windows-1252">'
+    return [
+        ('header', utf8, 'text/html; charset=utf-8', text),
+        ('bom', codecs.BOM_UTF8 + utf8, 'text/html', text),
+        ('meta', meta.encode('ascii') + cp1252, 'text/html', meta + text),
+        ('utf-8 undeclared', utf8, '', text),
+        ('1252 undeclared', cp1252, '', text),
+    ]
+
+
+def requests_response_text(body, content_type):
+    """
+    What convert_url_stream used: requests' response.text. That is ISO-8859-1 for text/* without a charset,
+    and charset_normalizer over the whole body when the server sends no usable Content-Type
+    """
+    import requests
+    response = requests.Response()
+    response._content = body
+    if content_type:
+        response.headers['Content-Type'] = content_type
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    return response.text
+
+
+def benchmark_charset(sizes_mb=(1, 5)):
+    from url_enhancer import decode_body, resolve_encoding
+    print("\n=== URL page decoding: requests response.text vs resolve_encoding + one decode ===\n")
+    print(f"{'size':>6} {'page':>18} {'resolved':>18} {'response.text':>14} {'decode_body':>12} {'old right':>10} {'new right':>10}")
+    for size_mb in sizes_mb:
+        for name, body, content_type, text in charset_fixtures(size_mb):
+            headers = {'Content-Type': content_type}
+            encoding, source = resolve_encoding(body, headers)
+            old, old_time = timed(requests_response_text, body, content_type)
+            new, new_time = timed(decode_body, body, headers)
+            print(f"{size_mb:>4}MB {name:>18} {f'{encoding} ({source})':>18} {old_time:>13.3f}s {new_time:>11.3f}s "
+                  f"{str(old == text):>10} {str(new == text):>10}")
+
+
+def benchmark_docx(page_counts):
+    print("\n=== DOCX extraction: python-docx vs streaming iterparse ===\n")
+    print(f"{'pages':>6} {'python-docx':>12} {'iterparse':>12} {'speedup':>8} {'docx RSS':>10} {'stream RSS':>10}")
+    for page_count in page_counts:
+        docx = make_sample_docx(page_count)
+        old, old_time = timed(python_docx_text, docx)
+        new, new_time = timed(DOCXExtractor.extract_text, docx)
+        assert old == new, "Streaming extraction changed the paragraph text"
+        old_peak = peak_memory_mb(python_docx_text, docx)
+        new_peak = peak_memory_mb(count_docx_blocks, docx)
+        print(f"{page_count:>6} {old_time:>11.2f}s {new_time:>11.2f}s {old_time / new_time:>7.1f}x "
+              f"{old_peak:>8.1f}MB {new_peak:>8.1f}MB")
+
+
+if __name__ == "__main__":
+    page_counts = [int(arg) for arg in sys.argv[1:]] or [10, 50, 100, 300]
+    print(f"CPU cores available: {os.cpu_count()}")
+    benchmark_backends(page_counts)
+    benchmark_parallel_pdf(page_counts)
+    benchmark_docx(page_counts)
+    benchmark_html()
+    benchmark_content_scoring()
+    benchmark_charset()
@@ -0,0 +1,127 @@
+"""
+Pipelined Conversion Module for De-PDF
+Overlaps text extraction with Claude streaming by converting the document in parts
+"""
+import os
+import queue
+import threading
+from typing import Iterable, Iterator, Optional
+
+
+class ExtractionPipeline:
+    """Runs a text extractor in a background thread and hands its output out in chunks"""
+
+    # Characters that must be extracted before the first Claude call starts
+    FIRST_CHUNK_CHARS = int(os.environ.get('PIPELINE_FIRST_CHUNK_CHARS', 8000))
+
+    # Upper bound on the text sent in any one Claude call (the output cap is 8192 tokens)
+    CHUNK_CHARS = int(os.environ.get('PIPELINE_CHUNK_CHARS', 24000))
+
+    _DONE = object()
+
+    def __init__(self, pieces: Iterable[str], max_chars: int = 100000):
+        """
+        pieces: iterator yielding text incrementally (pages, paragraphs, ...)
+        max_chars: total extraction budget, matching the non-pipelined truncation
+        """
+        self.pieces = pieces
+        self.max_chars = max_chars
+        self.total_chars = 0
+        self.truncated = False
+        self._queue = queue.Queue()
+        self._error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> 'ExtractionPipeline':
+        self._thread.start()
+        return self
+
+    def close(self, timeout: float = 30.0):
+        """Stop the extractor thread after the piece it is working on and wait for it to exit"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            for piece in self.pieces:
+                if self._stop.is_set():
+                    break
+                if not piece:
+                    continue
+                remaining = self.max_chars - self.total_chars
+                if len(piece) > remaining:
+                    piece = piece[:remaining]
+                    self.truncated = True
+                if piece:
+                    self.total_chars += len(piece)
+                    self._queue.put(piece)
+                if self.truncated:
+                    break
+        except Exception as e:
+            self._error = e
+        finally:
+            self._queue.put(self._DONE)
+
+    def _next(self, block: bool) -> Optional[str]:
+        """Next extracted piece; "" if none is ready yet (non-blocking), None once extraction ended"""
+        try:
+            piece = self._queue.get(block=block)
+        except queue.Empty:
+            return ""
+        if piece is self._DONE:
+            self._queue.put(self._DONE)  # Keep the sentinel for later callers
+            if self._error is not None:
+                raise self._error
+            return None
+        return piece
+
+    def _split(self, buffer: str):
+        """Cut a chunk of at most CHUNK_CHARS off the buffer, preferably at a line break"""
+        if len(buffer) <= self.CHUNK_CHARS:
+            return buffer, ""
+        cut = buffer.rfind("\n", 0, self.CHUNK_CHARS) + 1 or self.CHUNK_CHARS
+        return buffer[:cut], buffer[cut:]
+
+    def chunks(self) -> Iterator[str]:
+        """
+        Yield text chunks for successive Claude calls.
+        The first chunk is released as soon as FIRST_CHUNK_CHARS are available; every later
+        chunk takes whatever was extracted while the previous call streamed, up to CHUNK_CHARS.
+        """
+        buffer = ""
+        wanted = self.FIRST_CHUNK_CHARS
+        done = False
+        while buffer or not done:
+            # Block until enough text for this call has arrived (or extraction ended)
+            while not done and len(buffer) < wanted:
+                piece = self._next(block=True)
+                if piece is None:
+                    done = True
+                else:
+                    buffer += piece
+            # Then take whatever else is already waiting, up to the per-call cap
+            while not done and len(buffer) < self.CHUNK_CHARS:
+                piece = self._next(block=False)
+                if piece is None:
+                    done = True
+                elif not piece:
+                    break
+                else:
+                    buffer += piece
+            # Once the budget is spent the extractor has stopped: take the rest of the queue now,
+            # so the notice lands on the last text chunk and never becomes a call of its own
+            while not done and self.truncated:
+                piece = self._next(block=True)
+                if piece is None:
+                    done = True
+                else:
+                    buffer += piece
+            chunk, buffer = self._split(buffer)
+            # The notice goes on the last chunk whole, never split off into a call of its own
+            if done and not buffer and self.truncated:
+                chunk += "\n\n[Article continues but was truncated due to length...]"
+            if chunk:
+                yield chunk
+            wanted = 1
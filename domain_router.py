@@ -0,0 +1,179 @@
+"""
+Domain Router Module for De-PDF
+Persisted per-domain fetch statistics used to pick the fetch level for a URL and to fail fast for failing domains
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ('level2', 'level3')
+
+
+class CircuitOpenError(Exception):
+    """The domain has failed repeatedly and is being skipped until its cool-down ends"""
+
+
+def _new_level() -> Dict:
+    return {'attempts': 0, 'successes': 0, 'success_rate': None, 'latency': None}
+
+
+def _new_entry() -> Dict:
+    return {
+        'levels': {level: _new_level() for level in LEVELS},
+        'routed_level3': 0,
+        'consecutive_failures': 0,
+        'open_until': 0.0,
+        'cooldown': 0.0,
+        'last_seen': 0.0,
+    }
+
+
+class DomainRouter:
+    """
+    Per-domain table of how each fetch level has fared: attempts, a moving success rate and
+    a moving latency of successful fetches. It is used to
+      - send domains where Level 2 keeps failing but Level 3 works straight to Puppeteer
+        (re-trying Level 2 every PROBE_EVERY conversions in case the site changed),
+      - shorten the hedge delay for domains whose Level 2 fetches are reliably fast,
+      - open a circuit breaker after FAILURE_THRESHOLD conversions in a row fail for site reasons;
+        while open, conversions of the domain fail fast, and the cool-down doubles on each re-trip.
+    The table is saved as JSON (`path`) after every conversion and survives restarts.
+    """
+
+    # Weight of the newest observation in the moving averages
+    SMOOTHING = 0.3
+
+    # Level 2 attempts needed before a domain can be routed straight to Level 3
+    MIN_SAMPLES = 3
+    LEVEL2_FAILING_RATE = 0.2
+    LEVEL3_WORKING_RATE = 0.5
+    PROBE_EVERY = 10
+
+    # Circuit breaker
+    FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5))
+    BASE_COOLDOWN = float(os.environ.get('CIRCUIT_COOLDOWN', 60))  # Seconds
+    MAX_COOLDOWN = 3600
+
+    MAX_DOMAINS = 2000
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._lock = threading.Lock()
+        self._domains = OrderedDict()  # domain -> entry, least recently seen first
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for domain, entry in sorted(json.load(f).items(), key=lambda item: item[1].get('last_seen', 0)):
+                        self._domains[domain] = entry
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable domain routing table {path}: {e}")
+
+    def _entry(self, domain: str) -> Dict:
+        entry = self._domains.pop(domain, None) or _new_entry()
+        entry['last_seen'] = time.time()
+        self._domains[domain] = entry
+        while len(self._domains) > self.MAX_DOMAINS:
+            self._domains.popitem(last=False)
+        return entry
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            # Write to a temp file first so a crash never leaves a truncated table
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._domains, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save domain routing table: {e}")
+
+    def check_circuit(self, domain: str):
+        """Raise CircuitOpenError while the domain's breaker is open"""
+        with self._lock:
+            entry = self._domains.get(domain)
+            remaining = entry['open_until'] - time.time() if entry else 0
+        if remaining > 0:
+            raise CircuitOpenError(
+                f"{domain} has been failing repeatedly; not retrying it for another {remaining:.0f} seconds."
+            )
+
+    def preferred_level(self, domain: str) -> str:
+        """'level3' for domains where Level 2 keeps failing and Puppeteer works, otherwise 'level2'"""
+        with self._lock:
+            entry = self._entry(domain)
+            level2, level3 = entry['levels']['level2'], entry['levels']['level3']
+            if (level2['attempts'] >= self.MIN_SAMPLES and level2['success_rate'] < self.LEVEL2_FAILING_RATE
+                    and level3['success_rate'] is not None and level3['success_rate'] >= self.LEVEL3_WORKING_RATE):
+                entry['routed_level3'] += 1
+                if entry['routed_level3'] % self.PROBE_EVERY:
+                    return 'level3'
+            return 'level2'
+
+    def hedge_delay(self, domain: str, default: float) -> float:
+        """Twice the domain's usual Level 2 latency (at least 1s), when Level 2 is reliable there; else `default`"""
+        with self._lock:
+            entry = self._domains.get(domain)
+            level2 = entry['levels']['level2'] if entry else None
+        if level2 and level2['latency'] is not None and (level2['success_rate'] or 0) >= 0.5:
+            return min(default, max(1.0, 2 * level2['latency']))
+        return default
+
+    def record_level(self, domain: str, level: str, success: bool, seconds: float):
+        """Record how one fetch level did for a conversion (cancelled losers are not recorded)"""
+        with self._lock:
+            stats = self._entry(domain)['levels'][level]
+            stats['attempts'] += 1
+            stats['successes'] += int(success)
+            rate = stats['success_rate']
+            stats['success_rate'] = float(success) if rate is None else rate + self.SMOOTHING * (success - rate)
+            if success:
+                latency = stats['latency']
+                stats['latency'] = seconds if latency is None else latency + self.SMOOTHING * (seconds - latency)
+
+    def record_outcome(self, domain: str, success: bool, site_failure: bool = False):
+        """
+        Close the breaker after a successful conversion; count failures caused by the site itself
+        (see hedged_fetch.is_site_failure) and trip the breaker at the threshold
+        """
+        with self._lock:
+            entry = self._entry(domain)
+            if success:
+                entry['consecutive_failures'] = 0
+                entry['cooldown'] = 0.0
+                entry['open_until'] = 0.0
+            elif site_failure:
+                entry['consecutive_failures'] += 1
+                if entry['consecutive_failures'] >= self.FAILURE_THRESHOLD:
+                    entry['cooldown'] = min(self.MAX_COOLDOWN, entry['cooldown'] * 2 or self.BASE_COOLDOWN)
+                    entry['open_until'] = time.time() + entry['cooldown']
+                    print(f"Circuit opened for {domain} for {entry['cooldown']:.0f}s "
+                          f"after {entry['consecutive_failures']} failures", flush=True)
+            self._save()
+
+    def stats(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            return {
+                domain: {
+                    'levels': {
+                        level: {
+                            'attempts': stats['attempts'],
+                            'successes': stats['successes'],
+                            'success_rate': None if stats['success_rate'] is None else round(stats['success_rate'], 3),
+                            'latency_seconds': None if stats['latency'] is None else round(stats['latency'], 3),
+                        }
+                        for level, stats in entry['levels'].items()
+                    },
+                    'consecutive_failures': entry['consecutive_failures'],
+                    'circuit_open_for_seconds': round(max(0.0, entry['open_until'] - now), 1),
+                }
+                for domain, entry in self._domains.items()
+            }
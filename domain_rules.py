@@ -0,0 +1,206 @@
+"""
+Domain Rules Module for De-PDF
+Per-domain extraction rules loaded from domain_rules.json, compiled once and matched to hosts with a suffix trie
+"""
+import os
+import json
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import soupsieve
+
+logger = logging.getLogger(__name__)
+
+DOMAIN_RULES_FILE = os.environ.get(
+    'DOMAIN_RULES_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'domain_rules.json')
+)
+
+FETCH_LEVELS = ('level2', 'level3')
+
+# What every page gets; a domain rule's fields are tried before (content) or added to (strip) these,
+# and the config file's "default" entry can replace any of them
+DEFAULT_RULE = {
+    # Main content, in order of preference; the first that matches is used
+    'content': ['article', 'main', '[role="main"]', '.article-content', '.post-content', '.entry-content',
+                '.content', '#content', '.story-body', '.article-body'],
+    # Removed before the content is looked for
+    'strip': ['script', 'style', 'noscript', 'header', 'footer', 'nav', 'aside', 'form'],
+    # Where the title and author are; <meta> elements give their content attribute, others their text
+    'title': ['title'],
+    'author': ['meta[name="author"]', 'meta[property="article:author"]'],
+    # 'level3' sends the domain straight to Puppeteer
+    'fetch_level': None,
+    # Level 3: selector to wait for after the page loads, and for how long (ms)
+    'wait_for': None,
+    'wait_timeout': 10000,
+    # Level 3: browser profile used to render the domain
+    'browser': {
+        'user_agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) '
+                      'Chrome/122.0.0.0 Safari/537.36',
+        'viewport': {'width': 1920, 'height': 1080},
+        'headers': {},
+    },
+    # Go to Puppeteer on a 429 instead of waiting out the Retry-After
+    'render_on_rate_limit': False,
+    # Re-extract the rendered HTML with these rules when Puppeteer's own text is thin
+    'html_fallback': False,
+}
+
+# What a Puppeteer render removes and where it looks for content when no domain rule says otherwise.
+# A content entry may be a selector list: the first element in document order matching any of it wins
+RENDER_STRIP = ['script, style, noscript, iframe, object, embed, form, button, input, select, textarea']
+RENDER_CONTENT = ['article, main, [role="main"], .article-content, .post-content, .entry-content, .content, '
+                  '#content, .story-body, #CONTENT', 'div#CONTENT', 'div.CONTENT']
+
+Selectors = Tuple[Tuple[str, soupsieve.SoupSieve], ...]
+
+
+def _compile(selectors: List[str], source: str) -> Selectors:
+    try:
+        return tuple((selector, soupsieve.compile(selector)) for selector in selectors)
+    except soupsieve.SelectorSyntaxError as e:
+        raise ValueError(f"Invalid selector in domain rule for {source}: {e}") from e
+
+
+class DomainRule:
+    """One domain's rules merged over the defaults, with every selector compiled"""
+
+    def __init__(self, hosts: List[str], fields: Dict, default: Optional['DomainRule'] = None):
+        source = ', '.join(hosts) or 'default'
+        fields = {name: value for name, value in fields.items() if name != 'hosts'}
+        unknown = set(fields) - set(DEFAULT_RULE)
+        if unknown:
+            raise ValueError(f"Unknown fields in domain rule for {source}: {sorted(unknown)}")
+        base = default.fields if default is not None else DEFAULT_RULE
+        merged = dict(base, **fields)
+        if default is not None:
+            # Site selectors go first; the generic ones stay as a fallback
+            content = fields.get('content', [])
+            merged['content'] = content + [selector for selector in base['content'] if selector not in content]
+            strip = fields.get('strip', [])
+            merged['strip'] = base['strip'] + [selector for selector in strip if selector not in base['strip']]
+            merged['browser'] = dict(base['browser'], **fields.get('browser', {}))
+        if merged['fetch_level'] not in (None,) + FETCH_LEVELS:
+            raise ValueError(f"fetch_level for {source} must be one of {FETCH_LEVELS}")
+
+        self.hosts = hosts
+        self.fields = merged
+        # Changes whenever the rule does, so cached extractions made under an older rule are not reused
+        self.version = hashlib.sha256(json.dumps(merged, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        # The site's own selectors, which a Puppeteer render adds to its baseline ones
+        self.site_content = list(fields.get('content', [])) if default is not None else []
+        self.site_strip = list(fields.get('strip', [])) if default is not None else []
+        self.content = _compile(merged['content'], source)
+        self.strip = _compile(merged['strip'], source)
+        # All strip selectors as one selector list, so stripping is a single pass over the tree
+        self._strip_all = _compile([', '.join(merged['strip'])], source)[0][1] if merged['strip'] else None
+        self.title = _compile(merged['title'], source)
+        self.author = _compile(merged['author'], source)
+        self.fetch_level = merged['fetch_level']
+        self.wait_for = merged['wait_for']
+        self.wait_timeout = merged['wait_timeout']
+        self.browser = merged['browser']
+        self.render_on_rate_limit = merged['render_on_rate_limit']
+        self.html_fallback = merged['html_fallback']
+
+    @property
+    def content_selectors(self) -> List[str]:
+        return [selector for selector, _ in self.content]
+
+    @property
+    def strip_selectors(self) -> List[str]:
+        return [selector for selector, _ in self.strip]
+
+    def render_selectors(self) -> Tuple[List[str], List[str]]:
+        """
+        (strip, content) selectors for a Puppeteer render: the render baseline, with the site's own
+        strip selectors added and its content selectors tried first
+        """
+        content = self.site_content + [selector for selector in RENDER_CONTENT if selector not in self.site_content]
+        return RENDER_STRIP + self.site_strip, content
+
+    @staticmethod
+    def _first(selectors: Selectors, soup):
+        for _, compiled in selectors:
+            element = compiled.select_one(soup)
+            if element is not None:
+                return element
+        return None
+
+    def find_content(self, soup):
+        """The main content element, or None"""
+        return self._first(self.content, soup)
+
+    def strip_boilerplate(self, soup):
+        if self._strip_all is not None:
+            for element in self._strip_all.select(soup):
+                element.decompose()
+
+    def _value(self, selectors: Selectors, soup) -> Optional[str]:
+        element = self._first(selectors, soup)
+        if element is None:
+            return None
+        if element.name == 'meta':
+            return element.get('content')
+        return element.get_text(strip=True)
+
+    def metadata(self, soup) -> Tuple[Optional[str], Optional[str]]:
+        """(title, author)"""
+        return self._value(self.title, soup), self._value(self.author, soup)
+
+
+class DomainRules:
+    """
+    The rules of every configured domain, in a trie keyed by host labels from the TLD down.
+    A rule for example.com applies to example.com and all its subdomains; the longest match wins.
+    Hosts without a rule get the default one.
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        config = config or {}
+        self.default = DomainRule([], config.get('default', {}))
+        self._trie = {}
+        self.count = 0
+        for fields in config.get('domains', []):
+            hosts = [host.lower().strip('.') for host in fields.get('hosts', [])]
+            if not hosts:
+                raise ValueError(f"Domain rule without hosts: {fields}")
+            rule = DomainRule(hosts, fields, self.default)
+            for host in hosts:
+                node = self._trie
+                for label in reversed(host.split('.')):
+                    node = node.setdefault(label, {})
+                node[None] = rule
+            self.count += 1
+
+    @classmethod
+    def load(cls, path: str) -> 'DomainRules':
+        """Rules from a JSON file; a missing or unreadable file leaves only the defaults"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except FileNotFoundError:
+            return cls()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable domain rules file {path}: {e}")
+            return cls()
+        return cls(config)
+
+    def find(self, host: str) -> Optional[DomainRule]:
+        """The rule configured for the host (or a parent domain), or None"""
+        node, found = self._trie, None
+        for label in reversed((host or '').lower().rstrip('.').split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
+    def rule_for(self, url: str) -> DomainRule:
+        """The rule for a URL's host, or the default rule"""
+        return self.find(urlparse(url).hostname or '') or self.default
+
+
+DOMAIN_RULES = DomainRules.load(DOMAIN_RULES_FILE)
@@ -1,49 +1,191 @@
 from flask import Flask, request, jsonify, Response
+from werkzeug.exceptions import RequestEntityTooLarge
 import anthropic
-import pdfplumber
-from docx import Document
-from bs4 import BeautifulSoup
 import os
 import json
-import io
 import sys
 import requests
 from url_enhancer import URLEnhancer
+from pdf_extractor import PDFExtractor
+from pdf_markdown import PDFMarkdownConverter
+from docx_extractor import DOCXExtractor
+from docx_markdown import DOCXMarkdownConverter
+from html_extractor import HTMLExtractor
+from conversion_pipeline import ExtractionPipeline
+from upload_spool import SpoolingRequest, SpooledUpload, MAX_CONTENT_LENGTH
+from extraction_cache import ExtractionCache
 
 app = Flask(__name__)
 
+# Uploads are written straight to temp files; oversized bodies are rejected while being read
+app.request_class = SpoolingRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+
 # Get data directory from environment or use default
 DATA_DIR = os.environ.get('ELECTRON_DATA_DIR', os.path.dirname(os.path.abspath(__file__)))
 API_KEY_FILE = os.path.join(DATA_DIR, 'api_key.json')
 
+# Convert long uploads in parts while extraction is still running (see conversion_pipeline.py)
+PIPELINED_CONVERSION = os.environ.get('PIPELINED_CONVERSION', '').lower() in ('1', 'true', 'yes')
+
+# Most document text sent to Claude in one conversion
+MAX_TEXT_CHARS = 100000  # Increased limit for Claude 4
+
+# Bump when a change alters the text the HTML extractor produces (invalidates cached extractions)
+HTML_EXTRACTOR_VERSION = 1
+
+# Extracted text of recent uploads, keyed by content hash, so re-uploads skip straight to Claude
+EXTRACTION_CACHE = ExtractionCache(
+    os.path.join(DATA_DIR, 'extraction_cache'),
+    max_bytes=int(os.environ.get('EXTRACTION_CACHE_MAX_MB', 256)) * 1024 * 1024
+)
+
 def extract_text_from_pdf(file_content):
-    """Extract text from PDF file"""
-    text = ""
-    with pdfplumber.open(io.BytesIO(file_content)) as pdf:
-        for page in pdf.pages:
-            text += page.extract_text() or ""
-    return text
+    """Extract text from PDF file (long documents are split across worker processes)"""
+    return PDFExtractor.extract_text(file_content)
+
+def iter_text_from_docx(file_content):
+    """Yield DOCX paragraphs and table rows in document order (accepts bytes or a file path)"""
+    return DOCXExtractor.iter_text(file_content)
 
 def extract_text_from_docx(file_content):
     """Extract text from DOCX file"""
-    doc = Document(io.BytesIO(file_content))
-    text = ""
-    for paragraph in doc.paragraphs:
-        text += paragraph.text + "\n"
-    return text
+    return "".join(iter_text_from_docx(file_content))
 
 def extract_text_from_html(file_content):
-    """Extract text from HTML file"""
-    soup = BeautifulSoup(file_content, 'lxml')
-    # Remove script and style elements
-    for script in soup(["script", "style"]):
-        script.decompose()
-    text = soup.get_text()
-    # Clean up text
-    lines = (line.strip() for line in text.splitlines())
-    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-    text = '\n'.join(chunk for chunk in chunks if chunk)
-    return text
+    """Extract text from HTML file (bytes, path or binary file object) in one lxml pass"""
+    return HTMLExtractor.extract_text(file_content)
+
+def extract_text_from_upload(upload, filename, pages=None):
+    """
+    Extract text from a spooled upload based on its extension, going through the extraction cache.
+    pages: PDF page texts already read by the local Markdown check, reused instead of re-extracting
+    Returns: (text, skipped_pages), or None for unsupported file types
+    """
+    if filename.endswith('.pdf'):
+        # Stop parsing pages once there is enough text for the prompt
+        version = f"pdf-{PDFExtractor.cache_version()}-{MAX_TEXT_CHARS}"
+        extract = lambda: PDFExtractor.extract_text_with_budget(upload.path, MAX_TEXT_CHARS, pages=pages)
+    elif filename.endswith(('.doc', '.docx')):
+        version = f"docx-{DOCXExtractor.VERSION}"
+        extract = lambda: (extract_text_from_docx(upload.path), 0)
+    elif filename.endswith(('.html', '.htm')):
+        version = f"html-{HTML_EXTRACTOR_VERSION}"
+        def extract():
+            with open(upload.path, 'rb') as f:
+                return extract_text_from_html(f), 0
+    else:
+        return None
+    return EXTRACTION_CACHE.get_or_extract(upload.sha256(), version, extract)
+
+def convert_pdf_locally(upload):
+    """
+    Local Markdown for a PDF with a clean text layer, or None to fall back to Claude.
+    The outcome is cached under the upload's hash, so a re-uploaded PDF is not checked again.
+    Returns: (markdown, pages) - pages are the text-layer pages the check read, for the fallback extraction
+    """
+    key = EXTRACTION_CACHE.make_key(upload.sha256(), f"pdf-markdown-{PDFMarkdownConverter.cache_version()}")
+    cached = EXTRACTION_CACHE.get(key)
+    if cached is not None:
+        return cached['markdown'], None
+    markdown, pages = PDFMarkdownConverter.convert_if_clean(upload.path)
+    EXTRACTION_CACHE.put(key, {'markdown': markdown})
+    return markdown, pages
+
+def build_conversion_prompt(text, part=1):
+    """Build the Markdown conversion prompt; parts after the first continue a pipelined conversion"""
+    continuation = ""
+    if part > 1:
+        continuation = f"""This is part {part} of a longer document that is being converted in sequence.
+Continue the Markdown conversion where the previous part ended: do not repeat the title or add an introduction.
+
+"""
+    return f"""{continuation}Convert the following article text to Markdown format.
+
+IMPORTANT: This is a FORMAT CONVERSION, not a summary. Include EVERY sentence.
+
+CRITICAL INSTRUCTIONS:
+1. Fix OCR errors (e.g., "technolo y" -> "technology", "LLiisstteenn" -> "Listen")
+2. Use proper Markdown formatting (# for main title, ## for sections, etc.)
+3. Include ALL paragraphs and sentences - do not skip anything
+4. Remove only obvious website UI elements (like "https://www.bloomberg.com/..." URLs)
+5. Keep author names, dates, and all article content
+6. DO NOT stop early or say "Content continues" - include the ENTIRE article
+7. DO NOT be lazy - convert the COMPLETE text provided
+8. If the text is long, that's fine - use all 8192 tokens if needed
+
+Article text:
+
+{text}"""
+
+def build_cleanup_prompt(markdown):
+    """Prompt for the optional Claude pass over Markdown that was already converted locally"""
+    return f"""Tidy up the following Markdown, which was converted automatically from a Word document.
+
+IMPORTANT: This is a CLEANUP pass, not a summary. Keep EVERY sentence.
+
+INSTRUCTIONS:
+1. Keep the existing headings, lists, tables, links and emphasis unless they are clearly wrong
+2. Fix formatting artifacts (stray emphasis markers, body text styled as headings, lists split apart)
+3. DO NOT add, remove, reorder or reword content
+4. Reply with the Markdown only
+
+Markdown:
+
+{markdown}"""
+
+def stream_local_markdown(markdown):
+    """Stream a locally converted document in the same event format as a Claude response"""
+    print(f"Streaming local Markdown conversion ({len(markdown)} chars, no Claude call)", flush=True)
+    for line in markdown.splitlines(keepends=True):
+        yield f"data: {json.dumps({'chunk': line})}\n\n"
+    yield f"data: {json.dumps({'done': True})}\n\n"
+
+def stream_pipelined_conversion(api_key, pipeline):
+    """Stream the conversion of a document that is still being extracted, one Claude call per part"""
+    try:
+        client = anthropic.Anthropic(api_key=api_key)
+        part = 0
+        total_text = ""
+        for chunk in pipeline.chunks():
+            if not chunk.strip():
+                continue
+            part += 1
+            print(f"Starting Claude Opus 4 streaming response for part {part} "
+                  f"({len(chunk)} chars, {pipeline.total_chars} extracted so far)...", flush=True)
+            if part > 1:
+                separator = "\n\n"
+                yield f"data: {json.dumps({'chunk': separator})}\n\n"
+            
+            stream = client.messages.create(
+                model="claude-opus-4-20250514",
+                max_tokens=8192,
+                temperature=0,
+                messages=[{"role": "user", "content": build_conversion_prompt(chunk, part)}],
+                stream=True
+            )
+            
+            for event in stream:
+                if event.type == "content_block_delta":
+                    total_text += event.delta.text
+                    yield f"data: {json.dumps({'chunk': event.delta.text})}\n\n"
+        
+        if part == 0:
+            yield f"data: {json.dumps({'error': 'Could not extract text from file'})}\n\n"
+            return
+        
+        if pipeline.truncated:
+            print(f"Text truncated to {MAX_TEXT_CHARS} characters", flush=True)
+        print(f"Pipelined streaming complete: {part} parts, {pipeline.total_chars} chars extracted, {len(total_text)} chars streamed", flush=True)
+        yield f"data: {json.dumps({'done': True})}\n\n"
+    
+    except Exception as e:
+        import traceback
+        print(f"Error in pipelined streaming: {str(e)}", flush=True)
+        print(f"Traceback: {traceback.format_exc()}", flush=True)
+        yield f"data: {json.dumps({'error': str(e)})}\n\n"
+    finally:
+        pipeline.close()
 
 @app.route('/check-api-key')
 def check_api_key():
@@ -68,6 +210,11 @@ def reset_api_key():
         os.remove(API_KEY_FILE)
     return jsonify({'success': True})
 
+@app.route('/cache-stats')
+def cache_stats():
+    """Hit/miss counters and size of the extraction cache"""
+    return jsonify(EXTRACTION_CACHE.stats())
+
 @app.route('/convert-stream', methods=['POST'])
 def convert_stream():
     """Stream the conversion response"""
@@ -91,22 +238,59 @@ def convert_stream():
                 mimetype='text/event-stream'
             )
         
-        file_content = file.read()
-        filename = file.filename.lower()
+        # Stream the upload to a temp file instead of holding it in memory
+        upload = SpooledUpload(file)
+        filename = upload.filename.lower()
         
-        # Extract text based on file type
-        print(f"Extracting text from {filename}...", flush=True)
+        # Born-digital PDFs with a clean text layer are converted locally, skipping Claude entirely
+        pdf_pages = None
         if filename.endswith('.pdf'):
-            text = extract_text_from_pdf(file_content)
-        elif filename.endswith(('.doc', '.docx')):
-            text = extract_text_from_docx(file_content)
-        elif filename.endswith(('.html', '.htm')):
-            text = extract_text_from_html(file_content)
+            try:
+                markdown, pdf_pages = convert_pdf_locally(upload)
+            except BaseException:
+                # Corrupt or encrypted PDFs must not leave their spool file behind
+                upload.cleanup()
+                raise
+            if markdown is not None:
+                upload.cleanup()
+                return Response(stream_local_markdown(markdown), mimetype='text/event-stream')
+        
+        build_prompt = build_conversion_prompt
+        
+        # Word files carry their own structure: styles, numbering and runs map straight to Markdown
+        if filename.endswith('.docx') and DOCXMarkdownConverter.MODE != 'off':
+            print(f"Converting {filename} to Markdown locally...", flush=True)
+            with upload:
+                markdown = DOCXMarkdownConverter.convert(upload.path)
+            if DOCXMarkdownConverter.MODE != 'cleanup' and markdown.strip():
+                return Response(stream_local_markdown(markdown), mimetype='text/event-stream')
+            # Optional cleanup pass: Claude only tidies the locally converted Markdown
+            extracted = (markdown, 0)
+            build_prompt = build_cleanup_prompt
+        
+        # Pipelined mode: start converting while the rest of the document is still being extracted
+        elif PIPELINED_CONVERSION and filename.endswith(('.pdf', '.doc', '.docx')):
+            print(f"Extracting text from {filename} (pipelined)...", flush=True)
+            if filename.endswith('.pdf'):
+                pieces = PDFExtractor.iter_pages(upload.path)
+            else:
+                pieces = iter_text_from_docx(upload.path)
+            pipeline = ExtractionPipeline(pieces, MAX_TEXT_CHARS).start()
+            response = Response(stream_pipelined_conversion(api_key, pipeline), mimetype='text/event-stream')
+            response.call_on_close(upload.cleanup)  # Runs after the stream (and extractor thread) finish
+            return response
+        
         else:
+            # Extract text based on file type
+            print(f"Extracting text from {filename} ({upload.size} bytes)...", flush=True)
+            with upload:
+                extracted = extract_text_from_upload(upload, filename, pdf_pages)
+        if extracted is None:
             return Response(
                 f"data: {json.dumps({'error': 'Unsupported file type'})}\n\n",
                 mimetype='text/event-stream'
             )
+        text, skipped_pages = extracted
         
         if not text.strip():
             return Response(
@@ -117,10 +301,20 @@ def convert_stream():
         print(f"Extracted {len(text)} characters", flush=True)
         
         # Truncate if too long to prevent token limits
-        if len(text) > 100000:  # Increased limit for Claude 4
-            text = text[:100000] + "\n\n[Article continues but was truncated due to length...]"
-            print("Text truncated to 100000 characters", flush=True)
+        if len(text) > MAX_TEXT_CHARS or skipped_pages:
+            if skipped_pages:
+                notice = f"[Article continues but was truncated due to length - the last {skipped_pages} pages were not extracted...]"
+            else:
+                notice = "[Article continues but was truncated due to length...]"
+            text = text[:MAX_TEXT_CHARS] + "\n\n" + notice
+            print(f"Text truncated to {MAX_TEXT_CHARS} characters", flush=True)
         
+    except RequestEntityTooLarge:
+        limit_mb = MAX_CONTENT_LENGTH // (1024 * 1024)
+        return Response(
+            f"data: {json.dumps({'error': f'File is too large (maximum upload size is {limit_mb} MB)'})}\n\n",
+            mimetype='text/event-stream'
+        )
     except Exception as e:
         import traceback
         print(f"Error processing request: {str(e)}", flush=True)
@@ -145,23 +339,7 @@ def convert_stream():
                 messages=[
                     {
                         "role": "user",
-                        "content": f"""Convert the following article text to Markdown format.
-
-IMPORTANT: This is a FORMAT CONVERSION, not a summary. Include EVERY sentence.
-
-CRITICAL INSTRUCTIONS:
-1. Fix OCR errors (e.g., "technolo y" -> "technology", "LLiisstteenn" -> "Listen")
-2. Use proper Markdown formatting (# for main title, ## for sections, etc.)
-3. Include ALL paragraphs and sentences - do not skip anything
-4. Remove only obvious website UI elements (like "https://www.bloomberg.com/..." URLs)
-5. Keep author names, dates, and all article content
-6. DO NOT stop early or say "Content continues" - include the ENTIRE article
-7. DO NOT be lazy - convert the COMPLETE text provided
-8. If the text is long, that's fine - use all 8192 tokens if needed
-
-Article text:
-
-{text}"""
+                        "content": build_prompt(text)
                     }
                 ],
                 stream=True
@@ -251,9 +429,9 @@ def convert_url_stream():
         print(f"Extracted {len(text)} characters", flush=True)
         
         # Truncate if too long to prevent token limits
-        if len(text) > 100000:  # Increased limit for Claude 4
-            text = text[:100000] + "\n\n[Article continues but was truncated due to length...]"
-            print("Text truncated to 100000 characters", flush=True)
+        if len(text) > MAX_TEXT_CHARS:
+            text = text[:MAX_TEXT_CHARS] + "\n\n[Article continues but was truncated due to length...]"
+            print(f"Text truncated to {MAX_TEXT_CHARS} characters", flush=True)
         
     except requests.RequestException as e:
         import traceback
@@ -287,23 +465,7 @@ def convert_url_stream():
                 messages=[
                     {
                         "role": "user",
-                        "content": f"""Convert the following article text to Markdown format.
-
-IMPORTANT: This is a FORMAT CONVERSION, not a summary. Include EVERY sentence.
-
-CRITICAL INSTRUCTIONS:
-1. Fix OCR errors (e.g., "technolo y" -> "technology", "LLiisstteenn" -> "Listen")
-2. Use proper Markdown formatting (# for main title, ## for sections, etc.)
-3. Include ALL paragraphs and sentences - do not skip anything
-4. Remove only obvious website UI elements (like "https://www.bloomberg.com/..." URLs)
-5. Keep author names, dates, and all article content
-6. DO NOT stop early or say "Content continues" - include the ENTIRE article
-7. DO NOT be lazy - convert the COMPLETE text provided
-8. If the text is long, that's fine - use all 8192 tokens if needed
-
-Article text:
-
-{text}"""
+                        "content": build_conversion_prompt(text)
                     }
                 ],
                 stream=True
@@ -0,0 +1,343 @@
+"""
+PDF Extraction Module for De-PDF
+Per-page text extraction with pluggable backends and an optional process pool for long documents
+"""
+import io
+import os
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple, Union
+
+import pdfplumber
+
+from ocr_handler import OCRHandler, OCRSession, POOL_CONTEXT
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # Installed with pdfplumber, but keep working without it
+    pdfium = None
+
+logger = logging.getLogger(__name__)
+
+# A PDF can be handed over as raw upload bytes or as a path on disk (e.g. a spooled upload)
+PDFSource = Union[bytes, str]
+
+
+def _open_pdf(source: PDFSource):
+    """Open a PDF from bytes or a filesystem path"""
+    if isinstance(source, (bytes, bytearray)):
+        return pdfplumber.open(io.BytesIO(source))
+    return pdfplumber.open(source)
+
+
+def looks_garbled(text: str, max_bad_ratio: float = 0.05) -> bool:
+    """True if page text is empty or full of replacement, control or private-use characters"""
+    if not text or not text.strip():
+        return True
+    bad = 0
+    for char in text:
+        code = ord(char)
+        if char == '\ufffd' or (code < 32 and char not in '\n\r\t') or 0xE000 <= code <= 0xF8FF:
+            bad += 1
+    return bad > len(text) * max_bad_ratio
+
+
+class PdfplumberBackend:
+    """Full pdfminer layout analysis - slow, but the most faithful reading order"""
+
+    name = 'pdfplumber'
+
+    def __init__(self, source: PDFSource, low_memory: bool = False):
+        self.pdf = _open_pdf(source)
+        self.low_memory = low_memory
+
+    def __len__(self) -> int:
+        return len(self.pdf.pages)
+
+    def page_text(self, index: int) -> str:
+        page = self.pdf.pages[index]
+        try:
+            return page.extract_text() or ""
+        finally:
+            # pdf.pages keeps every Page alive; drop its parsed layout and object caches now
+            page.close()
+            if self.low_memory:
+                # Also forget pdfminer's parsed objects - shared fonts/resources get re-read per page.
+                # These are pdfminer internals, so a release that renames them just keeps its caches
+                for cache in (getattr(self.pdf.doc, '_cached_objs', None), getattr(self.pdf.doc, '_parsed_objs', None)):
+                    if cache is not None:
+                        cache.clear()
+
+    def close(self):
+        self.pdf.close()
+
+
+class PdfiumBackend:
+    """PDFium's native text layer - an order of magnitude faster than pdfplumber"""
+
+    name = 'pdfium'
+
+    def __init__(self, source: PDFSource, low_memory: bool = False):
+        self.pdf = pdfium.PdfDocument(source)  # Pages and text pages are closed after every read
+
+    def __len__(self) -> int:
+        return len(self.pdf)
+
+    def page_text(self, index: int) -> str:
+        page = self.pdf[index]
+        try:
+            textpage = page.get_textpage()
+            try:
+                text = textpage.get_text_range()
+            finally:
+                textpage.close()
+        finally:
+            page.close()
+        # Match pdfplumber's output: plain newlines, no soft-hyphen markers, no trailing line break
+        return text.replace('\r\n', '\n').replace('\r', '\n').replace('\ufffe', '').rstrip('\n')
+
+    def close(self):
+        self.pdf.close()
+
+
+BACKENDS = {
+    PdfiumBackend.name: PdfiumBackend,
+    PdfplumberBackend.name: PdfplumberBackend,
+}
+
+
+class PageReader:
+    """Reads page text with the chosen backend, re-extracting bad pages with pdfplumber"""
+
+    def __init__(self, source: PDFSource, backend: str, low_memory: bool = False):
+        if backend not in BACKENDS or (backend == PdfiumBackend.name and pdfium is None):
+            logger.warning(f"PDF backend '{backend}' is not available, using pdfplumber")
+            backend = PdfplumberBackend.name
+        self.source = source
+        self.low_memory = low_memory
+        self.backend = BACKENDS[backend](source, low_memory)
+        self._fallback = None
+        self.fallback_pages = 0
+
+    def __len__(self) -> int:
+        return len(self.backend)
+
+    def page_text(self, index: int) -> str:
+        text = self.backend.page_text(index)
+        if isinstance(self.backend, PdfplumberBackend) or not looks_garbled(text):
+            return text
+
+        # The fast engine came back empty or garbled - let pdfplumber try this page
+        if self._fallback is None:
+            self._fallback = PdfplumberBackend(self.source, self.low_memory)
+        self.fallback_pages += 1
+        return self._fallback.page_text(index) or text
+
+    def close(self):
+        self.backend.close()
+        if self._fallback is not None:
+            logger.info(f"{self.fallback_pages} page(s) re-extracted with pdfplumber")
+            self._fallback.close()
+
+    def __enter__(self) -> 'PageReader':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# Each pool worker opens the PDF once, in the initializer, and reuses it for every range it is given
+_worker_reader = None
+
+
+def _init_worker(source: PDFSource, backend: str, low_memory: bool):
+    global _worker_reader
+    _worker_reader = PageReader(source, backend, low_memory)
+
+
+def _extract_worker_range(start: int, stop: int) -> List[str]:
+    return [_worker_reader.page_text(i) for i in range(start, stop)]
+
+
+class PDFExtractor:
+    """Extracts plain text from PDFs, sequentially or across a process pool"""
+
+    # Bump whenever a change alters the extracted text (invalidates cached extractions)
+    VERSION = 1
+
+    # Text engine: 'pdfium' (fast, falls back to pdfplumber per page) or 'pdfplumber'
+    BACKEND = os.environ.get('PDF_TEXT_BACKEND', PdfiumBackend.name).lower()
+
+    # Worker processes used for parallel extraction (1 disables the pool)
+    WORKERS = int(os.environ.get('PDF_EXTRACT_WORKERS', min(4, os.cpu_count() or 1)))
+
+    # Also drop pdfminer's shared object cache after every page: flat memory on 1,000+ page
+    # documents at the cost of re-parsing fonts and resources
+    LOW_MEMORY = os.environ.get('PDF_LOW_MEMORY', '').lower() in ('1', 'true', 'yes')
+
+    # Below this page count the pool start-up costs more than it saves
+    PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', 24))
+
+    # Pages per pool task when extracting against a character budget
+    BUDGET_BATCH_PAGES = 8
+
+    @classmethod
+    def cache_version(cls) -> str:
+        """Identifies everything that shapes the extracted text, for the extraction cache"""
+        return f"{cls.VERSION}-{cls.BACKEND}-{'ocr' if OCRHandler.available() else 'no-ocr'}"
+
+    @classmethod
+    def page_count(cls, source: PDFSource) -> int:
+        """Return the number of pages without extracting any text"""
+        with PageReader(source, cls.BACKEND) as reader:
+            return len(reader)
+
+    @staticmethod
+    def split_pages(page_count: int, parts: int) -> List[Tuple[int, int]]:
+        """Split [0, page_count) into at most `parts` contiguous, near-equal ranges"""
+        parts = max(1, min(parts, page_count))
+        size, extra = divmod(page_count, parts)
+        ranges = []
+        start = 0
+        for i in range(parts):
+            stop = start + size + (1 if i < extra else 0)
+            ranges.append((start, stop))
+            start = stop
+        return ranges
+
+    @classmethod
+    def extract_pages(cls, source: PDFSource, workers: Optional[int] = None,
+                      backend: Optional[str] = None, max_chars: Optional[int] = None) -> List[str]:
+        """
+        Extract page texts in page order.
+        With max_chars, pages stop being opened and parsed once that many characters are
+        collected, so the result may cover only the first pages of the document.
+        """
+        workers = cls.WORKERS if workers is None else workers
+        backend = backend or cls.BACKEND
+
+        pages = None
+        with PageReader(source, backend, cls.LOW_MEMORY) as reader:
+            page_count = len(reader)
+            if workers <= 1 or page_count < cls.PARALLEL_MIN_PAGES:
+                pages = []
+                chars = 0
+                for index in range(page_count):
+                    if max_chars is not None and chars >= max_chars:
+                        break
+                    pages.append(reader.page_text(index))
+                    chars += len(pages[-1])
+
+        if pages is None:
+            pages = cls.extract_pages_parallel(source, workers, page_count, backend, max_chars)
+
+        # Pages without a text layer (scans) go to OCR; everything else keeps the cheap path.
+        # OCR text counts against the budget too, so scans past it are dropped rather than OCRed
+        return OCRHandler.fill_image_only_pages(source, pages, max_chars)
+
+    @classmethod
+    def extract_pages_parallel(cls, source: PDFSource, workers: int, page_count: Optional[int] = None,
+                               backend: Optional[str] = None, max_chars: Optional[int] = None) -> List[str]:
+        """
+        Extract pages across a process pool, in page order.
+        Without a budget every worker gets one contiguous page range; with max_chars the pages are
+        handed out in small batches and no further batches are started once the budget is reached.
+        """
+        backend = backend or cls.BACKEND
+        if page_count is None:
+            page_count = cls.page_count(source)
+        if page_count == 0:
+            return []
+
+        if max_chars is None:
+            ranges = cls.split_pages(page_count, workers)
+        else:
+            batch = cls.BUDGET_BATCH_PAGES
+            ranges = [(start, min(start + batch, page_count)) for start in range(0, page_count, batch)]
+        workers = min(workers, len(ranges))
+        print(f"Extracting up to {page_count} pages with {workers} worker processes...", flush=True)
+
+        pages = []
+        chars = 0
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT, initializer=_init_worker,
+                                   initargs=(source, backend, cls.LOW_MEMORY))
+        try:
+            pending = deque()
+            remaining = iter(ranges)
+            while True:
+                # Keep every worker busy, with one range queued behind it
+                while len(pending) < workers * 2:
+                    next_range = next(remaining, None)
+                    if next_range is None:
+                        break
+                    pending.append(pool.submit(_extract_worker_range, *next_range))
+                if not pending:
+                    break
+                batch_pages = pending.popleft().result()  # Consumed in submission order
+                pages.extend(batch_pages)
+                chars += sum(len(text) for text in batch_pages)
+                if max_chars is not None and chars >= max_chars:
+                    break
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+        return pages
+
+    @classmethod
+    def iter_pages(cls, source: PDFSource, backend: Optional[str] = None) -> Iterator[str]:
+        """Yield page texts one at a time, in page order, as they are extracted"""
+        # Pages are OCRed one at a time as they come up, so a single worker is enough
+        with PageReader(source, backend or cls.BACKEND, cls.LOW_MEMORY) as reader, \
+                OCRSession(source, workers=1) as ocr:
+            for index in range(len(reader)):
+                text = reader.page_text(index)
+                if OCRHandler.lacks_text(text) and OCRHandler.available() and ocr.is_image_only(index):
+                    text = ocr.ocr([index])[index]
+                yield text
+
+    @classmethod
+    def extract_text(cls, source: PDFSource, workers: Optional[int] = None,
+                     backend: Optional[str] = None) -> str:
+        """Extract the text of the whole document"""
+        return "".join(cls.extract_pages(source, workers, backend))
+
+    @classmethod
+    def extract_text_with_budget(cls, source: PDFSource, max_chars: int, workers: Optional[int] = None,
+                                 backend: Optional[str] = None, pages: Optional[List[str]] = None) -> Tuple[str, int]:
+        """
+        Extract text until max_chars is reached without parsing the rest of the document.
+        pages: text-layer page texts already read from this PDF with the default backend (e.g. by the
+        local Markdown check) - they are used instead of extracting again; only the OCR pass still runs.
+        Returns: (text, skipped_pages) - text may be slightly longer than max_chars
+        """
+        if pages is None:
+            page_count = cls.page_count(source)
+            pages = cls.extract_pages(source, workers, backend, max_chars=max_chars)
+        else:
+            page_count = len(pages)
+            kept = 0
+            chars = 0
+            while kept < page_count and chars < max_chars:
+                chars += len(pages[kept])
+                kept += 1
+            pages = OCRHandler.fill_image_only_pages(source, pages[:kept], max_chars)
+        skipped_pages = page_count - len(pages)
+        if skipped_pages:
+            print(f"Character budget reached after {len(pages)} of {page_count} pages, "
+                  f"skipped {skipped_pages}", flush=True)
+        return "".join(pages), skipped_pages
+
+    @classmethod
+    def extract_text_with_offsets(cls, source: PDFSource, workers: Optional[int] = None,
+                                  backend: Optional[str] = None) -> Tuple[str, List[int]]:
+        """
+        Extract the whole document, joining the page texts once.
+        Returns: (text, page_offsets) - page_offsets[i] is where page i starts in text
+        """
+        pages = cls.extract_pages(source, workers, backend)
+        page_offsets = []
+        offset = 0
+        for page_text in pages:
+            page_offsets.append(offset)
+            offset += len(page_text)
+        return "".join(pages), page_offsets
@@ -0,0 +1,264 @@
+"""
+PDF Markdown Module for De-PDF
+Deterministic PDF to Markdown conversion from font sizes and weights, used instead of Claude
+for born-digital PDFs whose text layer is already clean
+"""
+import os
+import re
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from pdf_extractor import PDFExtractor, PageReader, PDFSource, _open_pdf
+from ocr_handler import OCRHandler
+
+logger = logging.getLogger(__name__)
+
+BULLET_RE = re.compile(r'^[•●○◦▪▫■□‣⁃∙·*\-–—]\s+(.*)$')
+NUMBERED_RE = re.compile(r'^(\d{1,3}|[a-z])[.)]\s+(.*)$')
+SENTENCE_END_RE = re.compile(r'[.!?:;"”)\]]$')
+WORD_RE = re.compile(r'\S+')
+
+
+def _is_bold(fontname: str) -> bool:
+    name = fontname.lower()
+    return any(weight in name for weight in ('bold', 'black', 'heavy', 'semibold', 'demi'))
+
+
+class PDFMarkdownConverter:
+    """Scores a PDF's text layer and, when it is clean, converts it to Markdown without an LLM"""
+
+    # Bump whenever a change alters the decision or the Markdown (invalidates cached conversions)
+    VERSION = 2
+
+    # auto: convert locally when the text layer passes the quality check
+    # always: convert every PDF locally; off: always use Claude
+    MODE = os.environ.get('LOCAL_PDF_MARKDOWN', 'auto').lower()
+
+    # Longer documents go to Claude (the local pass reads every char of every page)
+    MAX_PAGES = int(os.environ.get('LOCAL_MARKDOWN_MAX_PAGES', 60))
+
+    # Highest share of damaged-looking words a text layer may have and still skip the LLM
+    MAX_GARBLE_SCORE = float(os.environ.get('LOCAL_MARKDOWN_MAX_GARBLE', 0.02))
+
+    # Share of pages that must carry a real text layer (the rest are blank or scans)
+    MIN_TEXT_PAGE_RATIO = 0.9
+
+    # This many single letters in a row are a word split into stray glyphs; shorter runs are
+    # ordinary text ("x and y", "option b")
+    MIN_LETTER_RUN = 3
+
+    # Lines this much larger than body text are headings
+    HEADING_SIZE_RATIO = 1.15
+    MAX_HEADING_CHARS = 120
+
+    @classmethod
+    def cache_version(cls) -> str:
+        """Identifies everything that shapes the decision and the Markdown, for the extraction cache"""
+        return (f"{cls.VERSION}-{cls.MODE}-{cls.MAX_PAGES}-{cls.MAX_GARBLE_SCORE}-"
+                f"{PDFExtractor.cache_version()}")
+
+    @classmethod
+    def garble_score(cls, text: str) -> float:
+        """
+        Share of words that look like extraction damage, from 0 (clean) to 1.
+        Counts replacement characters, doubled-glyph words ("LLiisstteenn"), words split
+        into runs of stray letters ("t e c h n o l o g y") and tokens that are mostly symbols.
+        """
+        words = WORD_RE.findall(text)
+        if not words:
+            return 1.0
+        bad = 0
+        letter_run = 0
+        for word in words:
+            core = word.strip('.,;:!?()[]{}"\'“”‘’')
+            if len(core) == 1 and core.isalpha():
+                letter_run += 1
+                # The whole run counts once it is long enough, then every further letter in it
+                if letter_run == cls.MIN_LETTER_RUN:
+                    bad += letter_run
+                elif letter_run > cls.MIN_LETTER_RUN:
+                    bad += 1
+                continue
+            letter_run = 0
+            if not core:
+                continue
+            if '�' in core:
+                bad += 1
+            elif len(core) >= 4 and len(core) % 2 == 0 and core[::2] == core[1::2] and core.isalpha():
+                bad += 1
+            elif len(core) > 3 and sum(c.isalnum() for c in core) < len(core) / 2:
+                bad += 1
+        return bad / len(words)
+
+    @classmethod
+    def check_text_layer(cls, source: PDFSource) -> Tuple[bool, str, Optional[List[str]]]:
+        """
+        Decide whether the PDF can skip the LLM: (clean, reason, pages).
+        pages are the text-layer page texts that were read, or None if the check stopped before reading them
+        """
+        with PageReader(source, PDFExtractor.BACKEND, PDFExtractor.LOW_MEMORY) as reader:
+            page_count = len(reader)
+            if page_count == 0:
+                return False, "no pages", None
+            if page_count > cls.MAX_PAGES:
+                return False, f"{page_count} pages is over the local limit of {cls.MAX_PAGES}", None
+            pages = [reader.page_text(index) for index in range(page_count)]
+
+        text_pages = sum(1 for text in pages if not OCRHandler.lacks_text(text))
+        if text_pages < page_count * cls.MIN_TEXT_PAGE_RATIO:
+            return False, f"only {text_pages}/{page_count} pages have a text layer", pages
+        score = cls.garble_score("\n".join(pages))
+        if score > cls.MAX_GARBLE_SCORE:
+            return False, f"garble score {score:.3f} is over {cls.MAX_GARBLE_SCORE}", pages
+        return True, f"garble score {score:.3f}", pages
+
+    @staticmethod
+    def _read_lines(source: PDFSource) -> List[List[Dict]]:
+        """Text lines of every page with their dominant font size and weight"""
+        pages = []
+        with _open_pdf(source) as pdf:
+            for page in pdf.pages:
+                try:
+                    lines = []
+                    for line in page.extract_text_lines(return_chars=True):
+                        chars = [c for c in line['chars'] if c['text'].strip()]
+                        if not chars:
+                            continue
+                        sizes = sorted(round(c['size'], 1) for c in chars)
+                        lines.append({
+                            'text': line['text'].strip(),
+                            'size': sizes[len(sizes) // 2],
+                            'bold': sum(_is_bold(c['fontname']) for c in chars) >= len(chars) * 0.6,
+                            'top': line['top'],
+                            'bottom': line['bottom'],
+                        })
+                    pages.append(lines)
+                finally:
+                    page.close()
+        return pages
+
+    @staticmethod
+    def _drop_running_lines(pages: List[List[Dict]]) -> List[List[Dict]]:
+        """Remove headers and footers repeated at the top or bottom of most pages"""
+        if len(pages) < 3:
+            return pages
+        normalize = lambda text: re.sub(r'\d+', '#', text.lower())
+        edges = Counter()
+        for lines in pages:
+            for line in (lines[:1] + lines[-1:] if len(lines) > 1 else lines):
+                edges[normalize(line['text'])] += 1
+        running = {text for text, count in edges.items() if count >= max(3, len(pages) // 2)}
+        if not running:
+            return pages
+        return [
+            [line for position, line in enumerate(lines)
+             if not ((position == 0 or position == len(lines) - 1) and normalize(line['text']) in running)]
+            for lines in pages
+        ]
+
+    @classmethod
+    def _heading_levels(cls, pages: List[List[Dict]]) -> Tuple[float, Dict[float, int], int]:
+        """Body font size, {larger size: heading level} and the level used for bold body-size lines"""
+        weights = Counter()
+        for lines in pages:
+            for line in lines:
+                weights[line['size']] += len(line['text'])
+        body_size = weights.most_common(1)[0][0] if weights else 0
+        larger = sorted(
+            {line['size'] for lines in pages for line in lines
+             if line['size'] >= body_size * cls.HEADING_SIZE_RATIO and len(line['text']) <= cls.MAX_HEADING_CHARS},
+            reverse=True
+        )[:3]
+        levels = {size: level for level, size in enumerate(larger, start=1)}
+        return body_size, levels, min(len(larger) + 1, 4)
+
+    @classmethod
+    def _heading_level(cls, line: Dict, levels: Dict[float, int], bold_level: int) -> int:
+        if len(line['text']) > cls.MAX_HEADING_CHARS:
+            return 0
+        if line['size'] in levels:
+            return levels[line['size']]
+        if line['bold'] and not SENTENCE_END_RE.search(line['text']):
+            return bold_level
+        return 0
+
+    @staticmethod
+    def _append_line(text: str, line: str) -> str:
+        """Join a wrapped line onto a paragraph, undoing end-of-line hyphenation"""
+        if not text:
+            return line
+        if text.endswith('-') and len(text) > 1 and text[-2].isalpha() and line[:1].islower():
+            return text[:-1] + line
+        return text + " " + line
+
+    @classmethod
+    def convert(cls, source: PDFSource) -> str:
+        """Convert a PDF with a clean text layer to Markdown"""
+        pages = cls._drop_running_lines(cls._read_lines(source))
+        body_size, levels, bold_level = cls._heading_levels(pages)
+        max_gap = body_size * 0.8
+
+        blocks = []  # [kind, text, level] with kind in heading / bullet / ordered / paragraph
+        previous = None
+        for lines in pages:
+            for line in lines:
+                text = line['text']
+                same_page = previous is not None and line['top'] >= previous['top']
+                gap = line['top'] - previous['bottom'] if same_page else None
+                level = cls._heading_level(line, levels, bold_level)
+                bullet = BULLET_RE.match(text)
+                numbered = NUMBERED_RE.match(text)
+                current = blocks[-1] if blocks else None
+
+                if level:
+                    # A heading wrapped over several lines stays one heading
+                    if current and current[0] == 'heading' and current[2] == level and gap is not None and gap <= max_gap:
+                        current[1] = cls._append_line(current[1], text)
+                    else:
+                        blocks.append(['heading', text, level])
+                elif bullet:
+                    blocks.append(['bullet', '- ' + bullet.group(1), 0])
+                elif numbered:
+                    marker = numbered.group(1)
+                    if marker.isdigit():
+                        blocks.append(['ordered', marker + '. ' + numbered.group(2), 0])
+                    else:
+                        blocks.append(['bullet', '- ' + numbered.group(2), 0])
+                elif current and current[0] != 'heading' and (
+                        (gap is not None and gap <= max_gap)
+                        # Paragraphs running over a page break continue mid-sentence
+                        or (gap is None and not SENTENCE_END_RE.search(current[1]) and text[:1].islower())):
+                    current[1] = cls._append_line(current[1], text)
+                else:
+                    blocks.append(['paragraph', text, 0])
+                previous = line
+
+        markdown = []
+        for index, (kind, text, level) in enumerate(blocks):
+            if kind == 'heading':
+                text = '#' * level + ' ' + text
+            elif kind == 'paragraph' and text.startswith('#'):
+                text = '\\' + text
+            # Consecutive items of the same list type form one list; everything else gets a blank line
+            joiner = "\n" if kind in ('bullet', 'ordered') and blocks[index - 1][0] == kind else "\n\n"
+            markdown.append((joiner if markdown else "") + text)
+        return "".join(markdown) + "\n"
+
+    @classmethod
+    def convert_if_clean(cls, source: PDFSource) -> Tuple[Optional[str], Optional[List[str]]]:
+        """
+        Markdown for PDFs that do not need the LLM pass, or None to fall back to Claude.
+        Returns: (markdown, pages) - when falling back, pages are the text-layer page texts the
+        quality check already read (or None), for PDFExtractor.extract_text_with_budget to reuse
+        """
+        if cls.MODE == 'off':
+            return None, None
+        if cls.MODE != 'always':
+            clean, reason, pages = cls.check_text_layer(source)
+            if not clean:
+                print(f"Local Markdown conversion skipped: {reason}", flush=True)
+                return None, pages
+            print(f"Text layer is clean ({reason}) - converting locally", flush=True)
+        markdown = cls.convert(source)
+        return (markdown, None) if markdown.strip() else (None, None)
@@ -0,0 +1,234 @@
+"""
+Hedged Fetch Module for De-PDF
+Races Level 2 (plain HTTP) against Level 3 (Puppeteer) for URL conversions and keeps whichever finishes first
+"""
+import os
+import queue
+import threading
+import time
+import logging
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from url_enhancer import URLEnhancer, ParsedDocument
+from puppeteer_handler import PuppeteerHandler
+from domain_router import DomainRouter
+from domain_rules import DOMAIN_RULES
+
+logger = logging.getLogger(__name__)
+
+# Level 2 errors that mean the page has to be rendered (bot walls, rate limits)
+LEVEL3_TRIGGERS = ("Cloudflare", "CAPTCHA", "Level 3", "429", "403", "Rate limited")
+
+# Queued by a Level 2 fetch when its request leaves the rate-limit queue
+LEVEL2_SENT = 'level2-sent'
+
+# (text, title, author)
+Extracted = Tuple[str, Optional[str], Optional[str]]
+
+
+class Level3Error(Exception):
+    """Puppeteer could not render the page"""
+
+
+def is_site_failure(error: Exception) -> bool:
+    """
+    Errors that say the site itself is failing (unreachable, timing out, 5xx, cannot be rendered),
+    as opposed to a problem with one URL (404, not a web page, too large)
+    """
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, Level3Error)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code >= 500
+    return False
+
+
+def fetch_level3(url: str, cancel: Optional[threading.Event] = None) -> Extracted:
+    """Render the page with Puppeteer; thin renders are re-extracted from the HTML when the domain rule asks"""
+    logger.info(f"Using Puppeteer for {url}")
+    html_content, text, title, author = PuppeteerHandler.fetch_with_js_sync(url, cancel)
+
+    # Some sites (archive.ph) need their own content selectors applied to the rendered HTML
+    if DOMAIN_RULES.rule_for(url).html_fallback:
+        if not text or len(text.strip()) < 100:
+            # Try extracting from HTML as fallback (parsed straight from the rendered text, no re-encoding)
+            text, title_alt, author_alt = URLEnhancer.extract_text_enhanced(ParsedDocument(html_content, url), url)
+            if not title:
+                title = title_alt
+            if not author:
+                author = author_alt
+    return text, title, author
+
+
+class HedgedFetcher:
+    """
+    Level 2 runs first; if it has not produced usable content `delay` seconds after its request
+    was sent (time queued behind the domain's rate limit does not count), a Puppeteer
+    render is started alongside it and the first acceptable result wins. The loser is cancelled
+    (the render's Chromium is killed, the HTTP download stops at its next chunk).
+    Level 3 also starts straight away when Level 2 reports a JavaScript page or a bot wall.
+    Domains the DomainRouter knows need JavaScript, or whose domain rule says so, start at Level 3,
+    falling back to Level 2.
+    Win counts per level are kept for /fetch-stats.
+    """
+
+    # URL_HEDGING=0 restores strictly sequential Level 2 then Level 3
+    ENABLED = os.environ.get('URL_HEDGING', '1').lower() not in ('0', 'false', 'no', 'off')
+
+    # Seconds Level 2 gets before a Puppeteer render is started in parallel
+    DELAY = float(os.environ.get('URL_HEDGE_DELAY', 5.0))
+
+    _lock = threading.Lock()
+    _stats = {
+        'conversions': 0,
+        'hedged': 0,  # Conversions where both levels ran at the same time
+        'wins': {'level2': 0, 'level3': 0},
+        'hedged_wins': {'level2': 0, 'level3': 0},
+    }
+
+    @classmethod
+    def _record(cls, winner: str, hedged: bool):
+        with cls._lock:
+            cls._stats['conversions'] += 1
+            cls._stats['wins'][winner] += 1
+            if hedged:
+                cls._stats['hedged'] += 1
+                cls._stats['hedged_wins'][winner] += 1
+
+    @classmethod
+    def stats(cls) -> Dict:
+        """Win counts per level, and win rates among conversions where both levels raced"""
+        with cls._lock:
+            stats = {
+                'enabled': cls.ENABLED,
+                'delay_seconds': cls.DELAY,
+                'conversions': cls._stats['conversions'],
+                'hedged': cls._stats['hedged'],
+                'wins': dict(cls._stats['wins']),
+                'hedged_wins': dict(cls._stats['hedged_wins']),
+            }
+        hedged = stats['hedged']
+        stats['hedged_win_rates'] = {
+            level: round(wins / hedged, 3) if hedged else None for level, wins in stats['hedged_wins'].items()
+        }
+        return stats
+
+    @staticmethod
+    def _run(results: queue.Queue, level: str, work):
+        started = time.monotonic()
+        try:
+            value, error = work(), None
+        except Exception as e:
+            value, error = None, e
+        results.put((level, value, error, time.monotonic() - started))
+
+    @classmethod
+    def fetch(cls, url: str, cache=None, router: Optional[DomainRouter] = None) -> Tuple[str, Extracted]:
+        """
+        Fetch and extract a URL: (winning level, (text, title, author)).
+        With a DomainRouter, domains with an open circuit fail fast with CircuitOpenError, domains
+        known to need JavaScript start at Level 3, and each level's result is recorded.
+        Domains whose rule in domain_rules.json sets fetch_level start at that level.
+        Raises Level3Error when the page needed rendering and Puppeteer failed, or the Level 2
+        error when Level 2 failed for another reason and no render succeeded.
+        """
+        domain = (urlparse(url).hostname or '').lower()
+        # A domain rule can require a level; otherwise the router's statistics decide
+        required = DOMAIN_RULES.rule_for(url).fetch_level
+        if router is None:
+            return cls._race(url, cache, required or 'level2', cls.DELAY, None, domain)
+        router.check_circuit(domain)
+        first = required or router.preferred_level(domain)
+        try:
+            result = cls._race(url, cache, first, router.hedge_delay(domain, cls.DELAY), router, domain)
+        except Exception as e:
+            router.record_outcome(domain, success=False, site_failure=is_site_failure(e))
+            raise
+        router.record_outcome(domain, success=True)
+        return result
+
+    @classmethod
+    def _race(cls, url: str, cache, first: str, delay: float, router: Optional[DomainRouter],
+              domain: str) -> Tuple[str, Extracted]:
+        results = queue.Queue()
+        cancel = {'level2': threading.Event(), 'level3': threading.Event()}
+        sent = threading.Event()
+
+        def level2_sent():
+            # The hedge clock starts when the request leaves the domain's rate-limit queue, not before
+            if not sent.is_set():
+                sent.set()
+                results.put((LEVEL2_SENT, None, None, 0.0))
+
+        work = {
+            'level2': lambda: URLEnhancer.fetch_and_extract(url, cache, cancel['level2'], level2_sent),
+            'level3': lambda: fetch_level3(url, cancel['level3']),
+        }
+        started = set()
+        running = set()
+
+        def start(level: str, reason: str):
+            print(reason, flush=True)
+            started.add(level)
+            running.add(level)
+            threading.Thread(target=cls._run, args=(results, level, work[level]), daemon=True).start()
+
+        if first == 'level3':
+            start('level3', f"{domain} usually needs JavaScript - starting with Puppeteer for {url}...")
+        else:
+            start('level2', f"Attempting Level 2 fetch for {url}...")
+        hedged = False
+        level2_error = None
+        level3_error = None
+
+        hedge_at = None  # When Puppeteer joins the race, counted from when Level 2's request was sent
+
+        while running:
+            # Only a Level 2 fetch is hedged; a Level 3 render is never raced by a plain fetch
+            timeout = None
+            if cls.ENABLED and started == {'level2'} and hedge_at is not None:
+                timeout = max(0.0, hedge_at - time.monotonic())
+            try:
+                level, value, error, seconds = results.get(timeout=timeout)
+            except queue.Empty:
+                start('level3', f"Level 2 has not finished {delay:.1f}s after its request was sent (hedging). "
+                                f"Starting Puppeteer.")
+                hedged = True
+                continue
+            if level == LEVEL2_SENT:
+                hedge_at = time.monotonic() + delay
+                continue
+            running.discard(level)
+            if router is not None:
+                router.record_level(domain, level, error is None and value is not None, seconds)
+
+            if error is None and value is not None:
+                other = 'level3' if level == 'level2' else 'level2'
+                cancel[other].set()
+                if router is not None and other == 'level2' and 'level2' in running:
+                    # A Level 2 fetch that lost the race counts against Level 2 for this domain
+                    router.record_level(domain, 'level2', False, delay + seconds)
+                cls._record(level, hedged)
+                return level, value
+
+            if level == 'level2':
+                if error is not None:
+                    print(f"Level 2 fetch failed: {str(error)}", flush=True)
+                    if not any(keyword in str(error) for keyword in LEVEL3_TRIGGERS):
+                        level2_error = error
+                        if 'level3' not in started:
+                            raise error
+                if 'level3' not in started:
+                    start('level3', "JavaScript required or minimal content. Starting Puppeteer." if error is None
+                          else "Bot detection or rate limit detected. Starting Puppeteer.")
+            else:
+                logger.error(f"Puppeteer failed for {url}: {str(error)}")
+                level3_error = error
+                if 'level2' not in started:
+                    start('level2', f"Falling back to a Level 2 fetch for {url}...")
+
+        if level2_error is not None:
+            raise level2_error
+        raise Level3Error(str(level3_error))
@@ -0,0 +1,179 @@
+"""
+HTML Extraction Module for De-PDF
+Extracts the text of uploaded HTML pages in a single lxml parse, without building a document tree
+"""
+import codecs
+import re
+import logging
+from typing import BinaryIO, Iterator, List, Optional, Union
+
+from lxml import etree
+
+try:
+    import charset_normalizer
+except ImportError:  # Installed with requests; without it undeclared pages fall back to UTF-8/Windows-1252
+    charset_normalizer = None
+
+logger = logging.getLogger(__name__)
+
+HTMLSource = Union[bytes, str, BinaryIO]
+
+# Text inside these tags is never part of the output. script/style were removed from the
+# BeautifulSoup tree; template, rt and rp strings were left out by BeautifulSoup's get_text()
+SKIPPED_TAGS = frozenset(('script', 'style', 'template', 'rt', 'rp'))
+
+# Whitespace inside these tags is kept as-is
+PRESERVE_WHITESPACE_TAGS = frozenset(('pre', 'textarea'))
+
+# A run of nothing but these characters between two tags collapses to one space or newline
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+# Encoding declarations are looked for near the start of the document only
+XML_DECLARATION_RE = re.compile(rb'^\s*<\?.*encoding=[\'"](.*?)[\'"].*\?>', re.I)
+META_CHARSET_RE = re.compile(rb'<\s*meta[^>]+charset\s*=\s*["\']?([^>]*?)[ /;\'">]', re.I)
+XML_DECLARATION_SEARCH_BYTES = 1024
+META_CHARSET_SEARCH_BYTES = 2048
+
+# Checked in this order, so FF FE 00 00 reads as UTF-16LE (as it always has)
+BYTE_ORDER_MARKS = (
+    (codecs.BOM_UTF16_BE, 'utf-16be'),
+    (codecs.BOM_UTF16_LE, 'utf-16le'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF32_BE, 'utf-32be'),
+)
+
+
+def _is_utf8(markup: bytes) -> bool:
+    try:
+        markup.decode('utf-8')
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+class _TextCollector:
+    """
+    lxml parser target that keeps only content text.
+    Character data is gathered into runs between tags, the same way BeautifulSoup builds
+    its strings, so whitespace-only runs collapse exactly as they used to.
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self._run: List[str] = []
+        self._skip_depth = 0
+        self._preserve_depth = 0
+
+    def _end_run(self):
+        if not self._run:
+            return
+        run = ''.join(self._run)
+        self._run = []
+        if self._skip_depth:
+            return
+        if not self._preserve_depth and not run.strip(ASCII_SPACES):
+            run = '\n' if '\n' in run else ' '
+        self.parts.append(run)
+
+    def start(self, tag, attrib):
+        self._end_run()
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth += 1
+
+    def end(self, tag):
+        self._end_run()
+        if tag in SKIPPED_TAGS:
+            self._skip_depth -= 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth -= 1
+
+    def data(self, text):
+        self._run.append(text)
+
+    def comment(self, text):
+        # Comments end the current run of text but are not content themselves
+        self._end_run()
+
+    def pi(self, target, data=None):
+        self._end_run()
+
+    def doctype(self, *args):
+        self._end_run()
+
+    def close(self) -> str:
+        self._end_run()
+        return ''.join(self.parts)
+
+
+class HTMLExtractor:
+    """Text extraction for HTML uploads (same output as the former BeautifulSoup pipeline)"""
+
+    @staticmethod
+    def _read(source: HTMLSource) -> bytes:
+        if isinstance(source, (bytes, bytearray)):
+            return bytes(source)
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                return f.read()
+        return source.read()
+
+    @staticmethod
+    def strip_byte_order_mark(markup: bytes):
+        """(markup without its byte-order mark, encoding the mark implies or None)"""
+        for bom, encoding in BYTE_ORDER_MARKS:
+            if markup.startswith(bom):
+                return markup[len(bom):], encoding
+        return markup, None
+
+    @staticmethod
+    def candidate_encodings(markup: bytes, sniffed: Optional[str] = None) -> Iterator[str]:
+        """Byte-order mark, declared encoding, detected encoding, then UTF-8 and Windows-1252"""
+        candidates = [sniffed]
+        declared = XML_DECLARATION_RE.search(markup, 0, XML_DECLARATION_SEARCH_BYTES)
+        if not declared:
+            declared = META_CHARSET_RE.search(markup, 0, max(META_CHARSET_SEARCH_BYTES, len(markup) // 20))
+        if declared and declared.group(1):
+            candidates.append(declared.group(1).decode('ascii', 'replace'))
+        elif not sniffed and charset_normalizer is not None and not _is_utf8(markup):
+            # Statistical detection is slow, so it only runs for undeclared pages that are not UTF-8
+            candidates.append(charset_normalizer.detect(markup)['encoding'])
+        candidates += ['utf-8', 'windows-1252']
+
+        tried = set()
+        for encoding in candidates:
+            if encoding and encoding.lower() not in tried:
+                tried.add(encoding.lower())
+                yield encoding.lower()
+
+    @staticmethod
+    def _parse(markup: bytes, encoding: str) -> str:
+        collector = _TextCollector()
+        parser = etree.HTMLParser(target=collector, strip_cdata=False, recover=True, encoding=encoding)
+        # One feed() call: libxml2's push parser can drop trailing text when a page arrives in many chunks
+        parser.feed(markup)
+        return parser.close()
+
+    @classmethod
+    def raw_text(cls, source: HTMLSource) -> str:
+        """All content text of the page, before line cleanup"""
+        markup, sniffed = cls.strip_byte_order_mark(cls._read(source))
+        error = None
+        for encoding in cls.candidate_encodings(markup, sniffed):
+            try:
+                return cls._parse(markup, encoding)
+            except (UnicodeDecodeError, LookupError, etree.ParserError) as e:
+                error = e  # Wrong or unknown encoding - try the next candidate
+        raise ValueError(f"Could not parse HTML: {error}")
+
+    @staticmethod
+    def clean_lines(text: str) -> str:
+        """Strip every line, split it on double spaces and drop the empty pieces"""
+        lines = (line.strip() for line in text.splitlines())
+        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+        return '\n'.join(chunk for chunk in chunks if chunk)
+
+    @classmethod
+    def extract_text(cls, source: HTMLSource) -> str:
+        return cls.clean_lines(cls.raw_text(source))
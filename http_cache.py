@@ -0,0 +1,149 @@
+"""
+HTTP Cache Module for De-PDF
+On-disk cache of fetched URLs with Cache-Control freshness and ETag/Last-Modified revalidation
+"""
+import re
+import time
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from extraction_cache import ExtractionCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+CACHE_DIRECTIVE_RE = re.compile(r'([\w-]+)\s*(?:=\s*"?([^",]*)"?)?')
+
+# Response headers kept with an entry; a 304 that omits them leaves the stored values in force
+FRESHNESS_HEADERS = ('Cache-Control', 'Expires', 'Date', 'Age')
+
+
+def normalize_url(url: str) -> str:
+    """Lower-case scheme and host, drop default ports and the #fragment, and use '/' for an empty path"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    return urlunsplit((scheme, host, parts.path or '/', parts.query, ''))
+
+
+def cache_directives(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """Parse a Cache-Control header into {directive: argument or None}"""
+    return {name.lower(): argument for name, argument in CACHE_DIRECTIVE_RE.findall(value or '')}
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class HTTPCache(ExtractionCache):
+    """
+    Remembers, per normalized URL, the validators the server sent and the result of extracting the page.
+    Fresh entries (Cache-Control max-age / Expires) are used without any request; stale ones are
+    revalidated with If-None-Match / If-Modified-Since, and a 304 reuses the stored extraction.
+    Storage, the size cap and LRU eviction are those of ExtractionCache.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        super().__init__(directory, max_bytes)
+        self.fresh_hits = 0
+        self.revalidated = 0
+
+    def key_for(self, url: str, extractor_version: str) -> str:
+        return self.make_key(normalize_url(url), extractor_version)
+
+    def lookup(self, url: str, extractor_version: str) -> Optional[Dict]:
+        """The stored entry for the URL, or None"""
+        return self.get(self.key_for(url, extractor_version))
+
+    @staticmethod
+    def is_fresh(entry: Dict) -> bool:
+        return time.time() < entry.get('fresh_until', 0)
+
+    @staticmethod
+    def validators(entry: Optional[Dict]) -> Dict[str, str]:
+        """Conditional request headers for revalidating a stored entry"""
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    @staticmethod
+    def fresh_until(headers) -> float:
+        """Wall-clock time until which a response may be used without revalidating (0 = revalidate every time)"""
+        directives = cache_directives(headers.get('Cache-Control'))
+        if 'no-cache' in directives:
+            return 0
+        now = time.time()
+        try:
+            age = max(0, int(headers.get('Age', 0)))
+        except ValueError:
+            age = 0
+        if directives.get('max-age') is not None:
+            try:
+                return now + int(directives['max-age']) - age
+            except ValueError:
+                return 0
+        expires = _http_date(headers.get('Expires'))
+        if expires is not None:
+            date = _http_date(headers.get('Date')) or now
+            return now + (expires - date) - age
+        return 0
+
+    @classmethod
+    def make_entry(cls, url: str, headers, result: Dict) -> Optional[Dict]:
+        """
+        Build the entry to store for a 200 response, or None if it may not be stored
+        (no-store, Vary: *, or nothing that would ever let it be reused)
+        """
+        if 'no-store' in cache_directives(headers.get('Cache-Control')) or headers.get('Vary', '').strip() == '*':
+            return None
+        entry = {
+            'url': normalize_url(url),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'headers': {name: headers[name] for name in FRESHNESS_HEADERS if name in headers},
+            'fresh_until': cls.fresh_until(headers),
+            'stored_at': time.time(),
+            'result': result,
+        }
+        if not (entry['etag'] or entry['last_modified'] or cls.is_fresh(entry)):
+            return None
+        return entry
+
+    def store(self, url: str, extractor_version: str, headers, result: Dict):
+        """Store the extraction result of a 200 response along with its validators"""
+        entry = self.make_entry(url, headers, result)
+        if entry is not None:
+            self.put(self.key_for(url, extractor_version), entry)
+
+    def refresh(self, url: str, extractor_version: str, entry: Dict, headers):
+        """Apply the headers of a 304 to a stored entry (new validators and freshness)"""
+        with self._lock:
+            self.revalidated += 1
+        entry = dict(entry)
+        entry['etag'] = headers.get('ETag') or entry.get('etag')
+        entry['last_modified'] = headers.get('Last-Modified') or entry.get('last_modified')
+        entry['headers'] = dict(entry.get('headers', {}))
+        entry['headers'].update({name: headers[name] for name in FRESHNESS_HEADERS if name in headers})
+        entry['fresh_until'] = self.fresh_until(entry['headers'])
+        self.put(self.key_for(url, extractor_version), entry)
+
+    def count_fresh_hit(self):
+        with self._lock:
+            self.fresh_hits += 1
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        with self._lock:
+            stats.update({'fresh_hits': self.fresh_hits, 'revalidated': self.revalidated})
+        return stats
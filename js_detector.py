@@ -0,0 +1,145 @@
+"""
+JavaScript Detection Module for De-PDF
+Decides from the page structure whether a Level 2 page needs a Puppeteer render
+"""
+import re
+import logging
+from typing import Dict, Union
+
+from bs4 import BeautifulSoup, Comment, Declaration, Doctype, NavigableString, ProcessingInstruction, Tag
+
+logger = logging.getLogger(__name__)
+
+# Elements whose text is never visible content
+HIDDEN_TAGS = frozenset(('script', 'style', 'noscript', 'template', 'head', 'title', 'svg'))
+
+# Ids and attributes that client-side frameworks render into
+MOUNT_POINT_IDS = frozenset(('root', 'app', '__next', '__nuxt', '___gatsby', 'svelte', 'main-app', 'application'))
+MOUNT_POINT_ATTRIBUTES = ('data-reactroot', 'ng-app', 'ng-version', 'data-v-app', 'data-server-rendered')
+# Angular's root component is an element of its own, not an id
+MOUNT_POINT_TAGS = frozenset(('app-root',))
+
+# Framework fingerprints in script ids and inline script text
+FRAMEWORK_SCRIPT_IDS = frozenset(('__NEXT_DATA__', '__NUXT_DATA__', '__APOLLO_STATE__'))
+FRAMEWORK_SCRIPT_RE = re.compile(r'window\.__(?:NUXT|INITIAL_STATE|PRELOADED_STATE|APOLLO_STATE)__|window\.React\b|'
+                                 r'\bReactDOM\.(?:render|createRoot|hydrate)|\bcreateApp\(|\bplatformBrowserDynamic\(')
+
+# What a page says when it cannot work without scripts
+ENABLE_JAVASCRIPT_RE = re.compile(r'(?:enable|turn on|activate)\s+javascript|javascript\s+(?:is\s+)?(?:required|disabled|'
+                                  r'must be enabled|needs to be enabled)|requires\s+javascript', re.I)
+
+# Strings that are markup rather than text (CData is kept: it is script text in XHTML pages)
+SKIPPED_STRINGS = (Comment, Declaration, Doctype, ProcessingInstruction)
+
+PageSource = Union[str, bytes, BeautifulSoup]
+
+
+class JavaScriptDetector:
+    """
+    Scored classifier for "this page is an empty shell that only JavaScript fills in".
+    One walk over the parsed DOM collects the visible text volume, paragraph count, script weight,
+    framework fingerprints, empty mount points and "please enable JavaScript" messages; the score
+    weighs them so server-rendered pages built with a framework, and the <noscript> tracking
+    pixels nearly every page has, stay on Level 2.
+    """
+
+    # Pages scoring at least this are rendered with Puppeteer
+    THRESHOLD = 3
+
+    # Visible text at which a page counts as having real content
+    RICH_TEXT_CHARS = 1500
+    SOME_TEXT_CHARS = 500
+    SHELL_TEXT_CHARS = 200
+
+    @staticmethod
+    def _soup(page: PageSource) -> BeautifulSoup:
+        return page if isinstance(page, BeautifulSoup) else BeautifulSoup(page, 'lxml')
+
+    @classmethod
+    def features(cls, page: PageSource) -> Dict:
+        """The structural signals of a page, collected in a single walk over its DOM"""
+        soup = cls._soup(page)
+        features = {
+            'text_chars': 0,
+            'paragraphs': 0,
+            'scripts': 0,
+            'script_chars': 0,
+            'framework_markers': 0,
+            'empty_mount_points': 0,
+            'enable_javascript_message': False,
+        }
+        mount_points = []  # [node, has visible text]
+
+        # (node, inside a hidden element, inside a <noscript>, indexes of the mount points it sits in)
+        stack = [(soup, False, False, ())]
+        while stack:
+            node, hidden, noscript, mounts = stack.pop()
+            if isinstance(node, NavigableString):
+                if isinstance(node, SKIPPED_STRINGS):
+                    continue
+                text = node.strip()
+                if not text:
+                    continue
+                if not hidden:
+                    features['text_chars'] += len(text)
+                    for index in mounts:
+                        mount_points[index][1] = True
+                    if len(text) < 300 and ENABLE_JAVASCRIPT_RE.search(text):
+                        features['enable_javascript_message'] = True
+                elif noscript and ENABLE_JAVASCRIPT_RE.search(text):
+                    # lxml parses <noscript> content as markup, so the message is often inside a <div> or <p>
+                    features['enable_javascript_message'] = True
+                elif node.parent is not None and node.parent.name == 'script':
+                    features['script_chars'] += len(text)
+                    if FRAMEWORK_SCRIPT_RE.search(text[:20000]):
+                        features['framework_markers'] += 1
+                continue
+            if not isinstance(node, Tag):
+                continue
+
+            name = node.name
+            if name == 'script':
+                features['scripts'] += 1
+                if node.get('id') in FRAMEWORK_SCRIPT_IDS:
+                    features['framework_markers'] += 1
+            elif name == 'p':
+                features['paragraphs'] += 1
+            if (node.get('id') in MOUNT_POINT_IDS or name in MOUNT_POINT_TAGS
+                    or any(node.has_attr(attr) for attr in MOUNT_POINT_ATTRIBUTES)):
+                features['framework_markers'] += 1
+                # Vue SSR marks a mount point it has already rendered
+                if not node.has_attr('data-server-rendered'):
+                    mounts = mounts + (len(mount_points),)
+                    mount_points.append([node, False])
+
+            child_hidden = hidden or name in HIDDEN_TAGS
+            child_noscript = noscript or name == 'noscript'
+            stack.extend((child, child_hidden, child_noscript, mounts) for child in reversed(node.contents))
+
+        features['empty_mount_points'] = sum(1 for _, has_text in mount_points if not has_text)
+        return features
+
+    @classmethod
+    def score(cls, features: Dict) -> int:
+        text_chars = features['text_chars']
+        score = 0
+        score += 4 * min(features['empty_mount_points'], 2)
+        if features['enable_javascript_message'] and text_chars < cls.RICH_TEXT_CHARS:
+            score += 3
+        if features['framework_markers'] and not features['paragraphs'] and text_chars < cls.SOME_TEXT_CHARS:
+            score += 1
+        if text_chars < cls.SHELL_TEXT_CHARS:
+            score += 2
+        if features['scripts'] and features['script_chars'] > 10 * max(text_chars, 1) and features['paragraphs'] < 3:
+            score += 1
+        if text_chars >= cls.RICH_TEXT_CHARS:
+            score -= 4
+        elif text_chars >= cls.SOME_TEXT_CHARS:
+            score -= 2
+        if features['paragraphs'] >= 5:
+            score -= 1
+        return score
+
+    @classmethod
+    def is_javascript_required(cls, page: PageSource) -> bool:
+        return cls.score(cls.features(page)) >= cls.THRESHOLD
@@ -0,0 +1,211 @@
+"""
+OCR Module for De-PDF
+Finds PDF pages without a usable text layer and runs only those through Tesseract
+in a bounded process pool
+"""
+import io
+import os
+import shutil
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Union
+
+import pdfplumber
+
+try:
+    import pytesseract
+except ImportError:  # OCR is optional - scanned pages simply stay empty without it
+    pytesseract = None
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+logger = logging.getLogger(__name__)
+
+PDFSource = Union[bytes, str]
+
+# Pool workers are started from a clean server process rather than forked from the threaded Flask
+# app, whose locks (logging, pdfminer caches, open connections) a fork could copy mid-use.
+# Windows has no forkserver and uses spawn.
+if 'forkserver' in multiprocessing.get_all_start_methods():
+    POOL_CONTEXT = multiprocessing.get_context('forkserver')
+    POOL_CONTEXT.set_forkserver_preload(['pdf_extractor', 'ocr_handler'])  # Workers skip re-importing them
+else:
+    POOL_CONTEXT = multiprocessing.get_context('spawn')
+
+
+def _open_pdf(source: PDFSource):
+    if isinstance(source, (bytes, bytearray)):
+        return pdfplumber.open(io.BytesIO(source))
+    return pdfplumber.open(source)
+
+
+def image_coverage(page) -> float:
+    """Fraction of the page area covered by images (overlaps counted twice, capped at 1)"""
+    page_area = float(page.width * page.height) or 1.0
+    covered = 0.0
+    for image in page.images:
+        width = min(image['x1'], page.width) - max(image['x0'], 0)
+        height = min(image['bottom'], page.height) - max(image['top'], 0)
+        if width > 0 and height > 0:
+            covered += width * height
+    return min(covered / page_area, 1.0)
+
+
+# Each OCR worker opens the PDF once and renders the pages it is given
+_worker_pdf = None
+
+
+def _init_ocr_worker(source: PDFSource):
+    global _worker_pdf
+    _worker_pdf = pdfium.PdfDocument(source)
+
+
+def _ocr_page(index: int, dpi: int, lang: str) -> str:
+    page = _worker_pdf[index]
+    try:
+        image = page.render(scale=dpi / 72).to_pil()
+    finally:
+        page.close()
+    return pytesseract.image_to_string(image, lang=lang)
+
+
+class OCRHandler:
+    """Classifies pages by their text layer and OCRs the image-only ones"""
+
+    # Set PDF_OCR=0 to never OCR, even when Tesseract is installed
+    ENABLED = os.environ.get('PDF_OCR', '1').lower() not in ('0', 'false', 'no')
+
+    # Size of the OCR process pool - Tesseract is CPU-bound, so keep this at or below core count
+    WORKERS = int(os.environ.get('OCR_WORKERS', min(2, os.cpu_count() or 1)))
+
+    DPI = int(os.environ.get('OCR_DPI', 300))
+    LANG = os.environ.get('OCR_LANG', 'eng')
+
+    # A page with fewer characters than this has no usable text layer...
+    MIN_TEXT_CHARS = 20
+    # ...and is only worth OCRing if images cover at least this much of it
+    MIN_IMAGE_COVERAGE = 0.3
+
+    _available = None
+
+    @classmethod
+    def available(cls) -> bool:
+        """True if OCR is enabled and pytesseract, pypdfium2 and the tesseract binary are present"""
+        if cls._available is None:
+            cls._available = bool(
+                cls.ENABLED and pytesseract is not None and pdfium is not None
+                and shutil.which(pytesseract.pytesseract.tesseract_cmd)
+            )
+            if cls.ENABLED and not cls._available:
+                logger.info("Tesseract not available - image-only PDF pages will not be OCRed")
+        return cls._available
+
+    @classmethod
+    def lacks_text(cls, text: str) -> bool:
+        """Cheap first pass on extracted text: could this page be a scan?"""
+        return len(text.strip()) < cls.MIN_TEXT_CHARS
+
+    @classmethod
+    def is_image_only(cls, page) -> bool:
+        """True if a pdfplumber page has almost no chars and mostly image content"""
+        # Reading page.chars/page.images parses the page objects but skips layout analysis
+        return len(page.chars) < cls.MIN_TEXT_CHARS and image_coverage(page) >= cls.MIN_IMAGE_COVERAGE
+
+    @classmethod
+    def find_image_only_pages(cls, source: PDFSource, candidates: List[int]) -> List[int]:
+        """Narrow candidate pages down to those with almost no chars and mostly image content"""
+        with OCRSession(source) as session:
+            return [index for index in candidates if session.is_image_only(index)]
+
+    @classmethod
+    def ocr_pages(cls, source: PDFSource, indices: List[int]) -> Dict[int, str]:
+        """OCR the given pages in a bounded process pool; returns {page index: text}"""
+        if not indices:
+            return {}
+        workers = max(1, min(cls.WORKERS, len(indices)))
+        print(f"Running OCR on {len(indices)} image-only page(s) with {workers} worker processes...", flush=True)
+        with OCRSession(source, workers) as session:
+            return session.ocr(indices)
+
+    @classmethod
+    def fill_image_only_pages(cls, source: PDFSource, pages: List[str],
+                              max_chars: Optional[int] = None) -> List[str]:
+        """
+        Replace the text of image-only pages with OCR output; text-layer pages are untouched.
+        With max_chars, OCR output counts against the budget like any other page text: pages are
+        OCRed in page order, a few at a time, and the list is cut after the page that reaches it.
+        """
+        if not cls.available():
+            return pages
+        candidates = [index for index, text in enumerate(pages) if cls.lacks_text(text)]
+        if not candidates:
+            return pages
+        if max_chars is None:
+            image_only = cls.find_image_only_pages(source, candidates)
+            for index, text in cls.ocr_pages(source, image_only).items():
+                pages[index] = text
+            return pages
+
+        with OCRSession(source) as session:
+            image_only = [index for index in candidates if session.is_image_only(index)]
+            chars = 0
+            for index in range(len(pages)):
+                if chars >= max_chars:
+                    return pages[:index]
+                if image_only and image_only[0] == index:
+                    # One page per worker, so at most a batch's worth of OCR goes past the budget
+                    batch, image_only = image_only[:session.workers], image_only[session.workers:]
+                    print(f"Running OCR on {len(batch)} image-only page(s) with {session.workers} "
+                          f"worker processes...", flush=True)
+                    for ocr_index, text in session.ocr(batch).items():
+                        pages[ocr_index] = text
+                chars += len(pages[index])
+        return pages
+
+class OCRSession:
+    """
+    Keeps the page classifier's PDF and the OCR pool open across calls, so pages can be
+    classified and OCRed one at a time without re-opening the document or re-spawning workers
+    """
+
+    def __init__(self, source: PDFSource, workers: Optional[int] = None):
+        self.source = source
+        self.workers = max(1, workers or OCRHandler.WORKERS)
+        self._pdf = None
+        self._pool = None
+
+    def is_image_only(self, index: int) -> bool:
+        if self._pdf is None:
+            self._pdf = _open_pdf(self.source)
+        page = self._pdf.pages[index]
+        try:
+            return OCRHandler.is_image_only(page)
+        finally:
+            page.close()
+
+    def ocr(self, indices: List[int]) -> Dict[int, str]:
+        """OCR the given pages; returns {page index: text}"""
+        if not indices:
+            return {}
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=POOL_CONTEXT,
+                                             initializer=_init_ocr_worker, initargs=(self.source,))
+        count = len(indices)
+        texts = self._pool.map(_ocr_page, indices, [OCRHandler.DPI] * count, [OCRHandler.LANG] * count)
+        return dict(zip(indices, texts))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+        if self._pdf is not None:
+            self._pdf.close()
+
+    def __enter__(self) -> 'OCRSession':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
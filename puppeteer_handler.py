@@ -3,13 +3,20 @@ Puppeteer Handler for Level 3 JavaScript Rendering
 Runs headless Chromium inside Docker container
 """
 import asyncio
+import threading
 from pyppeteer import launch
 from typing import Tuple, Optional
 import logging
 
+from domain_rules import DOMAIN_RULES
+
 logger = logging.getLogger(__name__)
 
 
+class RenderCancelled(Exception):
+    """A render was stopped because another fetch level already produced the page"""
+
+
 class PuppeteerHandler:
     """Handles JavaScript-rendered pages using headless Chromium"""
     
@@ -41,29 +48,12 @@ class PuppeteerHandler:
             
             page = await browser.newPage()
             
-            # Set user agent based on domain
-            if 'archive.ph' in url or 'archive.is' in url:
-                await page.setUserAgent('Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:122.0) Gecko/20100101 Firefox/122.0')
-                # Set viewport to appear more real
-                await page.setViewport({'width': 1366, 'height': 768})
-                
-                # Add extra headers for archive sites
-                await page.setExtraHTTPHeaders({
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-                    'Accept-Language': 'en-US,en;q=0.5',
-                    'Accept-Encoding': 'gzip, deflate, br',
-                    'DNT': '1',
-                    'Connection': 'keep-alive',
-                    'Upgrade-Insecure-Requests': '1',
-                    'Sec-Fetch-Dest': 'document',
-                    'Sec-Fetch-Mode': 'navigate',
-                    'Sec-Fetch-Site': 'none',
-                    'Sec-Fetch-User': '?1',
-                    'Cache-Control': 'max-age=0',
-                })
-            else:
-                await page.setUserAgent('Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36')
-                await page.setViewport({'width': 1920, 'height': 1080})
+            # Browser profile from the domain's rule (archive.ph gets Firefox with a smaller viewport)
+            rule = DOMAIN_RULES.rule_for(url)
+            await page.setUserAgent(rule.browser['user_agent'])
+            await page.setViewport(rule.browser['viewport'])
+            if rule.browser['headers']:
+                await page.setExtraHTTPHeaders(rule.browser['headers'])
             
             logger.info(f"Navigating to {url}")
             
@@ -76,29 +66,34 @@ class PuppeteerHandler:
             # Wait a bit for dynamic content to load
             await page.waitFor(2000)
             
-            # For archive.ph, wait for specific content
-            if 'archive.ph' in url or 'archive.is' in url:
+            # Wait for the element the domain's rule says holds the content
+            if rule.wait_for:
                 try:
-                    # Wait for the main content div
-                    await page.waitForSelector('div#CONTENT', {'timeout': 10000})
+                    await page.waitForSelector(rule.wait_for, {'timeout': rule.wait_timeout})
                 except:
-                    logger.warning("Could not find archive.ph content div, continuing anyway")
+                    logger.warning(f"Could not find {rule.wait_for} on {url}, continuing anyway")
             
             # Get the page content
             html_content = await page.content()
             
-            # Extract text content using page evaluation
-            text_content = await page.evaluate('''() => {
+            # Extract text content using page evaluation, with the domain rule's selectors; a selector
+            # the browser rejects is skipped rather than failing the render
+            strip_selectors, content_selectors = rule.render_selectors()
+            text_content = await page.evaluate('''(strip, content) => {
                 // Remove scripts, styles, and other non-content elements
-                const elementsToRemove = document.querySelectorAll('script, style, noscript, iframe, object, embed, form, button, input, select, textarea');
-                elementsToRemove.forEach(el => el.remove());
-                
-                // Try to find main content
-                let contentElement = document.querySelector('article, main, [role="main"], .article-content, .post-content, .entry-content, .content, #content, .story-body, #CONTENT');
+                for (const selector of strip) {
+                    try {
+                        document.querySelectorAll(selector).forEach(el => el.remove());
+                    } catch (e) {}
+                }
                 
-                if (!contentElement) {
-                    // For archive.ph specifically
-                    contentElement = document.querySelector('div#CONTENT') || document.querySelector('div.CONTENT');
+                // Try to find main content, in the rule's order of preference
+                let contentElement = null;
+                for (const selector of content) {
+                    try {
+                        contentElement = document.querySelector(selector);
+                    } catch (e) {}
+                    if (contentElement) break;
                 }
                 
                 if (!contentElement) {
@@ -106,7 +101,7 @@ class PuppeteerHandler:
                 }
                 
                 return contentElement.innerText || contentElement.textContent || '';
-            }''')
+            }''', strip_selectors, content_selectors)
             
             # Extract title
             title = await page.evaluate('() => document.title')
@@ -132,38 +127,63 @@ class PuppeteerHandler:
                 await browser.close()
     
     @classmethod
-    def fetch_with_js_sync(cls, url: str) -> Tuple[str, str, Optional[str], Optional[str]]:
-        """Synchronous wrapper using subprocess to avoid asyncio threading issues"""
+    def fetch_with_js_sync(cls, url: str, cancel: Optional[threading.Event] = None) -> Tuple[str, str, Optional[str], Optional[str]]:
+        """
+        Synchronous wrapper using subprocess to avoid asyncio threading issues.
+        Setting `cancel` kills the render (the subprocess and its Chromium) and raises RenderCancelled.
+        """
         import subprocess
         import json
         import os
+        import signal
+        import time
         
         logger.info(f"Running Puppeteer in subprocess for {url}")
         
         # Run the puppeteer subprocess
         script_path = os.path.join(os.path.dirname(__file__), 'puppeteer_subprocess.py')
+        deadline = time.monotonic() + 90  # 90 second timeout
         
         try:
-            result = subprocess.run(
+            # Own process group, so cancelling also takes down the Chromium it launched
+            process = subprocess.Popen(
                 ['python', script_path, url],
-                capture_output=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
                 text=True,
-                timeout=90  # 90 second timeout
+                start_new_session=True
             )
-            
-            if result.returncode != 0:
-                raise Exception(f"Subprocess failed: {result.stderr}")
-            
-            data = json.loads(result.stdout)
+            while True:
+                try:
+                    stdout, stderr = process.communicate(timeout=0.5)
+                    break
+                except subprocess.TimeoutExpired:
+                    cancelled = cancel is not None and cancel.is_set()
+                    if cancelled or time.monotonic() > deadline:
+                        try:
+                            os.killpg(process.pid, signal.SIGKILL)
+                        except ProcessLookupError:
+                            pass
+                        process.communicate()
+                        if cancelled:
+                            raise RenderCancelled(f"Puppeteer render of {url} cancelled")
+                        raise subprocess.TimeoutExpired(process.args, 90)
+            
+            if process.returncode != 0:
+                raise Exception(f"Subprocess failed: {stderr}")
+            
+            data = json.loads(stdout)
             
             if not data['success']:
                 raise Exception(data['error'])
             
             return data['html'], data['text'], data.get('title'), data.get('author')
             
+        except RenderCancelled:
+            raise
         except subprocess.TimeoutExpired:
             raise Exception("Puppeteer subprocess timed out")
         except json.JSONDecodeError as e:
             raise Exception(f"Failed to parse subprocess output: {e}")
         except Exception as e:
-            raise Exception(f"Subprocess error: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Subprocess error: {str(e)}")
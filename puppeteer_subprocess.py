@@ -8,6 +8,8 @@ import asyncio
 from pyppeteer import launch
 import logging
 
+from domain_rules import DOMAIN_RULES
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -39,29 +41,12 @@ async def fetch_with_js(url: str):
         
         page = await browser.newPage()
         
-        # Set user agent based on domain
-        if 'archive.ph' in url or 'archive.is' in url:
-            await page.setUserAgent('Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:122.0) Gecko/20100101 Firefox/122.0')
-            # Set viewport to appear more real
-            await page.setViewport({'width': 1366, 'height': 768})
-            
-            # Add extra headers for archive sites
-            await page.setExtraHTTPHeaders({
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'DNT': '1',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-                'Sec-Fetch-Dest': 'document',
-                'Sec-Fetch-Mode': 'navigate',
-                'Sec-Fetch-Site': 'none',
-                'Sec-Fetch-User': '?1',
-                'Cache-Control': 'max-age=0',
-            })
-        else:
-            await page.setUserAgent('Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36')
-            await page.setViewport({'width': 1920, 'height': 1080})
+        # Browser profile from the domain's rule (archive.ph gets Firefox with a smaller viewport)
+        rule = DOMAIN_RULES.rule_for(url)
+        await page.setUserAgent(rule.browser['user_agent'])
+        await page.setViewport(rule.browser['viewport'])
+        if rule.browser['headers']:
+            await page.setExtraHTTPHeaders(rule.browser['headers'])
         
         logger.info(f"Navigating to {url}")
         
@@ -74,29 +59,34 @@ async def fetch_with_js(url: str):
         # Wait a bit for dynamic content to load
         await page.waitFor(2000)
         
-        # For archive.ph, wait for specific content
-        if 'archive.ph' in url or 'archive.is' in url:
+        # Wait for the element the domain's rule says holds the content
+        if rule.wait_for:
             try:
-                # Wait for the main content div
-                await page.waitForSelector('div#CONTENT', {'timeout': 10000})
+                await page.waitForSelector(rule.wait_for, {'timeout': rule.wait_timeout})
             except:
-                logger.warning("Could not find archive.ph content div, continuing anyway")
+                logger.warning(f"Could not find {rule.wait_for} on {url}, continuing anyway")
         
         # Get the page content
         html_content = await page.content()
         
-        # Extract text content using page evaluation
-        text_content = await page.evaluate('''() => {
+        # Extract text content using page evaluation, with the domain rule's selectors; a selector
+        # the browser rejects is skipped rather than failing the render
+        strip_selectors, content_selectors = rule.render_selectors()
+        text_content = await page.evaluate('''(strip, content) => {
             // Remove scripts, styles, and other non-content elements
-            const elementsToRemove = document.querySelectorAll('script, style, noscript, iframe, object, embed, form, button, input, select, textarea');
-            elementsToRemove.forEach(el => el.remove());
-            
-            // Try to find main content
-            let contentElement = document.querySelector('article, main, [role="main"], .article-content, .post-content, .entry-content, .content, #content, .story-body, #CONTENT');
+            for (const selector of strip) {
+                try {
+                    document.querySelectorAll(selector).forEach(el => el.remove());
+                } catch (e) {}
+            }
             
-            if (!contentElement) {
-                // For archive.ph specifically
-                contentElement = document.querySelector('div#CONTENT') || document.querySelector('div.CONTENT');
+            // Try to find main content, in the rule's order of preference
+            let contentElement = null;
+            for (const selector of content) {
+                try {
+                    contentElement = document.querySelector(selector);
+                } catch (e) {}
+                if (contentElement) break;
             }
             
             if (!contentElement) {
@@ -104,7 +94,7 @@ async def fetch_with_js(url: str):
             }
             
             return contentElement.innerText || contentElement.textContent || '';
-        }''')
+        }''', strip_selectors, content_selectors)
         
         # Extract title
         title = await page.evaluate('() => document.title')
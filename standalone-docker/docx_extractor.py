@@ -0,0 +1,157 @@
+"""
+DOCX Extraction Module for De-PDF
+Streams paragraphs and table rows out of word/document.xml with lxml iterparse, in constant memory
+"""
+import io
+import re
+import zipfile
+import logging
+from typing import Iterator, Union
+
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# A DOCX can be handed over as raw upload bytes or as a path on disk (e.g. a spooled upload)
+DOCXSource = Union[bytes, str]
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W = '{%s}' % W_NS
+
+PARAGRAPH = W + 'p'
+TABLE = W + 'tbl'
+ROW = W + 'tr'
+CELL = W + 'tc'
+
+# Run content that contributes to the visible text of a paragraph
+TEXT = W + 't'
+RUN_MARKS = {
+    W + 'tab': '\t',
+    W + 'br': '\n',
+    W + 'cr': '\n',
+    W + 'noBreakHyphen': '-',
+}
+
+# Old position of moved text; the runs inside repeat what the matching w:moveTo holds
+MOVED_FROM = W + 'moveFrom'
+
+# Header and footer parts (word/header1.xml, word/footer2.xml, ...), one per section and page type
+HEADER_PART_RE = re.compile(r'word/header(\d*)\.xml$')
+FOOTER_PART_RE = re.compile(r'word/footer(\d*)\.xml$')
+
+# Footnote/endnote ids with these types are the separator lines Word inserts, not content
+NOTE_SEPARATORS = ('separator', 'continuationSeparator', 'continuationNotice')
+
+
+def paragraph_text(paragraph) -> str:
+    """Visible text of a <w:p>, including runs inside hyperlinks and tracked insertions"""
+    moved = paragraph.find('.//' + MOVED_FROM) is not None
+    parts = []
+    for node in paragraph.iter(TEXT, *RUN_MARKS):
+        if moved and next(node.iterancestors(MOVED_FROM), None) is not None:
+            continue
+        if node.tag == TEXT:
+            parts.append(node.text or '')
+        else:
+            parts.append(RUN_MARKS[node.tag])
+    return ''.join(parts)
+
+
+def row_text(row) -> str:
+    """Cells of a <w:tr> joined with ' | '; paragraphs inside a cell are joined with spaces"""
+    cells = []
+    for cell in row.iterchildren(CELL):
+        cells.append(' '.join(text for text in (paragraph_text(p) for p in cell.iter(PARAGRAPH)) if text))
+    return ' | '.join(cells)
+
+
+def _release(element):
+    """Free a processed element and the already-processed siblings before it"""
+    element.clear()
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+class DOCXExtractor:
+    """Extracts DOCX text block by block without building a document object model"""
+
+    # Bump when a change alters the text produced (invalidates cached extractions)
+    VERSION = 4
+
+    @staticmethod
+    def _open_zip(source: DOCXSource) -> zipfile.ZipFile:
+        if isinstance(source, (bytes, bytearray)):
+            return zipfile.ZipFile(io.BytesIO(source))
+        return zipfile.ZipFile(source)
+
+    @staticmethod
+    def _iter_part(docx: zipfile.ZipFile, part: str) -> Iterator[str]:
+        """Yield the text of every top-level paragraph and table row of one XML part, in order"""
+        table_depth = 0
+        with docx.open(part) as xml:
+            for event, element in etree.iterparse(xml, events=('start', 'end'), tag=(PARAGRAPH, TABLE, ROW),
+                                                  huge_tree=True):
+                if element.tag == TABLE:
+                    table_depth += 1 if event == 'start' else -1
+                    if event == 'end' and table_depth == 0:
+                        _release(element)
+                elif event == 'start':
+                    continue
+                elif element.tag == ROW and table_depth == 1:
+                    yield row_text(element)
+                    _release(element)
+                elif element.tag == PARAGRAPH and table_depth == 0:
+                    yield paragraph_text(element)
+                    _release(element)
+
+    @classmethod
+    def _iter_notes(cls, docx: zipfile.ZipFile, part: str) -> Iterator[str]:
+        """Yield footnote or endnote paragraphs, skipping Word's separator notes"""
+        with docx.open(part) as xml:
+            for _, note in etree.iterparse(xml, tag=(W + 'footnote', W + 'endnote'), huge_tree=True):
+                if note.get(W + 'type') not in NOTE_SEPARATORS:
+                    for paragraph in note.iter(PARAGRAPH):
+                        yield paragraph_text(paragraph)
+                _release(note)
+
+    @classmethod
+    def _iter_margin(cls, docx: zipfile.ZipFile, names, pattern) -> Iterator[str]:
+        """
+        Yield the non-empty blocks of every header (or footer) part, each distinct block once:
+        first-page, even-page and per-section variants mostly repeat the same text
+        """
+        parts = sorted((name for name in names if pattern.match(name)),
+                       key=lambda name: int(pattern.match(name).group(1) or 0))
+        seen = set()
+        for part in parts:
+            for block in cls._iter_part(docx, part):
+                if block.strip() and block not in seen:
+                    seen.add(block)
+                    yield block
+
+    @classmethod
+    def iter_blocks(cls, source: DOCXSource) -> Iterator[str]:
+        """
+        Yield the page headers, then the document body paragraph by paragraph (one line per
+        table row, in document order), then the page footers, footnotes and endnotes
+        """
+        with cls._open_zip(source) as docx:
+            names = set(docx.namelist())
+            yield from cls._iter_margin(docx, names, HEADER_PART_RE)
+            yield from cls._iter_part(docx, 'word/document.xml')
+            yield from cls._iter_margin(docx, names, FOOTER_PART_RE)
+            for part in ('word/footnotes.xml', 'word/endnotes.xml'):
+                if part in names:
+                    yield from cls._iter_notes(docx, part)
+
+    @classmethod
+    def iter_text(cls, source: DOCXSource) -> Iterator[str]:
+        """Yield newline-terminated text blocks (feeds the extraction pipeline)"""
+        for block in cls.iter_blocks(source):
+            yield block + "\n"
+
+    @classmethod
+    def extract_text(cls, source: DOCXSource) -> str:
+        return "".join(cls.iter_text(source))
@@ -0,0 +1,337 @@
+"""
+DOCX Markdown Module for De-PDF
+Converts Word documents to Markdown from their own structure: paragraph styles, list numbering,
+bold/italic runs, hyperlinks, tables, page headers and footers, and footnotes
+"""
+import os
+import re
+import zipfile
+import logging
+from itertools import chain
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from lxml import etree
+
+from docx_extractor import (
+    DOCXExtractor, DOCXSource, W, PARAGRAPH, TABLE, ROW, CELL, NOTE_SEPARATORS, HEADER_PART_RE, FOOTER_PART_RE,
+    _release
+)
+
+logger = logging.getLogger(__name__)
+
+R = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+RELS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+RUN = W + 'r'
+HYPERLINK = W + 'hyperlink'
+# Tracked deletions, and the old position of moved text (it reappears in a w:moveTo)
+REMOVED = (W + 'del', W + 'moveFrom')
+HEADING_STYLE_RE = re.compile(r'^heading (\d)$')
+QUOTE_STYLES = ('quote', 'intense quote')
+FALSE_VALUES = ('0', 'false', 'off', 'none')
+
+# Text at the start of a paragraph that Markdown would read as block syntax
+BLOCK_SYNTAX_RE = re.compile(r'^(#|>|[-+*] |\d+[.)] )')
+INLINE_ESCAPE_RE = re.compile(r'([\\`*])')
+
+# Markdown block kinds that continue the previous block on the next line instead of after a blank line
+CONTINUING_KINDS = ('item', 'row', 'note')
+
+
+def _val(element, tag: str) -> Optional[str]:
+    """w:val of the child `tag`, or None if the child is missing"""
+    child = element.find(tag) if element is not None else None
+    return None if child is None else child.get(W + 'val')
+
+
+def _toggle(properties, tag: str) -> Optional[bool]:
+    """State of an on/off run property such as <w:b/>, or None if it is not set"""
+    child = properties.find(tag) if properties is not None else None
+    if child is None:
+        return None
+    return (child.get(W + 'val') or 'true').lower() not in FALSE_VALUES
+
+
+def _emphasize(text: str, bold: bool, italic: bool) -> str:
+    """Wrap text in emphasis markers, keeping surrounding whitespace outside them"""
+    core = text.strip()
+    if not core or not (bold or italic):
+        return text
+    marker = ('**' if bold else '') + ('*' if italic else '')
+    start = text.index(core[0])
+    return f"{text[:start]}{marker}{core}{marker[::-1]}{text[start + len(core):]}"
+
+
+class WordStyles:
+    """Paragraph and character styles, list definitions and hyperlink targets of one document"""
+
+    def __init__(self, docx: zipfile.ZipFile):
+        names = set(docx.namelist())
+        self.styles: Dict[str, Dict] = {}
+        self.default_style = None
+        self.list_formats: Dict[Tuple[str, int], Tuple[str, int]] = {}
+        self.links: Dict[str, str] = {}
+        if 'word/styles.xml' in names:
+            self._load_styles(etree.fromstring(docx.read('word/styles.xml')))
+        if 'word/numbering.xml' in names:
+            self._load_numbering(etree.fromstring(docx.read('word/numbering.xml')))
+        if 'word/_rels/document.xml.rels' in names:
+            for rel in etree.fromstring(docx.read('word/_rels/document.xml.rels')).iter(RELS + 'Relationship'):
+                if rel.get('TargetMode') == 'External':
+                    self.links[rel.get('Id')] = rel.get('Target')
+
+    def _load_styles(self, root):
+        for style in root.iter(W + 'style'):
+            style_id = style.get(W + 'styleId')
+            paragraph_properties = style.find(W + 'pPr')
+            run_properties = style.find(W + 'rPr')
+            num_properties = paragraph_properties.find(W + 'numPr') if paragraph_properties is not None else None
+            self.styles[style_id] = {
+                'name': (_val(style, W + 'name') or style_id or '').lower(),
+                'based_on': _val(style, W + 'basedOn'),
+                'outline': _val(paragraph_properties, W + 'outlineLvl'),
+                'num_id': _val(num_properties, W + 'numId'),
+                'list_level': int(_val(num_properties, W + 'ilvl') or 0),
+                'bold': _toggle(run_properties, W + 'b'),
+                'italic': _toggle(run_properties, W + 'i'),
+            }
+            if style.get(W + 'type') == 'paragraph' and style.get(W + 'default') in ('1', 'true'):
+                self.default_style = style_id
+
+    def _load_numbering(self, root):
+        abstract_levels = {}
+        for abstract in root.iter(W + 'abstractNum'):
+            levels = {}
+            for level in abstract.iter(W + 'lvl'):
+                levels[int(level.get(W + 'ilvl', 0))] = (
+                    _val(level, W + 'numFmt') or 'decimal',
+                    int(_val(level, W + 'start') or 1),
+                )
+            abstract_levels[abstract.get(W + 'abstractNumId')] = levels
+        for num in root.iter(W + 'num'):
+            for level, list_format in abstract_levels.get(_val(num, W + 'abstractNumId'), {}).items():
+                self.list_formats[(num.get(W + 'numId'), level)] = list_format
+
+    def lookup(self, style_id: Optional[str], key: str):
+        """A style property, following the basedOn chain"""
+        seen = set()
+        while style_id in self.styles and style_id not in seen:
+            seen.add(style_id)
+            value = self.styles[style_id][key]
+            if value is not None:
+                return value
+            style_id = self.styles[style_id]['based_on']
+        return None
+
+    def heading_level(self, style_id: Optional[str]) -> int:
+        """1-9 for 'Heading N' styles (or an outline level), 0 for the Title style and body text"""
+        start = style_id
+        seen = set()
+        while style_id in self.styles and style_id not in seen:
+            seen.add(style_id)
+            match = HEADING_STYLE_RE.match(self.styles[style_id]['name'])
+            if match:
+                return int(match.group(1))
+            style_id = self.styles[style_id]['based_on']
+        outline = self.lookup(start, 'outline')
+        return int(outline) + 1 if outline is not None and int(outline) < 9 else 0
+
+    def is_title(self, style_id: Optional[str]) -> bool:
+        return style_id in self.styles and self.styles[style_id]['name'] == 'title'
+
+    def list_format(self, num_id: str, level: int) -> Tuple[str, int]:
+        """(numFmt, start) of a list level; unknown lists are treated as bullets"""
+        return self.list_formats.get((num_id, level), ('bullet', 1))
+
+
+class DOCXMarkdownConverter:
+    """Streams a DOCX as Markdown blocks without building a document object model"""
+
+    # on: .docx uploads are converted locally, without Claude
+    # cleanup: convert locally, then let Claude tidy the Markdown; off: send the extracted text to Claude
+    MODE = os.environ.get('LOCAL_DOCX_MARKDOWN', 'on').lower()
+
+    @classmethod
+    def _runs_markdown(cls, element, styles: WordStyles, plain: bool = False) -> str:
+        """Markdown for the runs of a paragraph (or hyperlink), merging runs that share formatting"""
+        pieces: List[Tuple[str, bool, bool]] = []
+        for child in element:
+            if child.tag == RUN:
+                pieces.extend(cls._run_pieces(child, styles))
+            elif child.tag == HYPERLINK:
+                text = cls._runs_markdown(child, styles, plain)
+                target = styles.links.get(child.get(R + 'id'))
+                if target and text.strip() and not plain:
+                    text = f"[{text}]({target})"
+                pieces.append((text, False, False))
+            elif child.tag not in REMOVED:
+                # Tracked insertions, smart tags, content controls and field wrappers hold more runs
+                pieces.append((cls._runs_markdown(child, styles, plain), False, False))
+
+        merged: List[List] = []
+        for text, bold, italic in pieces:
+            if plain:
+                bold = italic = False
+            if merged and merged[-1][1:] == [bold, italic]:
+                merged[-1][0] += text
+            else:
+                merged.append([text, bold, italic])
+        return ''.join(_emphasize(text, bold, italic) for text, bold, italic in merged)
+
+    @staticmethod
+    def _run_pieces(run, styles: WordStyles) -> Iterator[Tuple[str, bool, bool]]:
+        properties = run.find(W + 'rPr')
+        char_style = _val(properties, W + 'rStyle')
+        bold = _toggle(properties, W + 'b')
+        italic = _toggle(properties, W + 'i')
+        bold = bold if bold is not None else bool(styles.lookup(char_style, 'bold'))
+        italic = italic if italic is not None else bool(styles.lookup(char_style, 'italic'))
+
+        for node in run:
+            if node.tag == W + 't':
+                yield INLINE_ESCAPE_RE.sub(r'\\\1', node.text or ''), bold, italic
+            elif node.tag == W + 'tab':
+                yield '\t', bold, italic
+            elif node.tag in (W + 'br', W + 'cr') and node.get(W + 'type') != 'page':
+                yield '<br>', False, False
+            elif node.tag == W + 'noBreakHyphen':
+                yield '-', bold, italic
+            elif node.tag == W + 'footnoteReference':
+                yield f"[^{node.get(W + 'id')}]", False, False
+            elif node.tag == W + 'endnoteReference':
+                yield f"[^e{node.get(W + 'id')}]", False, False
+
+    @classmethod
+    def _paragraph_block(cls, paragraph, styles: WordStyles, state: Dict) -> Optional[Tuple[str, str]]:
+        """(kind, markdown) for one body paragraph, or None if it has no text"""
+        properties = paragraph.find(W + 'pPr')
+        style_id = _val(properties, W + 'pStyle') or styles.default_style
+        title = styles.is_title(style_id)
+        level = styles.heading_level(style_id)
+        outline = _val(properties, W + 'outlineLvl')
+        if outline is not None and int(outline) < 9:
+            level = int(outline) + 1
+
+        text = cls._runs_markdown(paragraph, styles, plain=bool(level or title)).strip()
+        if not text.replace('<br>', '').strip():
+            return None
+        if title:
+            # The Title style becomes the single '#' heading and pushes 'Heading N' down to N + 1
+            state['heading_shift'] = 1
+            return 'heading', '# ' + text.replace('<br>', ' ')
+        if level:
+            return 'heading', '#' * min(level + state['heading_shift'], 6) + ' ' + text.replace('<br>', ' ')
+
+        num_properties = properties.find(W + 'numPr') if properties is not None else None
+        num_id = _val(num_properties, W + 'numId') or styles.lookup(style_id, 'num_id')
+        if num_id and num_id != '0':
+            list_level = _val(num_properties, W + 'ilvl')
+            list_level = int(list_level) if list_level is not None else styles.lookup(style_id, 'list_level') or 0
+            list_format, start = styles.list_format(num_id, list_level)
+            counts = state['lists'].setdefault(num_id, [])
+            del counts[list_level + 1:]  # A shallower item restarts the numbering of deeper levels
+            counts.extend([start - 1] * (list_level + 1 - len(counts)))
+            counts[list_level] += 1
+            marker = '-' if list_format in ('bullet', 'none') else f"{counts[list_level]}."
+            return 'item', '    ' * list_level + marker + ' ' + text
+
+        if BLOCK_SYNTAX_RE.match(text):
+            text = '\\' + text
+        if styles.lookup(style_id, 'name') in QUOTE_STYLES:
+            return 'quote', '> ' + text
+        return 'paragraph', text
+
+    @classmethod
+    def _row_cells(cls, row, styles: WordStyles) -> List[str]:
+        cells = []
+        for cell in row.iterchildren(CELL):
+            paragraphs = (cls._runs_markdown(p, styles).strip() for p in cell.iter(PARAGRAPH))
+            cells.append('<br>'.join(text for text in paragraphs if text).replace('|', '\\|'))
+        return cells
+
+    @classmethod
+    def _iter_part(cls, docx: zipfile.ZipFile, part: str, styles: WordStyles) -> Iterator[Tuple[str, str]]:
+        """Yield (kind, markdown) for the top-level paragraphs and table rows of one XML part, in order"""
+        state = {'lists': {}, 'heading_shift': 0}  # Per-list item counters; heading offset after a Title
+        table_depth = 0
+        header_row = False
+        with docx.open(part) as xml:
+            for event, element in etree.iterparse(xml, events=('start', 'end'), tag=(PARAGRAPH, TABLE, ROW),
+                                                  huge_tree=True):
+                if element.tag == TABLE:
+                    table_depth += 1 if event == 'start' else -1
+                    if event == 'start' and table_depth == 1:
+                        header_row = True
+                    elif event == 'end' and table_depth == 0:
+                        _release(element)
+                elif event == 'start':
+                    continue
+                elif element.tag == ROW and table_depth == 1:
+                    cells = cls._row_cells(element, styles)
+                    if cells:
+                        row = '| ' + ' | '.join(cells) + ' |'
+                        if header_row:
+                            # Markdown tables need a header; Word's first row usually is one
+                            yield 'table', row + '\n|' + ' --- |' * len(cells)
+                            header_row = False
+                        else:
+                            yield 'row', row
+                    _release(element)
+                elif element.tag == PARAGRAPH and table_depth == 0:
+                    block = cls._paragraph_block(element, styles, state)
+                    if block:
+                        yield block
+                    _release(element)
+
+    @classmethod
+    def _iter_margin(cls, docx: zipfile.ZipFile, names, pattern, styles: WordStyles) -> Iterator[Tuple[str, str]]:
+        """Blocks of every header (or footer) part, each distinct block once, as DOCXExtractor._iter_margin"""
+        parts = sorted((name for name in names if pattern.match(name)),
+                       key=lambda name: int(pattern.match(name).group(1) or 0))
+        seen = set()
+        for part in parts:
+            for block in cls._iter_part(docx, part, styles):
+                if block not in seen:
+                    seen.add(block)
+                    yield block
+
+    @classmethod
+    def _iter_notes(cls, docx: zipfile.ZipFile, part: str, prefix: str, styles: WordStyles) -> Iterator[Tuple[str, str]]:
+        with docx.open(part) as xml:
+            for _, note in etree.iterparse(xml, tag=(W + 'footnote', W + 'endnote'), huge_tree=True):
+                if note.get(W + 'type') not in NOTE_SEPARATORS:
+                    paragraphs = (cls._runs_markdown(p, styles).strip() for p in note.iter(PARAGRAPH))
+                    text = ' '.join(text for text in paragraphs if text)
+                    if text:
+                        yield 'note', f"[^{prefix}{note.get(W + 'id')}]: {text}"
+                _release(note)
+
+    @classmethod
+    def iter_markdown(cls, source: DOCXSource) -> Iterator[str]:
+        """Yield the document as Markdown, block by block, each with its leading separator"""
+        with DOCXExtractor._open_zip(source) as docx:
+            styles = WordStyles(docx)
+            names = set(docx.namelist())
+            blocks = chain(
+                cls._iter_margin(docx, names, HEADER_PART_RE, styles),
+                cls._iter_part(docx, 'word/document.xml', styles),
+                cls._iter_margin(docx, names, FOOTER_PART_RE, styles),
+            )
+            for prefix, part in (('', 'word/footnotes.xml'), ('e', 'word/endnotes.xml')):
+                if part in names:
+                    blocks = chain(blocks, cls._iter_notes(docx, part, prefix, styles))
+
+            previous = None
+            for kind, markdown in blocks:
+                if previous is not None:
+                    continues = kind in CONTINUING_KINDS and previous in (kind, 'table' if kind == 'row' else kind)
+                    yield "\n" if continues else "\n\n"
+                yield markdown
+                previous = kind
+            if previous is not None:
+                yield "\n"
+
+    @classmethod
+    def convert(cls, source: DOCXSource) -> str:
+        """Convert a DOCX to Markdown"""
+        return "".join(cls.iter_markdown(source))
@@ -0,0 +1,130 @@
+"""
+Extraction Cache Module for De-PDF
+Content-addressed on-disk cache of extracted document text, bounded in size with LRU eviction
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionCache:
+    """
+    Maps (SHA-256 of the uploaded bytes, extractor version) to extracted text.
+    Entries are JSON files under `directory`; the least recently used ones are deleted
+    once the directory grows past `max_bytes`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self._total_bytes = 0
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+            self._load_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _load_index(self):
+        """Rebuild the LRU order from the files left by earlier runs (oldest access first)"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, name[:-len('.json')], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.json')
+
+    @staticmethod
+    def make_key(content_hash: str, extractor_version: str) -> str:
+        return hashlib.sha256(f"{content_hash}:{extractor_version}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), 'r', encoding='utf-8') as f:
+                    value = json.load(f)
+                os.utime(self._path(key))  # Persist the access order for the next start-up
+            except (OSError, ValueError) as e:
+                logger.warning(f"Dropping unreadable cache entry {key}: {e}")
+                self._forget(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Dict):
+        if not self.enabled:
+            return
+        data = json.dumps(value).encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            # Write to a temp file first so readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+
+            self._total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            while self._total_bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._forget(oldest)
+                self.evictions += 1
+
+    def _forget(self, key: str):
+        self._total_bytes -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def get_or_extract(self, content_hash: str, extractor_version: str,
+                       extract: Callable[[], Tuple[str, int]]) -> Tuple[str, int]:
+        """Return (text, skipped_pages) from the cache, running `extract` only on a miss"""
+        key = self.make_key(content_hash, extractor_version)
+        cached = self.get(key)
+        if cached is not None:
+            print(f"Extraction cache hit ({extractor_version}, {self.hits} hits / {self.misses} misses)", flush=True)
+            return cached['text'], cached.get('skipped_pages', 0)
+
+        text, skipped_pages = extract()
+        if text.strip():  # Don't pin failed extractions in the cache
+            self.put(key, {'text': text, 'skipped_pages': skipped_pages})
+        return text, skipped_pages
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+            }
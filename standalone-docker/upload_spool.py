@@ -0,0 +1,97 @@
+"""
+Upload Spooling Module for De-PDF
+Streams multipart uploads straight to temporary files so documents are never held in RAM whole
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import logging
+
+from flask import Request
+
+logger = logging.getLogger(__name__)
+
+# Directory for spooled uploads (defaults to the system temp directory)
+SPOOL_DIR = os.environ.get('UPLOAD_SPOOL_DIR') or None
+
+# Upper bound on a request body, enforced by Flask/Werkzeug while the upload is read
+MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 256 * 1024 * 1024))
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def _new_spool_file():
+    return tempfile.NamedTemporaryFile('wb+', prefix='de-pdf-upload-', dir=SPOOL_DIR, delete=False)
+
+
+class SpoolingRequest(Request):
+    """Request that writes every uploaded file directly to a named temporary file"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spool = _new_spool_file()
+        self.__dict__.setdefault('_spooled_files', []).append(spool)
+        return spool
+
+    def close(self) -> None:
+        """Close uploaded files and delete any spool file no SpooledUpload has taken over"""
+        super().close()
+        for spool in self.__dict__.get('_spooled_files', []):
+            if not getattr(spool, 'claimed', False):
+                _remove(spool.name)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Could not remove spooled upload {path}: {e}")
+
+
+class SpooledUpload:
+    """
+    An uploaded file backed by a temporary file on disk.
+    Extractors receive `path` instead of bytes; call cleanup() (or use as a context manager)
+    once extraction is finished.
+    """
+
+    def __init__(self, file_storage):
+        self.filename = file_storage.filename or ''
+        stream = file_storage.stream
+
+        if not isinstance(getattr(stream, 'name', None), str):
+            # Not spooled by SpoolingRequest - copy it out in bounded chunks
+            spool = _new_spool_file()
+            shutil.copyfileobj(stream, spool, COPY_BUFFER_SIZE)
+            stream = spool
+
+        stream.flush()
+        stream.claimed = True  # Keeps SpoolingRequest.close() from deleting it under us
+        stream.close()
+        self.path = stream.name
+        self.size = os.path.getsize(self.path)
+        self._sha256 = None
+
+    def sha256(self) -> str:
+        """Hex SHA-256 of the uploaded bytes, read back from disk in bounded chunks"""
+        if self._sha256 is None:
+            digest = hashlib.sha256()
+            with open(self.path, 'rb') as f:
+                for block in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+                    digest.update(block)
+            self._sha256 = digest.hexdigest()
+        return self._sha256
+
+    def cleanup(self):
+        """Delete the spooled file; safe to call more than once"""
+        if self.path:
+            _remove(self.path)
+            self.path = None
+
+    def __enter__(self) -> 'SpooledUpload':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
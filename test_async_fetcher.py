@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Check the async Level 2 fetcher against a mock transport: 200, 304 revalidation, 429 and the body cap
+
+Runs under pytest or directly: python test_async_fetcher.py
+"""
+
+import sys
+import os
+import asyncio
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+import async_fetcher
+from async_fetcher import AsyncURLFetcher
+from http_cache import HTTPCache
+
+URL = 'http://async-test.example/article'
+ETAG = '"v1"'
+ARTICLE = (
+    "<html><head><title>Async Article</title></head><body><article>"
+    + "".join(f"<p>Paragraph {i} of the article, with enough text to count as real content.</p>" for i in range(40))
+    + "</article></body></html>"
+).encode('utf-8')
+
+
+def run(handler, coroutine):
+    """Run `coroutine(fetcher)` with every request answered by `handler`; returns (result, requests seen)"""
+    seen = []
+
+    def record(request):
+        seen.append(request)
+        return handler(request)
+
+    async def main():
+        async with AsyncURLFetcher(http2=False, transport=httpx.MockTransport(record)) as fetcher:
+            return await coroutine(fetcher)
+
+    return asyncio.run(main()), seen
+
+
+def test_200_extracts_the_page():
+    handler = lambda request: httpx.Response(200, headers={'Content-Type': 'text/html'}, content=ARTICLE)
+    (text, title, _), seen = run(handler, lambda fetcher: fetcher.fetch_and_extract(URL))
+    assert title == 'Async Article' and 'Paragraph 39' in text
+    assert len(seen) == 1
+    print(f"200: {len(text)} characters OK")
+
+
+def test_304_reuses_the_cached_entry():
+    cache = HTTPCache(tempfile.mkdtemp(), 10 * 1024 * 1024)
+
+    def handler(request):
+        if request.headers.get('If-None-Match') == ETAG:
+            return httpx.Response(304, headers={'ETag': ETAG})
+        return httpx.Response(200, headers={'Content-Type': 'text/html', 'ETag': ETAG}, content=ARTICLE)
+
+    first, _ = run(handler, lambda fetcher: fetcher.fetch_and_extract(URL, cache))
+    second, seen = run(handler, lambda fetcher: fetcher.fetch_and_extract(URL, cache))
+    assert second == first
+    assert seen[0].headers['If-None-Match'] == ETAG
+    assert cache.stats()['revalidated'] == 1
+    print("304 revalidation OK")
+
+
+def test_429_retries_then_gives_up():
+    responses = iter([httpx.Response(429, headers={'Retry-After': '0'}),
+                      httpx.Response(200, headers={'Content-Type': 'text/html'}, content=ARTICLE)])
+    (response, body), seen = run(lambda request: next(responses),
+                                 lambda fetcher: fetcher.fetch_with_retry(URL, max_retries=2))
+    assert response.status_code == 200 and body == ARTICLE and len(seen) == 2
+
+    try:
+        run(lambda request: httpx.Response(429, headers={'Retry-After': '0'}),
+            lambda fetcher: fetcher.fetch_with_retry(URL, max_retries=2))
+    except Exception as e:
+        assert 'Rate limited' in str(e)
+    else:
+        raise AssertionError("a 429 on every attempt must raise")
+    print("429 retry OK")
+
+
+def test_oversized_body_is_refused():
+    async def chunks():
+        for _ in range(8):
+            yield b'<p>' + b'x' * 1024 + b'</p>'
+
+    default_max = async_fetcher.URL_MAX_BODY_BYTES
+    async_fetcher.URL_MAX_BODY_BYTES = 4096
+    try:
+        # No Content-Length, so the cap has to trip while streaming
+        run(lambda request: httpx.Response(200, headers={'Content-Type': 'text/html'}, content=chunks()),
+            lambda fetcher: fetcher.fetch_with_retry(URL, max_retries=1))
+    except Exception as e:
+        assert 'too large' in str(e)
+    else:
+        raise AssertionError("a body over the cap must be refused")
+    finally:
+        async_fetcher.URL_MAX_BODY_BYTES = default_max
+    print("body cap OK")
+
+
+if __name__ == "__main__":
+    test_200_extracts_the_page()
+    test_304_reuses_the_cached_entry()
+    test_429_retries_then_gives_up()
+    test_oversized_body_is_refused()
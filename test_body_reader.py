@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Check that URL bodies are capped while streaming and that non-document payloads are refused from their first KB
+
+Runs under pytest or directly: python test_body_reader.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from url_enhancer import BodyReader, sniff_document, SNIFF_BYTES
+
+URL = 'https://example.com/page'
+PAGE = b'<!DOCTYPE html><html><head><title>Page</title></head><body>' + b'<p>Text.</p>' * 200 + b'</body></html>'
+
+
+def refused(headers, chunks, max_bytes=1024 * 1024, check_document=True):
+    """The error a BodyReader raises on these headers and chunks, or None if it accepts the body"""
+    try:
+        reader = BodyReader(URL, headers, max_bytes, check_document)
+        for chunk in chunks:
+            reader.feed(chunk)
+        reader.finish()
+    except Exception as e:
+        return str(e)
+    return None
+
+
+def test_size_cap():
+    # A declared length over the cap is refused before anything is read
+    assert 'too large' in refused({'Content-Type': 'text/html', 'Content-Length': str(2 * 1024 * 1024)}, [])
+    # Without one, the cap trips on the chunk that crosses it
+    fed = []
+    chunks = (fed.append(i) or b'<p>' + b'x' * 1000 + b'</p>' for i in range(100))
+    assert 'too large' in refused({'Content-Type': 'text/html'}, chunks, max_bytes=4096)
+    assert len(fed) == 5
+    assert refused({'Content-Type': 'text/html', 'Content-Length': str(len(PAGE))}, [PAGE]) is None
+    print("size cap OK")
+
+
+def test_sniffing():
+    pdf = b'%PDF-1.7\n' + b'\x00' * 4000
+    assert 'application/pdf' in refused({'Content-Type': 'application/pdf'}, [pdf])
+    # Mislabelled or unlabelled binaries are caught by their signature...
+    assert 'binary file' in refused({'Content-Type': 'text/html'}, [pdf])
+    assert 'binary file' in refused({'Content-Type': 'application/octet-stream'}, [b'\x89PNG\r\n\x1a\n' + b'\x00' * 10])
+    assert 'binary file' in refused({}, [b'\x00\x00\x00\x18ftypmp42' + b'\x00' * 2000])
+    # ...or by NUL bytes, unless a UTF-16 byte-order mark explains them
+    assert 'binary data' in refused({'Content-Type': 'text/html'}, [b'<html>\x00\x01\x02' * 400])
+    assert refused({'Content-Type': 'text/html'}, ['\ufeff<html><p>Hi</p></html>'.encode('utf-16-le')]) is None
+    # Error pages (check_document=False) are not sniffed
+    assert refused({'Content-Type': 'application/json'}, [b'{"error": "not found"}'], check_document=False) is None
+    print("sniffing OK")
+
+
+def test_sniffs_first_kb_only():
+    # The verdict comes as soon as SNIFF_BYTES have arrived, not at the end of the body
+    fed = []
+    chunks = (fed.append(i) or (b'%PDF-1.4' + b'a' * 500 if i == 0 else b'a' * 512) for i in range(100))
+    assert 'binary file' in refused({'Content-Type': 'text/html'}, chunks)
+    assert len(fed) * 512 >= SNIFF_BYTES and len(fed) < 5
+    # Small bodies are sniffed in finish()
+    assert 'binary file' in refused({'Content-Type': 'text/html'}, [b'GIF89a'])
+    assert sniff_document('text/html; charset=utf-8', PAGE[:SNIFF_BYTES]) is None
+    print("first KB OK")
+
+
+if __name__ == "__main__":
+    test_size_cap()
+    test_sniffing()
+    test_sniffs_first_kb_only()
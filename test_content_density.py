@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Compare the one-pass content scoring (find_content_by_density) with the get_text() selection it replaced
+
+Runs under pytest or directly: python test_content_density.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bs4 import BeautifulSoup
+
+from url_enhancer import URLEnhancer, decode_body
+from benchmark_extraction import get_text_density_content, make_deep_html
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'html')
+
+
+def parse(markup):
+    return BeautifulSoup(markup, 'html.parser')
+
+
+def test_matches_baseline_on_fixtures():
+    # No paragraphs of scoring length in these: the fallback must pick the same block as before
+    names = sorted(os.listdir(FIXTURE_DIR))
+    assert names, f"No fixtures in {FIXTURE_DIR}"
+    for name in names:
+        with open(os.path.join(FIXTURE_DIR, name), 'rb') as f:
+            soup = parse(decode_body(f.read(), {}))
+        assert URLEnhancer.find_content_by_density(soup) is get_text_density_content(soup), name
+    print(f"{len(names)} fixtures OK")
+
+
+def test_deep_page_finds_the_story():
+    soup = parse(make_deep_html(0.05))
+    # The baseline takes the outermost wrapper, sidebars and all; scoring finds the story itself
+    assert get_text_density_content(soup)['class'] == ['wrap-0']
+    content = URLEnhancer.find_content_by_density(soup)
+    assert content['class'] == ['story-text']
+    assert not content.find('a')
+    print("deep page OK")
+
+
+def test_link_lists_lose():
+    links = ''.join(f'<li><a href="/s{i}">A much longer related headline, number {i}, about the markets</a></li>'
+                    for i in range(30))
+    story = ''.join(f'<p>Paragraph {i} of the story, with a clause, another clause, and enough words to score.</p>'
+                    for i in range(5))
+    soup = parse(f'<html><body><div id="nav"><ul>{links}</ul></div><div id="story">{story}</div></body></html>')
+    assert get_text_density_content(soup)['id'] == 'nav'  # More text, almost all of it links
+    assert URLEnhancer.find_content_by_density(soup)['id'] == 'story'
+    print("link density OK")
+
+
+if __name__ == "__main__":
+    test_matches_baseline_on_fixtures()
+    test_deep_page_finds_the_story()
+    test_link_lists_lose()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Check how the extraction pipeline cuts text into Claude calls, including the truncation notice
+
+Runs under pytest or directly: python test_conversion_pipeline.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from conversion_pipeline import ExtractionPipeline
+
+NOTICE = "\n\n[Article continues but was truncated due to length...]"
+
+
+def run(pieces, max_chars, first=None, chunk=None):
+    pipeline = ExtractionPipeline(iter(pieces), max_chars)
+    if first is not None:
+        pipeline.FIRST_CHUNK_CHARS = first
+    if chunk is not None:
+        pipeline.CHUNK_CHARS = chunk
+    return list(pipeline.start().chunks())
+
+
+def test_untruncated_text_has_no_notice():
+    chunks = run(['line %02d\n' % i for i in range(20)], 100000, first=30, chunk=60)
+    assert ''.join(chunks) == ''.join('line %02d\n' % i for i in range(20))
+    assert all(len(c) <= 60 for c in chunks)
+    print(f"{len(chunks)} chunks, no notice OK")
+
+
+def test_notice_is_never_split():
+    chunks = run(['line %02d text\n' % i for i in range(10)], 60, first=10, chunk=40)
+    assert chunks[-1].endswith(NOTICE) and chunks[-1] != NOTICE
+    assert not any('truncated' in c for c in chunks[:-1])
+    print("notice kept whole OK")
+
+
+def test_exact_budget():
+    # 40 pieces of 4000 chars against a 100000 budget: the budget runs out exactly on a piece boundary
+    chunks = run(['x' * 3999 + '\n'] * 40, 100000)
+    assert ''.join(chunks) == ('x' * 3999 + '\n') * 25 + NOTICE
+    assert chunks[-1].endswith(NOTICE) and len(chunks[-1]) > len(NOTICE)
+    assert sum(c.count('truncated') for c in chunks) == 1
+    print(f"exact budget: {len(chunks)} chunks, last {len(chunks[-1])} chars OK")
+
+
+if __name__ == "__main__":
+    test_untruncated_text_has_no_notice()
+    test_notice_is_never_split()
+    test_exact_budget()
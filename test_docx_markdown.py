@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Check the local DOCX to Markdown conversion, and the plain text extraction, on a fixture with page
+headers, footers and tracked changes
+
+Runs under pytest or directly: python test_docx_markdown.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from docx_markdown import DOCXMarkdownConverter
+from docx_extractor import DOCXExtractor
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'docx', 'tracked_changes.docx')
+
+EXPECTED = (
+    "Acme Corp Quarterly Report\n\n"
+    "# Results\n\n"
+    "Revenue grew sharply this quarter.\n\n"
+    "Margins held steady.\n\n"
+    "**Costs** fell.\n\n"
+    "Confidential\n"
+)
+
+
+def test_fixture_markdown():
+    markdown = DOCXMarkdownConverter.convert(FIXTURE)
+    assert markdown == EXPECTED, markdown
+    print(f"{len(markdown)} characters OK")
+
+
+def test_headers_and_footers():
+    markdown = DOCXMarkdownConverter.convert(FIXTURE)
+    # header1.xml and header2.xml carry the same text; it is kept once, before the body
+    assert markdown.startswith("Acme Corp Quarterly Report\n") and markdown.count("Acme Corp") == 1
+    assert markdown.endswith("Confidential\n")
+    print("headers and footers OK")
+
+
+def test_tracked_changes():
+    markdown = DOCXMarkdownConverter.convert(FIXTURE)
+    assert "slightly" not in markdown  # w:del
+    assert "sharply" in markdown  # w:ins
+    assert markdown.count("fell.") == 1  # w:moveFrom skipped, w:moveTo kept
+    assert markdown.index("Margins") < markdown.index("Costs")
+    print("tracked changes OK")
+
+
+def test_plain_text_skips_moved_from_text():
+    text = DOCXExtractor.extract_text(FIXTURE)
+    assert text.count("Costs fell.") == 1 and "slightly" not in text
+    assert text.index("Margins") < text.index("Costs")
+    print("plain text OK")
+
+
+if __name__ == "__main__":
+    test_fixture_markdown()
+    test_headers_and_footers()
+    test_tracked_changes()
+    test_plain_text_skips_moved_from_text()
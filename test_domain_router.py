@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Check per-domain fetch level routing, the circuit breaker and that both survive a restart
+
+Runs under pytest or directly: python test_domain_router.py
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from domain_router import DomainRouter, CircuitOpenError
+
+DOMAIN = 'example.com'
+
+
+def new_router():
+    return DomainRouter(os.path.join(tempfile.mkdtemp(), 'domain_routes.json'))
+
+
+def circuit_open(router, domain=DOMAIN):
+    try:
+        router.check_circuit(domain)
+    except CircuitOpenError:
+        return True
+    return False
+
+
+def test_preferred_level():
+    router = new_router()
+    assert router.preferred_level(DOMAIN) == 'level2'
+
+    # Level 2 failing alone is not enough: Level 3 has to be known to work
+    for _ in range(DomainRouter.MIN_SAMPLES):
+        router.record_level(DOMAIN, 'level2', False, 1.0)
+    assert router.preferred_level(DOMAIN) == 'level2'
+    router.record_level(DOMAIN, 'level3', True, 4.0)
+
+    # Routed to Level 3, except every PROBE_EVERY-th conversion, which re-tries Level 2
+    levels = [router.preferred_level(DOMAIN) for _ in range(2 * DomainRouter.PROBE_EVERY)]
+    assert levels.count('level2') == 2
+    assert levels[DomainRouter.PROBE_EVERY - 1] == levels[-1] == 'level2'
+
+    # Once Level 2 recovers the domain goes back to it
+    for _ in range(5):
+        router.record_level(DOMAIN, 'level2', True, 0.5)
+    assert router.preferred_level(DOMAIN) == 'level2'
+    assert router.preferred_level('other.com') == 'level2'
+    print("preferred level OK")
+
+
+def test_hedge_delay():
+    router = new_router()
+    assert router.hedge_delay(DOMAIN, 8.0) == 8.0
+    router.record_level(DOMAIN, 'level2', True, 0.2)
+    assert router.hedge_delay(DOMAIN, 8.0) == 1.0  # Twice the latency, but at least 1s
+    router.record_level(DOMAIN, 'level2', True, 3.0)
+    assert 1.0 < router.hedge_delay(DOMAIN, 8.0) < 8.0
+    print("hedge delay OK")
+
+
+def test_circuit_breaker():
+    router = new_router()
+    for _ in range(DomainRouter.FAILURE_THRESHOLD - 1):
+        router.record_outcome(DOMAIN, False, site_failure=True)
+    # Failures on our side (timeouts of the app itself, cancelled fetches) do not count
+    router.record_outcome(DOMAIN, False, site_failure=False)
+    assert not circuit_open(router)
+
+    router.record_outcome(DOMAIN, False, site_failure=True)
+    assert circuit_open(router) and not circuit_open(router, 'other.com')
+    assert router._domains[DOMAIN]['cooldown'] == DomainRouter.BASE_COOLDOWN
+
+    # The cool-down ends, the next try fails again: the breaker re-opens for twice as long
+    router._domains[DOMAIN]['open_until'] = 0.0
+    assert not circuit_open(router)
+    router.record_outcome(DOMAIN, False, site_failure=True)
+    assert circuit_open(router)
+    assert router._domains[DOMAIN]['cooldown'] == 2 * DomainRouter.BASE_COOLDOWN
+
+    # One success closes it and resets the cool-down
+    router.record_outcome(DOMAIN, True)
+    assert not circuit_open(router)
+    assert router.stats()[DOMAIN]['consecutive_failures'] == 0
+    print("circuit breaker OK")
+
+
+def test_survives_restart():
+    router = new_router()
+    router.record_level(DOMAIN, 'level2', True, 0.4)
+    for _ in range(DomainRouter.FAILURE_THRESHOLD):
+        router.record_outcome(DOMAIN, False, site_failure=True)
+
+    restarted = DomainRouter(router.path)
+    assert restarted.stats()[DOMAIN]['levels'] == router.stats()[DOMAIN]['levels']
+    assert circuit_open(restarted)
+
+    with open(router.path, 'w') as f:
+        f.write('{not json')
+    assert DomainRouter(router.path).stats() == {}
+    print("restart OK")
+
+
+if __name__ == "__main__":
+    test_preferred_level()
+    test_hedge_delay()
+    test_circuit_breaker()
+    test_survives_restart()
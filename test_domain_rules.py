@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Check domain rule matching and that a domain's rules drive extraction
+
+Runs under pytest or directly: python test_domain_rules.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from domain_rules import DomainRules, DOMAIN_RULES, RENDER_STRIP, RENDER_CONTENT
+from url_enhancer import URLEnhancer
+
+RULES = DomainRules({
+    'domains': [
+        {'hosts': ['example.com'], 'content': ['div.story'], 'strip': ['.share'], 'author': ['.byline']},
+        {'hosts': ['blog.example.com'], 'fetch_level': 'level3'},
+    ]
+})
+
+PAGE = """<html><head><title>Story</title><meta name="author" content="Meta Author"></head><body>
+<article><p>Teaser that the generic selectors would pick.</p></article>
+<div class="story"><p class="byline">Site Author</p><p>The story text.</p><div class="share">Share this</div></div>
+</body></html>"""
+
+
+def test_suffix_matching():
+    assert RULES.find('example.com').hosts == ['example.com']
+    assert RULES.find('www.example.com').hosts == ['example.com']
+    assert RULES.find('blog.example.com').fetch_level == 'level3'
+    assert RULES.find('news.blog.example.com').fetch_level == 'level3'
+    assert RULES.find('notexample.com') is None
+    assert RULES.find('com') is None
+    assert RULES.rule_for('https://other.org/page') is RULES.default
+    print("suffix matching OK")
+
+
+def test_rule_merges_over_defaults():
+    rule = RULES.find('example.com')
+    assert rule.content_selectors[0] == 'div.story' and 'article' in rule.content_selectors
+    assert rule.strip_selectors[-1] == '.share' and 'script' in rule.strip_selectors
+    assert RULES.find('blog.example.com').content_selectors == RULES.default.content_selectors
+    print("merging OK")
+
+
+def test_extraction_uses_rule():
+    from bs4 import BeautifulSoup
+    rule = RULES.find('example.com')
+    soup = BeautifulSoup(PAGE, 'lxml')
+    assert rule.metadata(soup) == ('Story', 'Site Author')
+    rule.strip_boilerplate(soup)
+    assert rule.find_content(soup).get_text(' ', strip=True) == 'Site Author The story text.'
+    assert RULES.default.find_content(BeautifulSoup(PAGE, 'lxml')).name == 'article'
+    print("extraction OK")
+
+
+def test_render_selectors():
+    # Domains without a rule render exactly as before rules existed
+    assert RULES.default.render_selectors() == (RENDER_STRIP, RENDER_CONTENT)
+    strip, content = RULES.find('example.com').render_selectors()
+    assert strip == RENDER_STRIP + ['.share'] and content == ['div.story'] + RENDER_CONTENT
+    print("render selectors OK")
+
+
+def test_rule_version_follows_rule():
+    edited = DomainRules({'domains': [{'hosts': ['example.com'], 'content': ['div.article']}]})
+    assert edited.find('example.com').version != RULES.find('example.com').version
+    assert edited.default.version == RULES.default.version
+    print("rule versions OK")
+
+
+def test_archive_rule():
+    rule = DOMAIN_RULES.rule_for('https://archive.ph/AbCdE')
+    assert rule.render_on_rate_limit and rule.html_fallback and rule.wait_for == 'div#CONTENT'
+    html = ('<html><head><title>Archived</title></head><body><div id="HEADER">archive.today webpage capture</div>'
+            '<div id="CONTENT"><p>Archived article text.</p></div></body></html>')
+    text, title, author = URLEnhancer.extract_text_enhanced(html, 'https://archive.ph/AbCdE')
+    assert (text, title) == ('Archived article text.', 'Archived')
+    print("archive.ph OK")
+
+
+if __name__ == "__main__":
+    test_suffix_matching()
+    test_rule_merges_over_defaults()
+    test_extraction_uses_rule()
+    test_render_selectors()
+    test_rule_version_follows_rule()
+    test_archive_rule()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Check where a page's encoding comes from (BOM, header, <meta>/XML declaration) and that undeclared pages decode
+
+Runs under pytest or directly: python test_encoding.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from url_enhancer import resolve_encoding, decode_body
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'html')
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), 'rb') as f:
+        return f.read()
+
+
+def test_resolve_encoding():
+    meta = b'<html><head><meta charset="koi8-r"></head><body>Hi</body></html>'
+    assert resolve_encoding(meta, {'Content-Type': 'text/html; charset=ISO-8859-1'}) == ('iso8859-1', 'header')
+    assert resolve_encoding(meta, {'Content-Type': 'text/html'}) == ('koi8-r', 'meta')
+    assert resolve_encoding(meta, {}) == ('koi8-r', 'meta')
+    # A byte-order mark outranks a mislabelled header
+    assert resolve_encoding(fixture('bom_utf8.html'), {'Content-Type': 'text/html; charset=iso-8859-1'}) == ('utf-8', 'bom')
+    assert resolve_encoding(fixture('xml_declaration.html'), {}) == ('iso8859-1', 'meta')
+    assert resolve_encoding(fixture('windows1252.html'), {}) == ('cp1252', 'meta')
+    assert resolve_encoding(fixture('undeclared_latin1.html'), {'Content-Type': 'text/html'}) == (None, 'undeclared')
+    print("resolve_encoding OK")
+
+
+def test_unknown_charset_falls_through():
+    meta = b'<html><head><meta charset="utf-8"></head><body>Hi</body></html>'
+    # An unknown header charset is ignored in favour of the page's own declaration...
+    assert resolve_encoding(meta, {'Content-Type': 'text/html; charset=x-no-such-charset'}) == ('utf-8', 'meta')
+    # ...and an unknown declaration leaves the page undeclared
+    assert resolve_encoding(b'<meta charset="bogus"><p>Hi</p>', {}) == (None, 'undeclared')
+    print("unknown charset OK")
+
+
+def test_decode_body():
+    assert '日本語' in decode_body(fixture('bom_utf8.html'), {})
+    assert 'Grüße aus München' in decode_body(fixture('xml_declaration.html'), {})
+    assert '“best” café' in decode_body(fixture('windows1252.html'), {})
+    # Undeclared: not valid UTF-8, so decoded with the encoding guessed from a sample
+    assert 'Привет, как дела?' in decode_body(fixture('undeclared_cp1251.html'), {})
+    assert 'café, naïve, £ 5' in decode_body(fixture('undeclared_latin1.html'), {})
+    print("decode_body OK")
+
+
+if __name__ == "__main__":
+    test_resolve_encoding()
+    test_unknown_charset_falls_through()
+    test_decode_body()
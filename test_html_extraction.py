@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""Check that the lxml HTML extractor matches the old BeautifulSoup output on the fixture pages
+
+Runs under pytest or directly: python test_html_extraction.py
+"""
+
+import sys
+import os
+import warnings
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from html_extractor import HTMLExtractor
+from benchmark_extraction import beautifulsoup_html_text
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'html')
+
+
+def test_matches_beautifulsoup():
+    warnings.filterwarnings('ignore', module='bs4')  # XML-declaration and "looks like a filename" warnings
+    names = sorted(os.listdir(FIXTURE_DIR))
+    assert names, f"No fixtures in {FIXTURE_DIR}"
+    for name in names:
+        path = os.path.join(FIXTURE_DIR, name)
+        with open(path, 'rb') as f:
+            expected = beautifulsoup_html_text(f)
+        actual = HTMLExtractor.extract_text(path)
+        print(f"{name}: {len(actual)} chars {'OK' if actual == expected else 'DIFFERENT'}")
+        assert actual == expected, f"{name}: output differs from BeautifulSoup"
+
+
+if __name__ == "__main__":
+    test_matches_beautifulsoup()
+    print("OK")
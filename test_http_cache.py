@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Check HTTP cache freshness (Cache-Control, Expires, Age), what gets stored, and 304 revalidation
+
+Runs under pytest or directly: python test_http_cache.py
+"""
+
+import sys
+import os
+import time
+import tempfile
+from email.utils import formatdate
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from http_cache import HTTPCache, normalize_url
+
+URL = 'https://Example.com:443/story?id=7#comments'
+VERSION = 'url-test'
+RESULT = {'text': 'Body text', 'title': 'Title', 'author': None}
+
+
+def new_cache():
+    return HTTPCache(tempfile.mkdtemp(), 1024 * 1024)
+
+
+def test_fresh_until():
+    now = time.time()
+    assert abs(HTTPCache.fresh_until({'Cache-Control': 'public, max-age=600'}) - (now + 600)) < 2
+    # Time already spent in upstream caches counts against max-age
+    assert abs(HTTPCache.fresh_until({'Cache-Control': 'max-age=600', 'Age': '100'}) - (now + 500)) < 2
+    # Expires is measured from the server's Date, not our clock
+    headers = {'Date': formatdate(now - 3600, usegmt=True), 'Expires': formatdate(now - 3000, usegmt=True)}
+    assert abs(HTTPCache.fresh_until(headers) - (now + 600)) < 2
+    assert HTTPCache.fresh_until({'Cache-Control': 'no-cache, max-age=600'}) == 0
+    assert HTTPCache.fresh_until({'Cache-Control': 'max-age=soon'}) == 0
+    assert HTTPCache.fresh_until({'Expires': 'not a date'}) == 0
+    assert HTTPCache.fresh_until({}) == 0
+    print("fresh_until OK")
+
+
+def test_store_and_lookup():
+    cache = new_cache()
+    cache.store(URL, VERSION, {'ETag': '"a1"'}, RESULT)
+    # Scheme/host case, the default port and the fragment do not make a different entry
+    entry = cache.lookup('https://example.com/story?id=7', VERSION)
+    assert entry['result'] == RESULT and entry['etag'] == '"a1"'
+    assert entry['url'] == normalize_url(URL) == 'https://example.com/story?id=7'
+    assert cache.lookup(URL, 'url-other-version') is None
+    assert HTTPCache.validators(entry) == {'If-None-Match': '"a1"'}
+
+    # Nothing that would ever let the response be reused: not stored
+    for headers in ({}, {'ETag': '"a1"', 'Cache-Control': 'no-store'}, {'ETag': '"a1"', 'Vary': '*'}):
+        assert HTTPCache.make_entry(URL, headers, RESULT) is None, headers
+    print("store and lookup OK")
+
+
+def test_refresh_after_304():
+    cache = new_cache()
+    last_modified = formatdate(time.time() - 86400, usegmt=True)
+    cache.store(URL, VERSION, {'ETag': '"a1"', 'Last-Modified': last_modified, 'Cache-Control': 'no-cache'}, RESULT)
+    entry = cache.lookup(URL, VERSION)
+    assert not cache.is_fresh(entry)
+
+    # The 304 brings a new ETag and freshness; Last-Modified is missing, so the stored one stays
+    cache.refresh(URL, VERSION, entry, {'ETag': '"a2"', 'Cache-Control': 'max-age=300'})
+    refreshed = cache.lookup(URL, VERSION)
+    assert refreshed['etag'] == '"a2"' and refreshed['last_modified'] == last_modified
+    assert refreshed['headers']['Cache-Control'] == 'max-age=300'
+    assert cache.is_fresh(refreshed) and refreshed['result'] == RESULT
+    assert HTTPCache.validators(refreshed) == {'If-None-Match': '"a2"', 'If-Modified-Since': last_modified}
+
+    # A bare 304 keeps the stored freshness headers
+    cache.refresh(URL, VERSION, refreshed, {})
+    assert cache.is_fresh(cache.lookup(URL, VERSION))
+    assert cache.stats()['revalidated'] == 2
+    print("refresh OK")
+
+
+if __name__ == "__main__":
+    test_fresh_until()
+    test_store_and_lookup()
+    test_refresh_after_304()
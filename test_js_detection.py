@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Check the JavaScript-required classifier on the labelled fixture pages and compare it with the old substring check
+
+Fixtures in fixtures/js are named js_*.html (needs a Puppeteer render) or static_*.html (plain HTTP is enough).
+fixtures/js holds minimal pages, one signal each; fixtures/js/full holds complete pages with the markup production
+sites carry around the content (tag manager iframes, consent banners, hydration data, navigation and footers).
+Runs under pytest or directly: python test_js_detection.py
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from js_detector import JavaScriptDetector
+from benchmark_extraction import substring_js_required
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'js')
+FULL_PAGE_DIR = os.path.join(FIXTURE_DIR, 'full')
+
+
+def load_fixtures(directories=(FIXTURE_DIR, FULL_PAGE_DIR)):
+    fixtures = []
+    for directory in directories:
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.html'):
+                with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+                    fixtures.append((os.path.relpath(os.path.join(directory, name), FIXTURE_DIR),
+                                     name.startswith('js_'), f.read()))
+    assert fixtures, f"No fixtures in {directories}"
+    return fixtures
+
+
+def evaluate(classify, fixtures, rounds=20):
+    """(false positive rate, false negative rate, milliseconds per page, misclassified names)"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        predictions = [classify(html) for _, _, html in fixtures]
+    ms_per_page = (time.perf_counter() - start) * 1000 / (rounds * len(fixtures))
+    static = [needs_js for _, needs_js, _ in fixtures].count(False)
+    false_positives = [name for (name, needs_js, _), p in zip(fixtures, predictions) if p and not needs_js]
+    false_negatives = [name for (name, needs_js, _), p in zip(fixtures, predictions) if needs_js and not p]
+    return (len(false_positives) / max(static, 1), len(false_negatives) / max(len(fixtures) - static, 1),
+            ms_per_page, false_positives + false_negatives)
+
+
+def test_classifies_fixtures():
+    fixtures = load_fixtures()
+    for name, needs_js, html in fixtures:
+        features = JavaScriptDetector.features(html)
+        actual = JavaScriptDetector.is_javascript_required(html)
+        print(f"{name}: score {JavaScriptDetector.score(features)} {'OK' if actual == needs_js else 'WRONG'}")
+        assert actual == needs_js, f"{name}: expected javascript_required={needs_js}, features {features}"
+
+
+def test_full_pages():
+    # Complete pages: page furniture must not tip a shell into static or an article into a render
+    fixtures = load_fixtures((FULL_PAGE_DIR,))
+    assert any(needs_js for _, needs_js, _ in fixtures) and not all(needs_js for _, needs_js, _ in fixtures)
+    for name, needs_js, html in fixtures:
+        score = JavaScriptDetector.score(JavaScriptDetector.features(html))
+        print(f"{name}: score {score}")
+        # Clear of the threshold, not just on the right side of it
+        if needs_js:
+            assert score >= JavaScriptDetector.THRESHOLD + 2, f"{name}: score {score}"
+        else:
+            assert score <= JavaScriptDetector.THRESHOLD - 3, f"{name}: score {score}"
+
+
+def test_report():
+    fixtures = load_fixtures()
+    print(f"\n{len(fixtures)} pages: {sum(needs_js for _, needs_js, _ in fixtures)} need JavaScript")
+    print(f"{'check':<12} {'false pos':>10} {'false neg':>10} {'ms/page':>8}")
+    for label, classify in (('substring', substring_js_required),
+                            ('structural', JavaScriptDetector.is_javascript_required)):
+        false_positive_rate, false_negative_rate, ms_per_page, wrong = evaluate(classify, fixtures)
+        print(f"{label:<12} {false_positive_rate:>10.0%} {false_negative_rate:>10.0%} {ms_per_page:>8.2f}"
+              + (f"  wrong: {', '.join(wrong)}" if wrong else ''))
+        if label == 'structural':
+            assert not wrong
+
+
+if __name__ == "__main__":
+    test_classifies_fixtures()
+    test_full_pages()
+    test_report()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Check the text-layer garble score that decides whether a PDF can skip Claude
+
+Runs under pytest or directly: python test_pdf_markdown.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pdf_markdown import PDFMarkdownConverter
+
+CLEAN = [
+    "The quarterly report covers revenue, operating costs and the outlook for next year.",
+    # Single letters that belong to the text
+    "Let x be the width and y the height, so the area is x times y.",
+    "See option b in Appendix C, or choose a different plan if neither fits.",
+    "I think a 5 year term is fine. Vitamin D and vitamin K are listed in table 2.",
+    "Plan A costs less than plan B, and the U.S. figures follow in section 4.",
+]
+
+GARBLED = [
+    # Words split into stray letters
+    "The t e c h n o l o g y s e c t o r grew while r e v e n u e fell.",
+    # Doubled glyphs
+    "LLiisstteenn ttoo tthhee qquuaarrtteerrllyy rreeppoorrtt nnooww",
+    # Replacement characters and symbol soup
+    "The � report � covers �� revenue ##%& and @@#$ costs �",
+]
+
+
+def score(text):
+    return PDFMarkdownConverter.garble_score(text)
+
+
+def test_clean_text_passes():
+    for text in CLEAN:
+        assert score(text) <= PDFMarkdownConverter.MAX_GARBLE_SCORE, (text, score(text))
+    print(f"{len(CLEAN)} clean samples OK")
+
+
+def test_garbled_text_fails():
+    for text in GARBLED:
+        assert score(text) > PDFMarkdownConverter.MAX_GARBLE_SCORE, (text, score(text))
+    print(f"{len(GARBLED)} garbled samples OK")
+
+
+def test_letter_runs():
+    # Two stray letters are not enough; a run of MIN_LETTER_RUN counts every letter in it
+    assert score("between x y and the rest") == 0
+    assert score("a b c d e f") == 1
+    assert score("word a b c word") == 3 / 5
+    print("letter runs OK")
+
+
+if __name__ == "__main__":
+    test_clean_text_passes()
+    test_garbled_text_fails()
+    test_letter_runs()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Check that PDF extraction memory stays flat as the page count grows (tracemalloc)
+
+Runs under pytest or directly: python test_pdf_memory.py
+"""
+
+import sys
+import os
+import tracemalloc
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pdf_extractor import PDFExtractor
+from benchmark_extraction import make_sample_pdf
+
+SMALL_DOCUMENT = 4
+LARGE_DOCUMENT = 16
+LINES_PER_PAGE = 12
+
+
+def peak_extraction_memory(page_count, low_memory):
+    """Peak traced allocation while extracting, less the page texts and joined text it returns"""
+    pdf = make_sample_pdf(page_count, lines_per_page=LINES_PER_PAGE)
+    default_low_memory = PDFExtractor.LOW_MEMORY
+    PDFExtractor.LOW_MEMORY = low_memory
+    tracemalloc.start()
+    try:
+        text, page_offsets = PDFExtractor.extract_text_with_offsets(pdf, workers=1, backend='pdfplumber')
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        PDFExtractor.LOW_MEMORY = default_low_memory
+    assert len(page_offsets) == page_count
+    # The output legitimately grows with the document: the page list plus the joined copy
+    return peak - 2 * sys.getsizeof(text), text, page_offsets
+
+
+def test_peak_memory_flat():
+    for low_memory in (False, True):
+        small_peak, _, _ = peak_extraction_memory(SMALL_DOCUMENT, low_memory)
+        large_peak, text, page_offsets = peak_extraction_memory(LARGE_DOCUMENT, low_memory)
+        growth = large_peak / small_peak
+        print(f"low_memory={low_memory}: {SMALL_DOCUMENT} pages peak {small_peak / 1024:.0f} KiB, "
+              f"{LARGE_DOCUMENT} pages peak {large_peak / 1024:.0f} KiB ({growth:.2f}x)")
+        # Four times the pages must not mean noticeably more working memory
+        assert growth < 1.5, f"Peak extraction memory grew {growth:.2f}x with page count"
+
+        # Page offsets point at the start of each page in the joined text
+        assert page_offsets[0] == 0
+        for number, offset in enumerate(page_offsets, start=1):
+            assert text.startswith(f"Page {number} line 1:", offset)
+
+
+if __name__ == "__main__":
+    test_peak_memory_flat()
+    print("OK")
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""Check that the per-domain rate limiter paces a domain without one request's backoff holding up the others
+
+Runs under pytest or directly: python test_rate_limiter.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from url_enhancer import DomainRateLimiter
+
+
+def test_interval_paces_requests():
+    limiter = DomainRateLimiter(60)
+    assert limiter.reserve('example.com', 5.0) == 0
+    assert 4.9 < limiter.reserve('example.com', 5.0) <= 5.0
+    assert limiter.reserve('other.com', 5.0) == 0
+    print("pacing OK")
+
+
+def test_backoff_does_not_delay_other_callers():
+    limiter = DomainRateLimiter(60)
+    assert limiter.reserve('example.com', 0, backoff=8.0) == 8.0
+    second = limiter.reserve('example.com', 0)
+    print(f"retry waits 8.0s, next caller waits {second:.1f}s")
+    assert second == 0
+
+    limiter = DomainRateLimiter(60)
+    assert limiter.reserve('example.com', 1.0, backoff=8.0) == 8.0
+    assert limiter.reserve('example.com', 1.0) <= 1.0
+
+
+if __name__ == "__main__":
+    test_interval_paces_requests()
+    test_backoff_does_not_delay_other_callers()
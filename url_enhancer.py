@@ -2,12 +2,405 @@
 URL Enhancement Module for De-PDF
 Implements Level 2 enhancements based on crawler techniques
 """
+import os
+import re
+import codecs
 import random
 import time
+import threading
+import logging
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
 from urllib.parse import urlparse
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, Optional, Tuple, Union
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING as URLLIB3_ACCEPT_ENCODING
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+
+from html_extractor import HTMLExtractor, XML_DECLARATION_RE, META_CHARSET_RE, charset_normalizer
+from js_detector import JavaScriptDetector
+from domain_rules import DOMAIN_RULES
+
+logger = logging.getLogger(__name__)
+
+# Connection pooling for Level 2 fetches (see SessionPool)
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 10))  # Kept-alive connections per host
+HTTP_SESSION_IDLE_TIMEOUT = float(os.environ.get('HTTP_SESSION_IDLE_TIMEOUT', 300))  # Seconds
+HTTP_SESSION_MAX_HOSTS = int(os.environ.get('HTTP_SESSION_MAX_HOSTS', 64))
+
+# Content codings to advertise, decided at import time from what urllib3 can decode here:
+# br needs the brotli (or brotlicffi) module, zstd needs urllib3 2 with zstandard installed
+DECODABLE_ENCODINGS = [coding for coding in ('zstd', 'br') if coding in URLLIB3_ACCEPT_ENCODING.split(',')]
+ACCEPT_ENCODING = ', '.join(DECODABLE_ENCODINGS + ['gzip', 'deflate'])
+
+# Largest page body (after decompression) a Level 2 fetch will download
+URL_MAX_BODY_BYTES = int(os.environ.get('URL_MAX_BODY_MB', 20)) * 1024 * 1024
+
+# Bodies are read in chunks; the first SNIFF_BYTES decide whether the payload is a document at all
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+SNIFF_BYTES = 1024
+
+# Content types that are converted; servers that send nothing useful get their first KB sniffed instead
+DOCUMENT_CONTENT_TYPES = ('text/html', 'application/xhtml+xml', 'text/xml', 'application/xml', 'text/plain')
+UNLABELLED_CONTENT_TYPES = ('', 'application/octet-stream', 'binary/octet-stream')
+# Leading bytes of common non-document formats (PDF, archives, images, audio/video, gzip)
+BINARY_SIGNATURES = (b'%PDF-', b'PK\x03\x04', b'\x89PNG', b'GIF8', b'\xff\xd8\xff', b'ID3', b'OggS', b'RIFF',
+                     b'\x1a\x45\xdf\xa3', b'\x1f\x8b', b'7z\xbc\xaf')
+CHARSET_RE = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.I)
+
+# Undeclared pages: <meta charset> / XML declarations are looked for in the first CHARSET_HEAD_BYTES,
+# and statistical detection sees at most CHARSET_SAMPLE_BYTES, however large the page
+CHARSET_HEAD_BYTES = 4096
+CHARSET_SAMPLE_BYTES = 64 * 1024
+
+
+class FetchCancelled(Exception):
+    """A fetch was stopped because another fetch level already produced the page"""
+
+
+def sniff_document(content_type: str, head: bytes) -> Optional[str]:
+    """Why the payload is not a page we can convert, judged from its Content-Type and first KB; None if it is"""
+    content_type = content_type.split(';')[0].strip().lower()
+    if content_type not in DOCUMENT_CONTENT_TYPES and content_type not in UNLABELLED_CONTENT_TYPES:
+        return f"it is {content_type}, not a web page"
+    markup, bom_encoding = HTMLExtractor.strip_byte_order_mark(head)
+    if markup.startswith(BINARY_SIGNATURES) or head[4:8] == b'ftyp':  # ftyp: MP4/MOV/HEIF
+        return "it is a binary file, not a web page"
+    if b'\x00' in markup and not (bom_encoding or '').startswith('utf-16'):
+        return "it is binary data, not a web page"
+    return None
+
+
+class BodyReader:
+    """
+    Incremental checks on a response body as it streams in, shared by the requests and asyncio fetchers.
+    Refuses bodies over `max_bytes` and (when `check_document`) payloads that are not documents,
+    as soon as the headers or the first KB give them away.
+    """
+
+    def __init__(self, url: str, headers, max_bytes: int, check_document: bool = True):
+        self.url = url
+        self.max_bytes = max_bytes
+        self.content_type = headers.get('Content-Type', '')
+        self.chunks = []
+        self.size = 0
+        self.sniffed = not check_document
+        media_type = self.content_type.split(';')[0].strip().lower()
+        if check_document and media_type not in DOCUMENT_CONTENT_TYPES + UNLABELLED_CONTENT_TYPES:
+            raise Exception(f"Not converting {url}: it is {media_type}, not a web page.")
+        declared_length = headers.get('Content-Length', '')
+        if declared_length.isdigit() and int(declared_length) > max_bytes:
+            raise Exception(f"Page is too large to convert ({int(declared_length) // (1024 * 1024)} MB, "
+                            f"limit {max_bytes // (1024 * 1024)} MB).")
+
+    def _sniff(self, head: bytes):
+        self.sniffed = True
+        reason = sniff_document(self.content_type, head)
+        if reason:
+            raise Exception(f"Not converting {self.url}: {reason}.")
+
+    def feed(self, chunk: bytes):
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise Exception(f"Page is too large to convert (over {self.max_bytes // (1024 * 1024)} MB).")
+        if not self.sniffed and self.size >= SNIFF_BYTES:
+            self._sniff(b''.join(self.chunks)[:SNIFF_BYTES])
+
+    def finish(self) -> bytes:
+        body = b''.join(self.chunks)
+        if not self.sniffed and body:
+            self._sniff(body)
+        return body
+
+
+def read_body(response: requests.Response, max_bytes: int, check_document: bool = True,
+              cancel: Optional[threading.Event] = None) -> bytes:
+    """
+    Read a streamed requests response through a BodyReader.
+    The connection is closed instead of drained when the download is abandoned or cancelled.
+    """
+    try:
+        reader = BodyReader(response.url, response.headers, max_bytes, check_document)
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+            if cancel is not None and cancel.is_set():
+                raise FetchCancelled(f"Fetch of {response.url} cancelled")
+            reader.feed(chunk)
+        body = reader.finish()
+    except Exception:
+        response.close()
+        raise
+    # Hand the body back to the response so .content works as with a non-streamed request
+    response._content = body
+    return body
+
+
+def _known_encoding(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+
+def resolve_encoding(body: bytes, headers) -> Tuple[Optional[str], str]:
+    """
+    (encoding, where it came from) using only cheap checks: a byte-order mark, the Content-Type
+    charset, then an XML declaration or <meta charset> in the first CHARSET_HEAD_BYTES.
+    (None, 'undeclared') when the page says nothing; decode_body then tries UTF-8 and a sample.
+    """
+    markup, bom_encoding = HTMLExtractor.strip_byte_order_mark(body)
+    # A byte-order mark is what the bytes actually are, so it outranks a mislabelled header
+    if bom_encoding:
+        return bom_encoding, 'bom'
+    match = CHARSET_RE.search(headers.get('Content-Type', ''))
+    encoding = _known_encoding(match.group(1) if match else None)
+    if encoding:
+        return encoding, 'header'
+    head = markup[:CHARSET_HEAD_BYTES]
+    declared = XML_DECLARATION_RE.search(head) or META_CHARSET_RE.search(head)
+    encoding = _known_encoding(declared.group(1).decode('ascii', 'replace') if declared else None)
+    if encoding:
+        return encoding, 'meta'
+    return None, 'undeclared'
+
+
+def sample_encoding(markup: bytes) -> Optional[str]:
+    """Statistical guess from the first CHARSET_SAMPLE_BYTES (cut at a line end), never the whole body"""
+    if charset_normalizer is None:
+        return None
+    sample = markup[:CHARSET_SAMPLE_BYTES]
+    if len(markup) > CHARSET_SAMPLE_BYTES and b'\n' in sample:
+        sample = sample[:sample.rindex(b'\n')]
+    return _known_encoding(charset_normalizer.detect(sample)['encoding'])
+
+
+def decode_body(body: bytes, headers) -> str:
+    """
+    Decode a page exactly once with the encoding resolve_encoding finds. Undeclared pages are
+    tried as UTF-8 first (a failed strict decode stops at the first bad byte), then with the
+    encoding guessed from a sample, then Windows-1252.
+    """
+    markup, _ = HTMLExtractor.strip_byte_order_mark(body)
+    encoding, _ = resolve_encoding(body, headers)
+
+    def candidates():
+        if encoding:
+            yield encoding
+        yield 'utf-8'
+        yield sample_encoding(markup)
+        yield 'cp1252'
+
+    tried = set()
+    for candidate in candidates():
+        if candidate and candidate not in tried:
+            tried.add(candidate)
+            try:
+                return markup.decode(candidate)
+            except (UnicodeDecodeError, LookupError):
+                continue
+    return markup.decode('utf-8', 'replace')
+
+
+class ParsedDocument:
+    """
+    A fetched page decoded once and parsed once, shared by every stage of a URL conversion:
+    the JavaScript check, the title/author metadata and the main-content extraction.
+    Extraction removes non-content elements from the tree, so it is the last stage to use it.
+    """
+
+    def __init__(self, html: str, url: str = ''):
+        self.html = html
+        self.url = url
+        self._soup = None
+        self._metadata = None
+
+    @classmethod
+    def from_response(cls, body: bytes, headers, url: str = '') -> 'ParsedDocument':
+        return cls(decode_body(body, headers), url)
+
+    @property
+    def soup(self) -> BeautifulSoup:
+        if self._soup is None:
+            self._soup = BeautifulSoup(self.html, 'lxml')
+        return self._soup
+
+    @property
+    def rule(self):
+        """The DomainRule for the page's host"""
+        return DOMAIN_RULES.rule_for(self.url)
+
+    @property
+    def metadata(self) -> Tuple[Optional[str], Optional[str]]:
+        """(title, author) from where the page's domain rule says they are"""
+        if self._metadata is None:
+            self._metadata = self.rule.metadata(self.soup)
+        return self._metadata
+
+# Longest a fetch may be queued behind its domain's rate limit (or a 429 Retry-After) before giving up
+RATE_LIMIT_MAX_WAIT = float(os.environ.get('RATE_LIMIT_MAX_WAIT', 60))  # Seconds
+
+
+class SessionPool:
+    """
+    Thread-safe pool of long-lived requests.Session objects, one per scheme+host.
+    Reusing a session keeps its TCP/TLS connections alive between retries and conversions,
+    so repeat fetches from the same site skip DNS, connect and handshake.
+    Sessions idle for longer than `idle_timeout` are closed, as are the least recently used
+    ones once more than `max_hosts` are open.
+    """
+
+    def __init__(self, idle_timeout: float, max_hosts: int, pool_maxsize: int):
+        self.idle_timeout = idle_timeout
+        self.max_hosts = max_hosts
+        self.pool_maxsize = pool_maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # scheme://host -> (session, last used), least recently used first
+
+    @staticmethod
+    def key_for(url: str) -> str:
+        parsed = urlparse(url)
+        return f"{parsed.scheme.lower()}://{parsed.netloc.lower()}"
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        # Retries are handled by fetch_with_retry; one small connection pool per host is enough,
+        # since each session only talks to one origin (plus any redirect targets)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        # Cookies still flow through a single request's redirect chain, but are not kept
+        # between conversions (sites would otherwise see one reader fetching every article)
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        return session
+
+    def get(self, url: str) -> requests.Session:
+        """Return the pooled session for the URL's scheme and host, creating it if needed"""
+        key = self.key_for(url)
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._sessions.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                session = self._new_session()
+            else:
+                self.hits += 1
+                session = entry[0]
+            self._sessions[key] = (session, now)
+            return session
+
+    def _evict(self, now: float):
+        for key, (session, last_used) in list(self._sessions.items()):
+            if now - last_used > self.idle_timeout or len(self._sessions) >= self.max_hosts:
+                del self._sessions[key]
+                session.close()
+            else:
+                break  # Ordered by last use, so everything after this is newer
+
+    def close_all(self):
+        with self._lock:
+            for session, _ in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'hosts': len(self._sessions), 'hits': self.hits, 'misses': self.misses}
+
+
+SESSION_POOL = SessionPool(HTTP_SESSION_IDLE_TIMEOUT, HTTP_SESSION_MAX_HOSTS, HTTP_POOL_MAXSIZE)
+
+
+class DomainRateLimiter:
+    """
+    Per-domain token buckets shared by every conversion in the process.
+    Each bucket is kept as the time its next token becomes free: a fetch reserves the next slot
+    for its domain under the lock and only its own thread waits for that slot, so a strict site
+    (archive.ph allows one request every 5s) no longer holds up conversions of other sites.
+    A 429 blocks the domain until its Retry-After has passed, for every conversion at once.
+    """
+
+    # Domains beyond this count are dropped once their bucket is full again
+    MAX_DOMAINS = 1024
+
+    def __init__(self, max_wait: float):
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._domains = {}  # domain -> {'next_free', 'requests', 'queued_seconds', 'max_queued_seconds'}
+
+    def _entry(self, domain: str, now: float) -> Dict:
+        entry = self._domains.get(domain)
+        if entry is None:
+            if len(self._domains) >= self.MAX_DOMAINS:
+                for key in [key for key, value in self._domains.items() if value['next_free'] <= now]:
+                    del self._domains[key]
+            entry = self._domains[domain] = {
+                'next_free': now, 'requests': 0, 'queued_seconds': 0.0, 'max_queued_seconds': 0.0
+            }
+        return entry
+
+    def reserve(self, domain: str, interval: float, burst: int = 1, backoff: float = 0.0) -> float:
+        """
+        Take the domain's next token and return how many seconds to wait before using it.
+        `interval` is the seconds per token (0 = unlimited), `burst` how many tokens the bucket holds
+        and `backoff` a minimum wait for this request only (retry backoff).
+        Raises when the wait would exceed max_wait; the token is then left for other requests.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entry(domain, now)
+            start = max(now, entry['next_free'] - (burst - 1) * interval)
+            # The backoff delays this request only; the domain's next slot is not pushed back by it
+            wait = max(start - now, backoff)
+            if wait > self.max_wait:
+                raise Exception(f"Rate limited: {domain} is queued for {wait:.1f}s. Try again later.")
+            entry['next_free'] = max(entry['next_free'], start) + interval
+            entry['requests'] += 1
+            entry['queued_seconds'] += wait
+            entry['max_queued_seconds'] = max(entry['max_queued_seconds'], wait)
+            return wait
+
+    def wait_turn(self, domain: str, interval: float, burst: int = 1, backoff: float = 0.0) -> float:
+        """Reserve a token and block only the calling thread until it is due; returns the time queued"""
+        wait = self.reserve(domain, interval, burst, backoff)
+        if wait > 0:
+            print(f"Queued {wait:.1f}s for {domain} (rate limit)...", flush=True)
+            self._closed.wait(wait)
+        return wait
+
+    def block(self, domain: str, seconds: float):
+        """Hold back every fetch from the domain for `seconds` (e.g. a 429 Retry-After)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entry(domain, now)
+            entry['next_free'] = max(entry['next_free'], now + seconds)
+
+    def close(self):
+        """Release any threads still waiting (server shutdown)"""
+        self._closed.set()
+
+    def stats(self) -> Dict:
+        """Time spent queued per domain"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                domain: {
+                    'requests': entry['requests'],
+                    'queued_seconds': round(entry['queued_seconds'], 3),
+                    'max_queued_seconds': round(entry['max_queued_seconds'], 3),
+                    'blocked_for_seconds': round(max(0.0, entry['next_free'] - now), 3),
+                }
+                for domain, entry in self._domains.items()
+            }
+
+
+RATE_LIMITER = DomainRateLimiter(RATE_LIMIT_MAX_WAIT)
 
 
 class URLEnhancer:
@@ -34,7 +427,7 @@ class URLEnhancer:
         },
         'bloomberg.com': {
             'user_agent': 'chrome_mac',
-            'delay': 2.0  # Seconds to wait after request
+            'delay': 2.0  # Minimum seconds between requests (shared by all conversions)
         },
         'nytimes.com': {
             'user_agent': 'chrome_windows',
@@ -45,7 +438,7 @@ class URLEnhancer:
             'delay': 5.0,  # Archive.ph is very strict
             'extra_headers': {
                 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Encoding': 'gzip, deflate',
+                'Accept-Encoding': ACCEPT_ENCODING,
                 'Connection': 'keep-alive',
             }
         },
@@ -54,17 +447,29 @@ class URLEnhancer:
             'delay': 5.0,
             'extra_headers': {
                 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Encoding': 'gzip, deflate',
+                'Accept-Encoding': ACCEPT_ENCODING,
                 'Connection': 'keep-alive',
             }
         }
     }
     
+    # Bump when a change alters what extract_text_enhanced returns or which pages
+    # is_javascript_required sends to Puppeteer (invalidates the HTTP cache); edits to a
+    # domain's rule in domain_rules.json invalidate that domain's entries by themselves
+    EXTRACTOR_VERSION = 3
+    
+    # Pages shorter than this are assumed to need JavaScript rendering
+    MIN_CONTENT_CHARS = 1000
+    
+    # Content scoring (find_content_by_density): blocks that count as paragraphs, and their minimum length
+    PARAGRAPH_TAGS = ('p', 'pre', 'td', 'blockquote')
+    MIN_PARAGRAPH_CHARS = 25
+    
     # Default headers to appear more browser-like
     DEFAULT_HEADERS = {
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
         'Accept-Language': 'en-US,en;q=0.9',
-        'Accept-Encoding': 'gzip, deflate',  # Removed 'br' as brotli module is not installed
+        'Accept-Encoding': ACCEPT_ENCODING,  # Includes br/zstd only when they can be decoded
         'DNT': '1',
         'Upgrade-Insecure-Requests': '1',
         'Sec-Fetch-Dest': 'document',
@@ -105,50 +510,88 @@ class URLEnhancer:
         
         return headers, config.get('delay', 0)
     
+    @staticmethod
+    def retry_after(headers) -> int:
+        """Seconds a 429 response asks us to wait"""
+        try:
+            return int(headers.get('Retry-After', 60))  # Default 60s if not specified
+        except ValueError:
+            return 60
+    
+    @staticmethod
+    def backoff(attempt: int) -> float:
+        """Wait before retrying after a timeout or failed request (attempt counts from 0)"""
+        return (2 ** (attempt + 1)) * 2 + random.uniform(0, 2)
+    
+    @staticmethod
+    def check_bot_detection(status_code: int, headers, body: bytes):
+        """Raise for responses that are a bot wall rather than the page"""
+        if status_code == 403:
+            if b'cloudflare' in body.lower() or 'cf-ray' in headers:
+                raise Exception("Cloudflare protection detected. Level 3 integration required.")
+            elif b'captcha' in body.lower():
+                raise Exception("CAPTCHA detected. Level 3 integration required.")
+    
     @classmethod
-    def fetch_with_retry(cls, url: str, max_retries: int = 3, timeout: int = 30) -> requests.Response:
-        """Fetch URL with retry logic and exponential backoff"""
+    def fetch_with_retry(cls, url: str, max_retries: int = 3, timeout: int = 30,
+                         extra_headers: Optional[Dict[str, str]] = None,
+                         cancel: Optional[threading.Event] = None,
+                         on_sent: Optional[Callable[[], None]] = None) -> requests.Response:
+        """
+        Fetch URL with retry logic and exponential backoff; setting `cancel` stops it with FetchCancelled.
+        `on_sent` is called each time a request leaves the domain's rate-limit queue.
+        """
         headers, delay = cls.get_enhanced_headers(url)
-        
-        # Pre-delay for strict sites
-        if delay > 0:
-            print(f"Waiting {delay}s before request (domain-specific delay)...", flush=True)
-            time.sleep(delay)
+        if extra_headers:
+            headers.update(extra_headers)
+        domain = urlparse(url).netloc.lower()
+        backoff = 0.0
         
         for attempt in range(max_retries):
             try:
-                # Add session for cookie handling
-                session = requests.Session()
+                # Domain-specific delays, Retry-After waits and backoffs are scheduled by the shared
+                # limiter; only this request's thread waits for its slot
+                RATE_LIMITER.wait_turn(domain, delay, backoff=backoff)
+                if cancel is not None and cancel.is_set():
+                    raise FetchCancelled(f"Fetch of {url} cancelled")
+                if on_sent is not None:
+                    on_sent()
+                
+                # Pooled per-host session: retries and repeat conversions reuse open connections
+                session = SESSION_POOL.get(url)
                 print(f"Making request to {url} (attempt {attempt + 1}/{max_retries})...", flush=True)
-                response = session.get(url, headers=headers, timeout=timeout, allow_redirects=True)
-                print(f"Response received: Status {response.status_code}, Length {len(response.content)}", flush=True)
+                # Streamed, so oversized or non-document payloads are dropped before they are downloaded
+                response = session.get(url, headers=headers, timeout=timeout, allow_redirects=True, stream=True)
+                print(f"Response received: Status {response.status_code}", flush=True)
+                
+                if response.status_code == 304:
+                    response.close()
+                    return response
                 
                 # Check for rate limiting
                 if response.status_code == 429:
-                    retry_after = response.headers.get('Retry-After', 60)  # Default 60s if not specified
-                    try:
-                        retry_after = int(retry_after)
-                    except:
-                        retry_after = 60
+                    retry_after = cls.retry_after(response.headers)
+                    response.close()
                     
-                    # For archive.ph, we should use Puppeteer instead of waiting
-                    domain = urlparse(url).netloc.lower()
-                    if 'archive.ph' in domain or 'archive.is' in domain:
-                        raise Exception("Rate limited by archive.ph. Level 3 integration required.")
+                    # Some sites (archive.ph) are better rendered with Puppeteer than waited out
+                    if DOMAIN_RULES.rule_for(url).render_on_rate_limit:
+                        raise Exception(f"Rate limited by {domain}. Level 3 integration required.")
                     
                     if attempt < max_retries - 1:
-                        print(f"Rate limited (429). Waiting {retry_after}s as requested by server...", flush=True)
-                        time.sleep(retry_after)
+                        # Other conversions of this domain wait out the Retry-After too
+                        print(f"Rate limited (429). Retrying in {retry_after}s as requested by server...", flush=True)
+                        RATE_LIMITER.block(domain, retry_after)
+                        backoff = 0.0
                         continue
                     else:
                         raise Exception(f"Rate limited by server. Try again in {retry_after} seconds.")
                 
+                # Only successful responses have to be documents; error pages are read for the checks below
+                body = read_body(response, URL_MAX_BODY_BYTES, check_document=response.ok, cancel=cancel)
+                print(f"Downloaded {len(body)} bytes", flush=True)
+                
                 # Check for common bot detection responses
-                if response.status_code == 403:
-                    if 'cloudflare' in response.text.lower() or 'cf-ray' in response.headers:
-                        raise Exception("Cloudflare protection detected. Level 3 integration required.")
-                    elif 'captcha' in response.text.lower():
-                        raise Exception("CAPTCHA detected. Level 3 integration required.")
+                cls.check_bot_detection(response.status_code, response.headers, body)
                 
                 response.raise_for_status()
                 
@@ -156,9 +599,8 @@ class URLEnhancer:
                 
             except requests.exceptions.Timeout:
                 if attempt < max_retries - 1:
-                    wait_time = (2 ** (attempt + 1)) * 2 + random.uniform(0, 2)  # Longer backoff
-                    print(f"Timeout on attempt {attempt + 1}, retrying in {wait_time:.1f}s...")
-                    time.sleep(wait_time)
+                    backoff = cls.backoff(attempt)  # Longer backoff
+                    print(f"Timeout on attempt {attempt + 1}, retrying in {backoff:.1f}s...")
                 else:
                     raise
             
@@ -168,62 +610,163 @@ class URLEnhancer:
                     raise
                     
                 if attempt < max_retries - 1:
-                    wait_time = (2 ** (attempt + 1)) * 2 + random.uniform(0, 2)
-                    print(f"Request failed on attempt {attempt + 1}: {str(e)}, retrying in {wait_time:.1f}s...")
-                    time.sleep(wait_time)
+                    backoff = cls.backoff(attempt)
+                    print(f"Request failed on attempt {attempt + 1}: {str(e)}, retrying in {backoff:.1f}s...")
                 else:
                     raise
     
     @classmethod
-    def extract_text_enhanced(cls, html_content: str, url: str) -> Tuple[str, Optional[str], Optional[str]]:
-        """Enhanced text extraction with metadata"""
-        soup = BeautifulSoup(html_content, 'lxml')
-        
-        # Remove script, style, and other non-content elements
-        for element in soup(['script', 'style', 'noscript', 'header', 'footer', 'nav', 'aside', 'form']):
-            element.decompose()
-        
-        # Try to extract title
-        title = None
-        title_tag = soup.find('title')
-        if title_tag:
-            title = title_tag.get_text(strip=True)
-        
-        # Try to extract author
-        author = None
-        author_meta = soup.find('meta', attrs={'name': 'author'}) or soup.find('meta', attrs={'property': 'article:author'})
-        if author_meta:
-            author = author_meta.get('content')
-        
-        # Try to find main content using various selectors
-        content_selectors = [
-            'article',
-            'main',
-            '[role="main"]',
-            '.article-content',
-            '.post-content',
-            '.entry-content',
-            '.content',
-            '#content',
-            '.story-body',
-            '.article-body'
-        ]
-        
-        main_content = None
-        for selector in content_selectors:
-            main_content = soup.select_one(selector)
-            if main_content:
-                break
+    def fetch_and_extract(cls, url: str, cache=None, cancel: Optional[threading.Event] = None,
+                          on_sent: Optional[Callable[[], None]] = None) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """
+        Level 2 fetch and extraction: (text, title, author), or None when the page needs JavaScript.
+        With an HTTPCache, a fresh entry is returned without any request and a stale one is
+        revalidated; a 304 reuses the stored result without downloading or extracting again.
+        """
+        entry = cls.cached_entry(url, cache)
+        if entry is not None and cache.is_fresh(entry):
+            return cls.cached_result(entry)
+        response = cls.fetch_with_retry(url, extra_headers=cache.validators(entry) if cache is not None else None,
+                                        cancel=cancel, on_sent=on_sent)
+        return cls.extract_response(url, response.status_code, response.headers, response.content, entry, cache)
+    
+    @classmethod
+    def cache_version(cls, url: str) -> str:
+        """HTTP cache version of a URL's extraction: the extractor's, plus a hash of the domain rule it uses"""
+        return f"url-{cls.EXTRACTOR_VERSION}-{DOMAIN_RULES.rule_for(url).version}"
+    
+    @classmethod
+    def cached_entry(cls, url: str, cache) -> Optional[Dict]:
+        """The HTTP cache entry for the URL (counting and logging a fresh hit), or None"""
+        if cache is None:
+            return None
+        entry = cache.lookup(url, cls.cache_version(url))
+        if entry is not None and cache.is_fresh(entry):
+            cache.count_fresh_hit()
+            print(f"HTTP cache hit for {url} (fresh, no request made)", flush=True)
+        return entry
+    
+    @classmethod
+    def extract_response(cls, url: str, status_code: int, headers, body: bytes, entry: Optional[Dict],
+                         cache) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """Turn a fetched response (or a 304 for a cached entry) into (text, title, author) or None"""
+        version = cls.cache_version(url)
+        if status_code == 304 and entry is not None:
+            print(f"HTTP cache revalidated {url} (304 Not Modified)", flush=True)
+            cache.refresh(url, version, entry, headers)
+            return cls.cached_result(entry)
+        # Decoded and parsed once; the JavaScript check and the extraction share the tree
+        document = ParsedDocument.from_response(body, headers, url)
+        print(f"Level 2 fetch completed. Status: {status_code}, Content length: {len(document.html)}", flush=True)
+        
+        # Check if JavaScript is required or if we got minimal content
+        if len(document.html) < cls.MIN_CONTENT_CHARS or cls.is_javascript_required(document):
+            result = {'javascript_required': True}
+        else:
+            print(f"Extracting text from HTML content...", flush=True)
+            text, title, author = cls.extract_text_enhanced(document, url)
+            print(f"Extracted {len(text)} characters of text", flush=True)
+            result = {'text': text, 'title': title, 'author': author}
+        
+        if cache is not None and status_code == 200:
+            cache.store(url, version, headers, result)
+        return cls.cached_result({'result': result})
+    
+    @staticmethod
+    def cached_result(entry: Dict) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        result = entry['result']
+        if result.get('javascript_required'):
+            return None
+        return result['text'], result['title'], result['author']
+    
+    @classmethod
+    def find_content_by_density(cls, soup) -> Optional[Tag]:
+        """
+        Readability-style choice of the main content block, scored bottom-up in one pass over the tree.
+        Every paragraph (a <p>/<pre>/<td>/<blockquote>, or the loose text of a div/section) of at least
+        MIN_PARAGRAPH_CHARS scores 1 + its commas + 1 per 100 characters (up to 3). The score goes to
+        its container, and half of it to the container's parent. Each div/section's total is scaled by
+        (1 - link density), so navigation and link lists lose. Text and link lengths are summed from
+        the children, so no node's text is walked more than once.
+        Falls back to the div/section with the most text when the page has no paragraphs.
+        """
+        lengths = {}  # id(tag) -> (text length, link text length, commas) of a finished child
+        scores = {}  # id(tag) -> paragraph score credited so far
+        best, best_score = None, 0.0
+        longest, longest_length = None, 0
+        
+        def credit(tag, score):
+            if tag is not None:
+                scores[id(tag)] = scores.get(id(tag), 0.0) + score
+        
+        # Children are finished before their parent (post-order), so each node only sums its children
+        stack = [(soup, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if not children_done:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.contents if isinstance(child, Tag))
+                continue
+            
+            text_length = link_length = commas = own_length = own_commas = 0
+            for child in node.contents:
+                if type(child) in (NavigableString, CData):  # The strings get_text() returns
+                    stripped = child.strip()
+                    own_length += len(stripped)
+                    own_commas += stripped.count(',')
+                elif isinstance(child, Tag):
+                    child_text, child_links, child_commas = lengths.pop(id(child))
+                    text_length += child_text
+                    link_length += child_links
+                    commas += child_commas
+            text_length += own_length
+            commas += own_commas
+            if node.name == 'a':
+                link_length = text_length
+            lengths[id(node)] = (text_length, link_length, commas)
+            
+            if node.name in cls.PARAGRAPH_TAGS and text_length >= cls.MIN_PARAGRAPH_CHARS:
+                score = 1 + commas + min(text_length // 100, 3)
+                credit(node.parent, score)
+                credit(node.parent.parent if node.parent is not None else None, score / 2)
+            elif node.name in ('div', 'section') and own_length >= cls.MIN_PARAGRAPH_CHARS:
+                score = 1 + own_commas + min(own_length // 100, 3)
+                credit(node, score)
+                credit(node.parent, score / 2)
+            
+            score = scores.pop(id(node), 0.0)
+            if node.name in ('div', 'section'):
+                if text_length > longest_length:
+                    longest, longest_length = node, text_length
+                if text_length:
+                    score *= 1 - link_length / text_length
+                if score > best_score:
+                    best, best_score = node, score
+        return best if best is not None else longest
+    
+    @classmethod
+    def extract_text_enhanced(cls, html_content: Union[str, bytes, ParsedDocument],
+                              url: str) -> Tuple[str, Optional[str], Optional[str]]:
+        """Enhanced text extraction with metadata (consumes a ParsedDocument's tree)"""
+        if isinstance(html_content, ParsedDocument):
+            document = html_content
+        elif isinstance(html_content, bytes):
+            document = ParsedDocument.from_response(html_content, {}, url)
+        else:
+            document = ParsedDocument(html_content, url)
+        title, author = document.metadata
+        soup = document.soup
+        rule = document.rule
+        
+        # Remove script, style, and other non-content elements (plus the site's own boilerplate)
+        rule.strip_boilerplate(soup)
+        
+        # Main content: the site's selectors, then the generic ones, all compiled at startup
+        main_content = rule.find_content(soup)
         
         # If no main content found, try to identify by text density
         if not main_content:
-            # Find the element with the most text
-            max_text_length = 0
-            for element in soup.find_all(['div', 'section']):
-                text_length = len(element.get_text(strip=True))
-                if text_length > max_text_length:
-                    max_text_length = text_length
-                    main_content = element
+            main_content = cls.find_content_by_density(soup)
         
         # Extract text from main content or full body
         if main_content:
@@ -238,18 +781,8 @@ class URLEnhancer:
         return text, title, author
     
     @classmethod
-    def is_javascript_required(cls, html_content: str) -> bool:
-        """Detect if page requires JavaScript"""
-        indicators = [
-            'please enable javascript',
-            'javascript is required',
-            'this site requires javascript',
-            'noscript',
-            '__NEXT_DATA__',  # Next.js
-            '__NUXT__',       # Nuxt.js
-            'window.React',   # React apps
-            'ng-app',         # Angular
-        ]
-        
-        lower_content = html_content.lower()
-        return any(indicator in lower_content for indicator in indicators)
\ No newline at end of file
+    def is_javascript_required(cls, html_content: Union[str, ParsedDocument]) -> bool:
+        """Detect if page requires JavaScript (an empty framework shell or an "enable JavaScript" wall)"""
+        if isinstance(html_content, ParsedDocument):
+            html_content = html_content.soup
+        return JavaScriptDetector.is_javascript_required(html_content)
\ No newline at end of file